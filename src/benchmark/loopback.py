@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+'''
+Loopback throughput and latency benchmark.
+
+Starts a real Server (in a process of its own, so that it doesn't share the
+interpreter lock with the clients) on loopback, and reads files from it with
+concurrent clients over a matrix of file sizes, blksize values and
+concurrency levels. For each combination it reports the throughput (MB/s and
+requests/s), the time to the first data block and the p50/p99 transfer time.
+The results can be saved as JSON and compared with an earlier run:
+
+    python benchmark/loopback.py --json new.json --compare old.json
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from tftpud.stats import percentile
+from tftpud.server import server
+from tftpud.client import client
+from tftpud.client import readoperation
+
+def runServer(port, windowSize, ready, stop):
+    '''The server process.'''
+    config = server.ServerConfig('127.0.0.1', listeningPort=port)
+    config.maxWindowSize = max(1, windowSize)
+    uut = server.Server(config)
+    ready.set()
+    stop.wait()
+    uut.stopServer()
+
+class TransferResult:
+
+    def __init__(self):
+        self.ok = False
+        self.bytes = 0
+        self.duration = None # seconds from the request to the last block
+        self.firstBlock = None # seconds from the request to the first block
+        self.error = None
+
+def readFile(port, fileName, blockSize, windowSize = 0, timeout = 5.0, retries = 3):
+    '''Read a file from the server with the client's read operation,
+    negotiating blksize (and windowsize if given). The data is counted, not
+    kept. Returns a TransferResult.'''
+    result = TransferResult()
+    config = client.ClientConfig(('127.0.0.1', port))
+    config.blkSize = blockSize
+    config.windowSize = max(1, windowSize)
+    config.timeout = timeout
+    config.retries = retries
+    config.adaptiveTimeout = False
+    config.bufferSize = 0 # each block to received() as it arrives
+    def received(data):
+        if result.firstBlock is None:
+            result.firstBlock = time.time() - started
+        result.bytes += len(data)
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        op = readoperation.ReadOperation(s, config, fileName, received)
+        started = time.time()
+        op.run()
+    finally:
+        s.close()
+    if op.error is None:
+        result.duration = time.time() - started
+        result.ok = True
+    else:
+        result.error = str(op.error)
+    return result
+
+def runCell(port, fileName, fileSize, blockSize, concurrency, rounds, windowSize):
+    '''Run one combination of the matrix: concurrency clients each reading
+    the file rounds times. Returns a dict of results.'''
+    results = []
+    mutex = threading.Lock()
+    def client():
+        for i in range(0, rounds):
+            result = readFile(port, fileName, blockSize, windowSize)
+            with mutex:
+                results.append(result)
+    threads = [threading.Thread(target=client) for i in range(0, concurrency)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    ok = [r for r in results if r.ok]
+    durations = [r.duration for r in ok]
+    firstBlocks = [r.firstBlock for r in ok]
+    totalBytes = sum(r.bytes for r in ok)
+    return {'fileSize' : fileSize,
+            'blksize' : blockSize,
+            'windowsize' : windowSize,
+            'concurrency' : concurrency,
+            'transfers' : len(results),
+            'failures' : len(results) - len(ok),
+            'seconds' : elapsed,
+            'mbPerSec' : totalBytes / elapsed / 1e6,
+            'requestsPerSec' : len(ok) / elapsed,
+            'firstBlockP50' : percentile(firstBlocks, 0.5),
+            'firstBlockP99' : percentile(firstBlocks, 0.99),
+            'transferP50' : percentile(durations, 0.5),
+            'transferP99' : percentile(durations, 0.99),
+            'errors' : sorted(set(r.error for r in results if not r.ok))}
+
+def milliseconds(value):
+    if value is None:
+        return '-'
+    return '%.2f' % (value * 1000)
+
+def formatRow(cell):
+    return '%10d %7d %5d %6d %9.2f %9.1f %9s %9s %9s %9s %5d' % (
+        cell['fileSize'], cell['blksize'], cell['windowsize'], cell['concurrency'],
+        cell['mbPerSec'], cell['requestsPerSec'],
+        milliseconds(cell['firstBlockP50']), milliseconds(cell['firstBlockP99']),
+        milliseconds(cell['transferP50']), milliseconds(cell['transferP99']),
+        cell['failures'])
+
+HEADINGS = '%10s %7s %5s %6s %9s %9s %9s %9s %9s %9s %5s' % (
+    'size', 'blksize', 'win', 'conc', 'MB/s', 'req/s', 'ttfb50', 'ttfb99',
+    'p50 ms', 'p99 ms', 'fail')
+
+def cellKey(cell):
+    return (cell['fileSize'], cell['blksize'], cell['windowsize'], cell['concurrency'])
+
+def compare(results, baseline):
+    '''Print the throughput and p99 of each combination relative to a
+    baseline run.'''
+    previous = dict((cellKey(cell), cell) for cell in baseline['results'])
+    print '\nCompared with %s:' % baseline.get('version', 'the baseline')
+    print '%10s %7s %5s %6s %9s %9s' % ('size', 'blksize', 'win', 'conc', 'MB/s', 'p99')
+    for cell in results:
+        old = previous.get(cellKey(cell))
+        if old is None or not old['mbPerSec'] or not old['transferP99'] or not cell['transferP99']:
+            continue
+        print '%10d %7d %5d %6d %+8.1f%% %+8.1f%%' % (
+            cell['fileSize'], cell['blksize'], cell['windowsize'], cell['concurrency'],
+            (cell['mbPerSec'] / old['mbPerSec'] - 1) * 100,
+            (cell['transferP99'] / old['transferP99'] - 1) * 100)
+
+def sourceVersion():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=open(os.devnull, 'w')).strip()
+    except Exception:
+        return 'unknown'
+
+def parseList(text):
+    return [int(value) for value in text.split(',')]
+
+def mainBenchmark(argv):
+    parser = argparse.ArgumentParser(description='Loopback TFTP server benchmark.')
+    parser.add_argument('--sizes', dest='sizes', default='65536,1048576,16777216', help='file sizes (bytes, comma separated)')
+    parser.add_argument('--blksizes', dest='blksizes', default='512,1428,8192', help='blksize values (comma separated)')
+    parser.add_argument('--concurrency', dest='concurrency', default='1,8,32', help='numbers of concurrent clients (comma separated)')
+    parser.add_argument('--windowsize', dest='windowSize', default='0', help='windowsize requested by the clients (0 for lock-step)')
+    parser.add_argument('--rounds', dest='rounds', default='3', help='transfers per client for each combination')
+    parser.add_argument('--port', dest='port', default=None, help='the server port (random by default)')
+    parser.add_argument('--json', dest='jsonFile', default=None, help='save the results in this JSON file')
+    parser.add_argument('--compare', dest='baselineFile', default=None, help='compare with the results in this JSON file')
+    opts = parser.parse_args(argv[1:])
+
+    sizes = parseList(opts.sizes)
+    blockSizes = parseList(opts.blksizes)
+    concurrencies = parseList(opts.concurrency)
+    windowSize = int(opts.windowSize)
+    rounds = int(opts.rounds)
+    port = int(opts.port) if opts.port else random.randint(20000, 30000)
+
+    dataDir = tempfile.mkdtemp(prefix='tftpud-bench')
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    serverProcess = multiprocessing.Process(target=runServer,
+                                            args=(port, windowSize, ready, stop))
+    serverProcess.start()
+    results = []
+    try:
+        if not ready.wait(30):
+            raise Exception('The server failed to start')
+        print HEADINGS
+        for size in sizes:
+            fileName = os.path.join(dataDir, 'file%d' % size)
+            with open(fileName, 'wb') as f:
+                f.write(os.urandom(size))
+            for blockSize in blockSizes:
+                for concurrency in concurrencies:
+                    cell = runCell(port, fileName, size, blockSize, concurrency,
+                                   rounds, windowSize)
+                    results.append(cell)
+                    print formatRow(cell)
+                    sys.stdout.flush()
+    finally:
+        stop.set()
+        serverProcess.join()
+        shutil.rmtree(dataDir)
+
+    report = {'version' : sourceVersion(),
+              'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python' : platform.python_version(),
+              'platform' : platform.platform(),
+              'cpus' : multiprocessing.cpu_count(),
+              'results' : results}
+    if opts.jsonFile:
+        with open(opts.jsonFile, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if opts.baselineFile:
+        with open(opts.baselineFile) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    mainBenchmark(sys.argv)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+'''
+Retransmission and throughput of the server's transfers on a simulated
+network (see tftpud.server.netsim), over a matrix of link latencies, loss
+rates, blksize and windowsize values. Each scenario runs the real read
+operations against simulated clients in accelerated time, with several
+random seeds:
+
+    python benchmark/simulate.py --loss 0,0.01,0.05 --windowsizes 1,8 --seeds 20
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from tftpud.server import netsim
+from tftpud.server import server
+from tftpud.stats import percentile
+
+def runScenario(fileName, fileSize, latency, loss, blockSize, windowSize, clients, seed,
+                timeout, jitter):
+    config = server.ServerConfig('10.0.0.1', timeout=timeout, listeningPort=69)
+    link = netsim.LinkProfile(latency=latency, jitter=jitter, loss=loss)
+    sim = netsim.Simulation(config, link, seed)
+    options = {}
+    if blockSize != 512:
+        options['blksize'] = str(blockSize)
+    if windowSize > 1:
+        options['windowsize'] = str(windowSize)
+    for i in range(0, clients):
+        sim.addReadClient(fileName, startAt=i * 0.001, options=options,
+                          timeout=timeout, retries=10)
+    sim.run()
+    return sim
+
+def parseList(text, convert):
+    return [convert(value) for value in text.split(',')]
+
+def mainSimulate(argv):
+    parser = argparse.ArgumentParser(description='Simulated network TFTP scenarios.')
+    parser.add_argument('--size', dest='size', default='1048576', help='the file size (bytes)')
+    parser.add_argument('--latencies', dest='latencies', default='0.001,0.02', help='one-way latencies (seconds, comma separated)')
+    parser.add_argument('--jitter', dest='jitter', default='0', help='random extra delay (seconds)')
+    parser.add_argument('--loss', dest='loss', default='0,0.01,0.05', help='packet loss rates (comma separated)')
+    parser.add_argument('--blksizes', dest='blksizes', default='512,1428', help='blksize values (comma separated)')
+    parser.add_argument('--windowsizes', dest='windowsizes', default='1,8', help='windowsize values (comma separated)')
+    parser.add_argument('--clients', dest='clients', default='4', help='concurrent clients per scenario')
+    parser.add_argument('--seeds', dest='seeds', default='5', help='random seeds per scenario')
+    parser.add_argument('--timeout', dest='timeout', default='1', help='retransmission timeout (seconds)')
+    parser.add_argument('--json', dest='jsonFile', default=None, help='save the results in this JSON file')
+    opts = parser.parse_args(argv[1:])
+
+    size = int(opts.size)
+    clients = int(opts.clients)
+    timeout = float(opts.timeout)
+    dataDir = tempfile.mkdtemp(prefix='tftpud-sim')
+    results = []
+    wallStart = time.time()
+    try:
+        fileName = os.path.join(dataDir, 'file')
+        with open(fileName, 'wb') as f:
+            f.write(os.urandom(size))
+        print '%8s %6s %7s %4s %9s %9s %9s %8s %5s' % (
+            'latency', 'loss', 'blksize', 'win', 'p50 s', 'p99 s', 'MB/s', 'resent', 'fail')
+        for latency in parseList(opts.latencies, float):
+            for loss in parseList(opts.loss, float):
+                for blockSize in parseList(opts.blksizes, int):
+                    for windowSize in parseList(opts.windowsizes, int):
+                        durations = []
+                        failures = 0
+                        retransmits = 0
+                        for seed in range(0, int(opts.seeds)):
+                            sim = runScenario(fileName, size, latency, loss, blockSize,
+                                              windowSize, clients, seed, timeout,
+                                              float(opts.jitter))
+                            for r in sim.results():
+                                if r.ok:
+                                    durations.append(r.duration())
+                                else:
+                                    failures += 1
+                            retransmits += sim.server.metrics.retransmits.value()
+                        p50 = percentile(durations, 0.5)
+                        cell = {'latency' : latency, 'loss' : loss, 'blksize' : blockSize,
+                                'windowsize' : windowSize, 'transfers' : len(durations) + failures,
+                                'failures' : failures, 'retransmits' : retransmits,
+                                'p50' : p50, 'p99' : percentile(durations, 0.99),
+                                'mbPerSec' : size / p50 / 1e6 if p50 else None}
+                        results.append(cell)
+                        print '%8.3f %6.3f %7d %4d %9.3f %9.3f %9.2f %8d %5d' % (
+                            latency, loss, blockSize, windowSize, p50 or 0, cell['p99'] or 0,
+                            cell['mbPerSec'] or 0, retransmits, failures)
+                        sys.stdout.flush()
+    finally:
+        shutil.rmtree(dataDir)
+    print '%d transfers simulated in %.1f s' % (sum(c['transfers'] for c in results),
+                                                time.time() - wallStart)
+    if opts.jsonFile:
+        with open(opts.jsonFile, 'w') as f:
+            json.dump({'size' : size, 'clients' : clients, 'results' : results}, f,
+                      indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    mainSimulate(sys.argv)
@@ -7,6 +7,6 @@ setup(name='tftpud',
       description='A TFTP library implemented in pure Python. Also includes a command line server: tftpudServer.',
       author='Huw Lewis',
       author_email='huw.lewis2409@gmail.com',
-      packages=['tftpud', 'tftpud.server'],
-      scripts=['tftpudServer'],
+      packages=['tftpud', 'tftpud.server', 'tftpud.client'],
+      scripts=['tftpudServer', 'tftpudReplay', 'tftpudLoad'],
       license='MIT License')
@@ -0,0 +1,47 @@
+'''
+A minimal lock-step TFTP client for tests against a real server over loopback,
+and a function to start the server.
+'''
+import socket
+
+from tftpud import tftpmessages
+from tftpud.server import server
+
+def startServer(config = None):
+    '''Start a server.Server on a free loopback port chosen by the system.
+    config - the ServerConfig (a default one for 127.0.0.1 if None). Its
+             listeningPort is set to the port the server listens on.'''
+    if config is None:
+        config = server.ServerConfig('127.0.0.1')
+    config.listeningPort = 0
+    uut = server.Server(config)
+    config.listeningPort = uut.listenerSocket.getsockname()[1]
+    return uut
+
+def fetch(port, fileName, host = '127.0.0.1'):
+    '''Read a file from the server. Raises an exception if the server sends
+    an error.'''
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    s.settimeout(5)
+    try:
+        rrq = tftpmessages.ReadRequest()
+        rrq.fileName = fileName
+        rrq.mode = 'octet'
+        s.sendto(rrq.pack(), (host, port))
+        data = []
+        blockNum = 1
+        while True:
+            pkt, addr = s.recvfrom(1024)
+            dataPkt = tftpmessages.create_tftp_packet_from_data(pkt)
+            if dataPkt.opcode == tftpmessages.OPCODE_ERR:
+                raise Exception(dataPkt.errorMsg)
+            ack = tftpmessages.Acknowledgement()
+            ack.blockNum = dataPkt.blockNum
+            s.sendto(ack.pack(), addr)
+            if dataPkt.blockNum == blockNum:
+                data.append(dataPkt.dataBlock)
+                blockNum += 1
+                if len(dataPkt.dataBlock) < 512:
+                    return ''.join(data)
+    finally:
+        s.close()
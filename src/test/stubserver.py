@@ -0,0 +1,25 @@
+'''
+Just enough of a server.Server for an operation to run against a MockSocket.
+The optional facilities (metrics, profiler, sampler, policy, caches, ...) are
+all off; a test sets the ones it needs.
+'''
+import time
+
+from tftpud import eventlog
+from tftpud.server import server
+
+class StubServer:
+
+    def __init__(self):
+        self.config = server.ServerConfig('127.0.0.1')
+        self.config.useTimerWheel = False
+        self.config.mtu = 0
+        self.eventLog = eventlog.EventLog()
+        self.scheduler = self.timerWheel = self.pool = self.policy = None
+        self.metrics = self.profiler = self.sampler = None
+        self.cache = self.memoryCache = self.popularity = self.congestion = None
+        self.netasciiCache = None
+        self.clock = time.time
+
+    def postEvent(self, operation, eventType, data):
+        pass
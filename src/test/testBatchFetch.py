@@ -0,0 +1,107 @@
+'''
+Tests for batch downloads from several servers on one thread.
+'''
+import unittest
+import tempfile
+import shutil
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud import netascii
+from tftpud.client import client
+from tftpud.client import batch
+from tftpud.client import readoperation
+from loopbackclient import startServer
+
+
+def readData(fileName):
+    with open(os.path.join('data', fileName), 'rb') as f:
+        return f.read()
+
+class TestBatchFetch(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = [startServer(), startServer()]
+        self.ports = [s.config.listeningPort for s in self.servers]
+        self.config = client.ClientConfig(None)
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for s in self.servers:
+            s.stopServer()
+        shutil.rmtree(self.tempDir)
+
+    def testFetchMany(self):
+        files = ['MyFile.txt', 'MyFileMedium.txt', 'MyFileLarge.txt']
+        requests = []
+        for i in range(0, 30):
+            port = self.ports[i % 2]
+            requests.append((('127.0.0.1', port), 'data/' + files[i % 3], None))
+        requests.append((('127.0.0.1', self.ports[0]), 'data/NoSuchFile', None))
+        localFile = os.path.join(self.tempDir, 'copy')
+        requests.append((('127.0.0.1', self.ports[1]), 'data/MyFileMedium.txt', localFile))
+
+        self.config.blkSize = 1024
+        self.config.tsize = True
+        uut = batch.BatchClient(self.config, maxConcurrent=6, maxPerServer=4)
+        results = list(uut.fetchMany(requests))
+
+        self.assertEqual(32, len(results))
+        self.assertEqual(6, uut.peakConcurrent)
+        failed = [r for r in results if not r.ok]
+        self.assertEqual(1, len(failed))
+        self.assertTrue(isinstance(failed[0].error, readoperation.ServerError))
+        self.assertEqual(tftpmessages.ERR_FILE_NOT_FOUND, failed[0].error.errorCode)
+        for r in results:
+            if r.ok and r.output is None:
+                expected = readData(os.path.basename(r.fileName))
+                self.assertEqual(expected, r.data)
+                self.assertEqual(len(expected), r.transferSize)
+                self.assertEqual(1024, r.blockSize)
+        self.assertEqual(readData('MyFileMedium.txt'), open(localFile, 'rb').read())
+
+    def testResultsStreamed(self):
+        requests = [(('127.0.0.1', self.ports[0]), 'data/MyFile.txt', None)] * 4
+        uut = batch.BatchClient(self.config, maxConcurrent=1)
+        results = uut.fetchMany(requests)
+        first = results.next()
+        self.assertTrue(first.ok)
+        self.assertEqual(1, len(uut.transfers)) # the next one is running
+        self.assertEqual(3, len(list(results)))
+
+    def testRange(self):
+        for server in self.servers:
+            server.config.allowRange = True
+        requests = [(('127.0.0.1', self.ports[0]), 'data/MyFileMedium.txt', None,
+                     {'range' : '100-1123'}),
+                    (('127.0.0.1', self.ports[1]), 'data/MyFileMedium.txt', None,
+                     {'range' : '1500-'})]
+        self.config.tsize = True
+        uut = batch.BatchClient(self.config)
+        results = sorted(uut.fetchMany(requests), key=lambda r: r.range)
+        expected = readData('MyFileMedium.txt')
+        self.assertEqual([(100, 1123), (1500, 1560)], [r.range for r in results])
+        self.assertEqual(expected[100:1124], results[0].data)
+        self.assertEqual(expected[1500:], results[1].data)
+
+    def testNetascii(self):
+        uut = batch.BatchClient(self.config)
+        uut.mode = 'netascii'
+        results = list(uut.fetchMany([(('127.0.0.1', self.ports[0]), 'data/MyFileMedium.txt', None)]))
+        self.assertTrue(results[0].ok)
+        self.assertEqual(netascii.encode(readData('MyFileMedium.txt')), results[0].data)
+
+    def testNoServer(self):
+        self.config.timeout = 1
+        self.config.retries = 1
+        uut = batch.BatchClient(self.config)
+        results = list(uut.fetchMany([(('127.0.0.1', self.ports[1] + 1), 'data/MyFile.txt', None)]))
+        self.assertFalse(results[0].ok)
+        self.assertTrue(results[0].error is not None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+'''
+Tests for the client read operation, against a real server over loopback.
+'''
+import unittest
+import tempfile
+import shutil
+import socket
+import threading
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.client import client
+from tftpud.client import readoperation
+from tftpud.client import clientoperation
+from tftpud.client import rtt
+from loopbackclient import startServer
+
+
+def readData(fileName):
+    with open(os.path.join('data', fileName), 'rb') as f:
+        return f.read()
+
+class TestClientRead(unittest.TestCase):
+
+    def setUp(self):
+        self.server = startServer()
+        self.port = self.server.config.listeningPort
+        self.config = client.ClientConfig(('127.0.0.1', self.port))
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stopServer()
+        shutil.rmtree(self.tempDir)
+
+    def testReadToFile(self):
+        localFile = os.path.join(self.tempDir, 'MyFileMedium.txt')
+        op = client.Client(self.config).readRequest('data/MyFileMedium.txt', localFile)
+        self.assertEqual(readData('MyFileMedium.txt'), open(localFile, 'rb').read())
+        self.assertEqual(4, op.blocksReceived)
+        self.assertEqual(512, op.blockSize)
+
+    def testReadWithOptions(self):
+        self.config.blkSize = 1428
+        self.config.windowSize = 8
+        self.config.tsize = True
+        self.config.bufferSize = 4096 # several writes
+        chunks = []
+        op = client.Client(self.config).readRequest('data/MyFileLarge.txt',
+                                                    lambda data: chunks.append(data.tobytes()))
+        self.assertEqual(readData('MyFileLarge.txt'), ''.join(chunks))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(1428, op.blockSize)
+        self.assertTrue(1 < op.windowSize <= 8) # limited by the congestion window
+        self.assertEqual(262143, op.transferSize)
+        self.assertTrue(op.rtt.samples > 0)
+
+    def testFileNotFound(self):
+        localFile = os.path.join(self.tempDir, 'missing')
+        try:
+            client.Client(self.config).readRequest('data/NoSuchFile', localFile)
+            self.fail('Expected an error')
+        except readoperation.ServerError, e:
+            self.assertEqual(tftpmessages.ERR_FILE_NOT_FOUND, e.errorCode)
+        self.assertFalse(os.path.exists(localFile))
+
+class TestClientRetransmit(unittest.TestCase):
+
+    def testLostBlock(self):
+        '''A scripted server that loses the second block: the client resends
+        its ACK after a timeout, then keeps the file.'''
+        serverSock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        serverSock.bind(('127.0.0.1', 0))
+        serverSock.settimeout(5)
+        def serve():
+            data, clientAddr = serverSock.recvfrom(1024)
+            packets = []
+            for blockNum, dataBlock in ((1, 'a' * 512), (2, 'b' * 10)):
+                pkt = tftpmessages.DataBlock()
+                pkt.blockNum = blockNum
+                pkt.dataBlock = dataBlock
+                packets.append(pkt.pack())
+            serverSock.sendto(packets[0], clientAddr)
+            serverSock.recvfrom(1024) # ACK 1; block 2 is lost
+            serverSock.recvfrom(1024) # ACK 1 again
+            serverSock.sendto(packets[1], clientAddr)
+            serverSock.recvfrom(1024) # ACK 2
+        thread = threading.Thread(target=serve)
+        thread.start()
+
+        config = client.ClientConfig(serverSock.getsockname())
+        config.timeout = 1
+        chunks = []
+        op = client.Client(config).readRequest('file', lambda data: chunks.append(data.tobytes()))
+        thread.join()
+        serverSock.close()
+        self.assertEqual('a' * 512 + 'b' * 10, ''.join(chunks))
+        self.assertEqual(1, op.timeouts)
+        self.assertEqual(1, op.rtt.backoffs)
+
+class TestRttEstimator(unittest.TestCase):
+
+    def testEstimate(self):
+        uut = rtt.RttEstimator(2.0, 0.01, 10.0)
+        self.assertEqual(2.0, uut.rto)
+        uut.sample(0.1)
+        self.assertAlmostEqual(0.3, uut.rto)
+        uut.sample(0.1)
+        self.assertAlmostEqual(0.1, uut.srtt)
+        self.assertTrue(uut.rto < 0.3)
+        uut.backoff()
+        uut.backoff()
+        self.assertAlmostEqual(0.1 + 4 * uut.rttvar, uut.rto / 4)
+
+    def testLimits(self):
+        uut = rtt.RttEstimator(100.0, 0.05, 10.0)
+        self.assertEqual(10.0, uut.rto)
+        uut.sample(0.0001)
+        self.assertEqual(0.05, uut.rto)
+        for i in range(0, 20):
+            uut.backoff()
+        self.assertEqual(10.0, uut.rto)
+
+    def testKarn(self):
+        uut = rtt.RttEstimator(2.0)
+        uut.sent()
+        uut.arrived(True) # resent: not measured
+        uut.sent()
+        uut.cancel()
+        uut.arrived(False)
+        self.assertEqual(0, uut.samples)
+        uut.sent()
+        uut.arrived(False)
+        self.assertEqual(1, uut.samples)
+
+class TestCheckOptions(unittest.TestCase):
+
+    def testAccepted(self):
+        requested = {'blksize' : '1024', 'tsize' : '0', 'windowsize' : '8',
+                     'range' : '100-', 'timeout' : '2'}
+        options = {'BLKSIZE' : '1000', 'tsize' : '260', 'windowsize' : '4',
+                   'range' : '100-259', 'timeout' : '2'}
+        self.assertEqual({'blksize' : 1000, 'tsize' : 260, 'windowsize' : 4,
+                          'range' : (100, 259), 'timeout' : '2'},
+                         clientoperation.checkOptions(requested, options))
+
+    def testRefused(self):
+        requested = {'blksize' : '1024', 'windowsize' : '8', 'range' : '0-'}
+        for options in ({'tsize' : '260'}, # not requested
+                        {'blksize' : '2048'}, {'blksize' : '4'}, {'blksize' : 'x'},
+                        {'windowsize' : '16'}, {'windowsize' : '0'},
+                        {'range' : '100'}, {'range' : 'a-b'}):
+            self.assertRaises(Exception, clientoperation.checkOptions, requested, options)
+
+if __name__ == '__main__':
+    unittest.main()
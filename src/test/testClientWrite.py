@@ -0,0 +1,153 @@
+'''
+Tests for the client write operation, against a real server over loopback.
+'''
+import unittest
+import tempfile
+import shutil
+import time
+import io
+import struct
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.client import client
+from tftpud.client import clientoperation
+from tftpud.client import writeoperation
+from loopbackclient import startServer
+
+
+def readData(fileName):
+    with open(fileName, 'rb') as f:
+        return f.read()
+
+class LossySocket:
+    '''A client socket that loses the ACKs of the given blocks, once each.'''
+
+    def __init__(self, s, lostAcks):
+        self.s = s
+        self.lostAcks = set(lostAcks)
+
+    def __getattr__(self, name):
+        return getattr(self.s, name)
+
+    def recvfrom_into(self, buf, *args):
+        while True:
+            n, fromAddr = self.s.recvfrom_into(buf, *args)
+            if n >= 4:
+                opcode, blockNum = struct.unpack_from('>HH', buf)
+                if opcode == tftpmessages.OPCODE_ACK and blockNum in self.lostAcks:
+                    self.lostAcks.remove(blockNum)
+                    continue
+            return n, fromAddr
+
+class LossyClient(client.Client):
+
+    def __init__(self, config, lostAcks):
+        client.Client.__init__(self, config)
+        self.lostAcks = lostAcks
+
+    def createSocket(self):
+        s, serverAddr = client.Client.createSocket(self)
+        return LossySocket(s, self.lostAcks), serverAddr
+
+class TestClientWrite(unittest.TestCase):
+
+    def setUp(self):
+        self.server = startServer()
+        self.config = client.ClientConfig(('127.0.0.1', self.server.config.listeningPort))
+        self.tempDir = tempfile.mkdtemp()
+        self.remoteFile = os.path.join(self.tempDir, 'upload')
+
+    def tearDown(self):
+        self.server.stopServer()
+        shutil.rmtree(self.tempDir)
+
+    def waitForTransfers(self):
+        # The server closes the file after sending the final ACK
+        deadline = time.time() + 5
+        while self.server.metrics.activeTransfers.value() > 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+    def testWriteFile(self):
+        self.config.blkSize = 1428
+        self.config.tsize = True
+        op = client.Client(self.config).writeRequest(self.remoteFile, 'data/MyFileLarge.txt')
+        self.waitForTransfers()
+        self.assertEqual(readData('data/MyFileLarge.txt'), readData(self.remoteFile))
+        self.assertEqual(1428, op.blockSize)
+        self.assertEqual(262143, op.transferSize)
+        self.assertEqual(262143 // 1428 + 1, op.blocksSent)
+
+    def testWriteFileObject(self):
+        data = os.urandom(1024)
+        op = client.Client(self.config).writeRequest(self.remoteFile, io.BytesIO(data))
+        self.waitForTransfers()
+        self.assertEqual(data, readData(self.remoteFile))
+        self.assertEqual(3, op.blocksSent) # the last is empty
+        self.assertEqual(None, op.size)
+
+    def testWriteIterator(self):
+        chunks = [os.urandom(n) for n in (1, 700, 0, 2000, 333)]
+        op = client.Client(self.config).writeRequest(self.remoteFile, iter(chunks))
+        self.waitForTransfers()
+        self.assertEqual(''.join(chunks), readData(self.remoteFile))
+        self.assertEqual(3034, op.bytesSent)
+
+    def testAckLost(self):
+        '''The block is resent, and acknowledged again by the server.'''
+        self.config.timeout = 1
+        data = os.urandom(512 * 8 + 100)
+        op = LossyClient(self.config, [5]).writeRequest(self.remoteFile, iter([data]))
+        self.waitForTransfers()
+        self.assertEqual(data, readData(self.remoteFile))
+        self.assertEqual(1, op.timeouts)
+        self.assertFalse(op.finalAckMissed)
+
+    def testFinalAckLost(self):
+        '''The server has ended the transfer, so the last block is resent
+        in vain: the upload is taken as complete.'''
+        self.config.timeout = 1
+        self.config.retries = 2
+        data = os.urandom(512 * 2 + 100)
+        op = LossyClient(self.config, [3]).writeRequest(self.remoteFile, iter([data]))
+        self.waitForTransfers()
+        self.assertEqual(data, readData(self.remoteFile))
+        self.assertTrue(op.finalAckMissed)
+
+    def testFileExists(self):
+        open(self.remoteFile, 'wb').close()
+        try:
+            client.Client(self.config).writeRequest(self.remoteFile, iter(['data']))
+            self.fail('Expected an error')
+        except clientoperation.ServerError, e:
+            self.assertEqual(tftpmessages.ERR_FILE_ALREADY_EXISTS, e.errorCode)
+
+class TestSources(unittest.TestCase):
+
+    def testFileSource(self):
+        with open('data/MyFileMedium.txt', 'rb') as f:
+            f.seek(61)
+            uut = writeoperation.FileSource(f)
+            self.assertEqual(1500, uut.size())
+            buf = bytearray(1024)
+            self.assertEqual(1024, uut.fill(memoryview(buf)))
+            self.assertEqual(476, uut.fill(memoryview(buf)))
+            self.assertEqual(0, uut.fill(memoryview(buf)))
+
+    def testIterSource(self):
+        uut = writeoperation.IterSource(['abc', '', 'defgh', 'i'])
+        self.assertEqual(None, uut.size())
+        buf = bytearray(4)
+        self.assertEqual(4, uut.fill(memoryview(buf)))
+        self.assertEqual('abcd', str(buf))
+        self.assertEqual(4, uut.fill(memoryview(buf)))
+        self.assertEqual('efgh', str(buf))
+        self.assertEqual(1, uut.fill(memoryview(buf)))
+        self.assertEqual('i', str(buf[:1]))
+
+if __name__ == '__main__':
+    unittest.main()
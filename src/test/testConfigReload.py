@@ -0,0 +1,95 @@
+'''
+Tests for reloading the server configuration while it is running.
+'''
+import unittest
+import socket
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.server import server
+from tftpud.server import policy
+from tftpud.client import client
+from loopbackclient import startServer
+
+
+def newConfig(port):
+    return server.ServerConfig('127.0.0.1', listeningPort=port)
+
+class TestConfigReload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = startServer()
+        self.port = self.server.config.listeningPort
+        self.sockets = []
+
+    def tearDown(self):
+        self.server.stopServer()
+        for s in self.sockets:
+            s.close()
+
+    def read(self, port, fileName = 'data/MyFile.txt'):
+        config = client.ClientConfig(('127.0.0.1', port))
+        config.timeout = 1
+        config.retries = 1
+        return client.Client(config).readRequest(fileName, lambda data: None)
+
+    def startRead(self):
+        '''Send a RRQ from a socket that never acknowledges the data, and
+        return the server's operation.'''
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(s)
+        rrq = tftpmessages.ReadRequest()
+        rrq.fileName = 'data/MyFileLarge.txt'
+        rrq.mode = 'octet'
+        s.sendto(rrq.pack(), ('127.0.0.1', self.port))
+        deadline = time.time() + 5
+        while len(self.server.ongoingOperations) == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        return self.server.ongoingOperations.values()[0]
+
+    def testNewRequests(self):
+        config = newConfig(self.port)
+        config.ephemeralPorts = (40000, 40099)
+        listener = self.server.listenerSocket
+        self.server.reloadConfig(config)
+        self.assertTrue(self.server.config is config)
+        self.assertTrue(self.server.listenerSocket is listener) # not rebound
+        op = self.read(self.port)
+        self.assertTrue(40000 <= op.peer[1] <= 40099)
+
+    def testInFlight(self):
+        operation = self.startRead()
+        oldPolicy = self.server.policy
+        config = newConfig(self.port)
+        config.retries = 1
+        config.negotiationRules = [policy.PolicyRule(policy.OptionProfile(maxBlockSize=512),
+                                                     name='small')]
+        self.server.reloadConfig(config)
+        self.assertFalse(self.server.policy is oldPolicy)
+        self.assertEqual(3, operation.retries)
+        self.assertTrue(operation.policy is oldPolicy)
+
+    def testRebind(self):
+        self.server.reloadConfig(newConfig(0)) # a port chosen by the system
+        newPort = self.server.listenerSocket.getsockname()[1]
+        self.assertNotEqual(self.port, newPort)
+        self.read(newPort)
+        self.assertRaises(Exception, self.read, self.port)
+
+    def testRebindFails(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(s)
+        s.bind(('127.0.0.1', 0))
+        config = newConfig(s.getsockname()[1])
+        oldConfig = self.server.config
+        self.assertRaises(socket.error, self.server.reloadConfig, config)
+        self.assertTrue(self.server.config is oldConfig)
+        self.read(self.port)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+'''
+Tests for the structured event log.
+'''
+import unittest
+import threading
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import eventlog
+
+
+class CountingField:
+    '''A field that counts how often it is formatted.'''
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return 'field'
+
+
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.uut = eventlog.EventLog(capacity=4)
+
+    def collect(self, timestamp, eventType, fields):
+        self.events.append((timestamp, eventType, fields))
+
+    def testFormattedOnlyWhenConsumed(self):
+        field = CountingField()
+        self.uut.log(eventlog.CACHE_HIT, field)
+        self.assertEqual(field.formatted, 0, 'not formatted when logged')
+
+        lines = []
+        self.uut.drain(lambda ts, eventType, fields:
+                       lines.append(eventlog.formatEvent(ts, eventType, fields)))
+        self.assertEqual(field.formatted, 1)
+        self.assertTrue(lines[0].endswith(': Cache hit: field'), lines[0])
+
+    def testStructuredEvents(self):
+        self.uut.log(eventlog.READ_COMPLETE, 12)
+        self.uut.drain(self.collect)
+        timestamp, eventType, fields = self.events[0]
+        self.assertTrue(isinstance(timestamp, (int, long)), 'integer timestamp')
+        self.assertEqual(eventType, eventlog.READ_COMPLETE)
+        self.assertEqual(fields, (12,))
+
+    def testDropsCounted(self):
+        for i in range(0, 6):
+            self.uut.log(eventlog.READ_COMPLETE, i)
+        self.assertEqual(self.uut.dropped(), 2, 'ring holds 4 events')
+
+        self.uut.drain(self.collect)
+        self.assertEqual([e[2] for e in self.events[:4]], [(0,), (1,), (2,), (3,)],
+                         'oldest events kept')
+        self.assertEqual(self.events[4][1:], (eventlog.EVENTS_DROPPED, (2,)), 'drops reported')
+
+        self.events = []
+        self.uut.log(eventlog.READ_COMPLETE, 6)
+        self.uut.drain(self.collect)
+        self.assertEqual(len(self.events), 1, 'drops reported once')
+
+    def testRingPerThread(self):
+        self.uut.log(eventlog.MESSAGE, 'main')
+        def worker():
+            for i in range(0, 3):
+                self.uut.log(eventlog.MESSAGE, 'worker')
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.uut.log(eventlog.MESSAGE, 'main')
+
+        self.assertEqual(self.uut.dropped(), 0, 'each thread has its own ring')
+        self.uut.drain(self.collect)
+        self.assertEqual(len(self.events), 5)
+        timestamps = [e[0] for e in self.events]
+        self.assertEqual(timestamps, sorted(timestamps), 'in time order')
+
+        self.uut.drain(self.collect)
+        self.assertEqual(len(self.uut.rings), 1, 'finished thread forgotten')
+
+    def testNotifyWhenRingBecomesNonEmpty(self):
+        notified = []
+        uut = eventlog.EventLog(capacity=4, notify=lambda: notified.append(1))
+        uut.log(eventlog.MESSAGE, 'a')
+        uut.log(eventlog.MESSAGE, 'b')
+        self.assertEqual(len(notified), 1)
+        uut.drain(self.collect)
+        uut.log(eventlog.MESSAGE, 'c')
+        self.assertEqual(len(notified), 2)
+
+    def testTakenWhilePutting(self):
+        '''The consumer empties the ring while an event is being added: the
+        producer still finds it empty, and wakes the consumer.'''
+        uut = eventlog.EventRing(8)
+        uut.put('a')
+        taken = []
+        class Slots(list):
+            def __setitem__(self, index, value):
+                list.__setitem__(self, index, value)
+                if value is not None and not taken:
+                    taken.extend(uut.take()) # before the head moves
+        uut.slots = Slots(uut.slots)
+        self.assertTrue(uut.put('b'))
+        self.assertEqual(['a'], taken)
+        self.assertEqual(['b'], uut.take())
+
+
+if __name__ == "__main__":
+    unittest.main()
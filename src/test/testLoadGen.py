@@ -0,0 +1,77 @@
+'''
+Tests for the boot storm load generator.
+'''
+import unittest
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud.client import loadgen
+from loopbackclient import startServer
+
+
+class TestLoadGen(unittest.TestCase):
+
+    def testParseScript(self):
+        steps = loadgen.parseScript('''
+            # A comment
+            boot.0 blksize=1428
+            cfg/01-{mac} | cfg/default tsize=0
+            ?extra
+            ''', {'blksize' : '512', 'windowsize' : '4'})
+        self.assertEqual(3, len(steps))
+        self.assertEqual([('boot.0', {'blksize' : '1428', 'windowsize' : '4'})],
+                         steps[0].alternatives)
+        self.assertFalse(steps[0].optional)
+        self.assertEqual(['cfg/01-{mac}', 'cfg/default'],
+                         [a[0] for a in steps[1].alternatives])
+        self.assertEqual({'blksize' : '512', 'windowsize' : '4', 'tsize' : '0'},
+                         steps[1].alternatives[1][1])
+        self.assertTrue(steps[2].optional)
+        self.assertRaises(Exception, loadgen.parseScript, 'file blksize')
+
+    def testProbeChain(self):
+        steps = loadgen.parseScript('a-{mac} | b-{client}\n?c\nd')
+        client = loadgen.ScriptedClient(2, steps)
+        self.assertEqual(('a-{mac}', 'a-52-54-00-00-00-02', {}), client.nextRequest())
+        client.requestFinished('File not found')
+        self.assertEqual('b-2', client.nextRequest()[1])
+        client.requestFinished(None)
+        client.requestFinished('File not found') # c is optional
+        self.assertEqual('d', client.nextRequest()[1])
+        client.requestFinished('File not found')
+        self.assertTrue(client.failed)
+        self.assertEqual(None, client.nextRequest())
+
+    def testBootStorm(self):
+        uut = startServer()
+        port = uut.config.listeningPort
+        try:
+            steps = loadgen.parseScript('''
+                data/MyFile.txt
+                data/missing-{mac} | data/MyFileMedium.txt blksize=1024
+                ?data/missing-{client}
+                data/MyFileLarge.txt blksize=1428 windowsize=4
+                ''')
+            reports = []
+            generator = loadgen.LoadGenerator(('127.0.0.1', port), steps, 20, rate=500,
+                                              timeout=1.0, report=reports.append,
+                                              interval=0.05, seed=1)
+            summary = generator.run()
+        finally:
+            uut.stopServer()
+        self.assertEqual(20, summary['clients'])
+        self.assertEqual(0, summary['failedClients'])
+        self.assertEqual(100, summary['transfers'])
+        self.assertEqual(40, summary['failedTransfers'])
+        self.assertEqual(20 * (260 + 1561 + 262143), summary['bytes'])
+        self.assertEqual(20, summary['files']['data/MyFileMedium.txt']['ok'])
+        self.assertEqual(20, summary['files']['data/missing-{mac}']['failed'])
+        self.assertTrue(summary['bootMax'] is not None)
+        self.assertTrue(reports)
+        self.assertTrue(loadgen.formatSummary(summary).startswith('20 clients'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+'''
+Tests for the server metrics and their HTTP endpoint.
+'''
+import unittest
+import urllib2
+import time
+import socket
+import threading
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.server import metrics
+from tftpud.server import server
+from tftpud.server import readoperation
+from loopbackclient import fetch, startServer
+import mocksocket
+from stubserver import StubServer
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def testRender(self):
+        registry = metrics.MetricsRegistry()
+        requests = registry.counter('requests_total', 'Requests.', 'type')
+        active = registry.gauge('active', 'Active.')
+        rtt = registry.histogram('rtt_seconds', 'RTT.', (0.01, 0.1))
+        requests.inc(label='rrq')
+        requests.inc(2, label='wrq')
+        active.inc()
+        rtt.observe(0.005)
+        rtt.observe(0.05)
+        rtt.observe(5)
+
+        lines = registry.render().splitlines()
+        self.assertTrue('# TYPE requests_total counter' in lines)
+        self.assertTrue('requests_total{type="rrq"} 1' in lines)
+        self.assertTrue('requests_total{type="wrq"} 2' in lines)
+        self.assertTrue('active 1' in lines)
+        self.assertTrue('rtt_seconds_bucket{le="0.01"} 1' in lines)
+        self.assertTrue('rtt_seconds_bucket{le="0.1"} 2' in lines, 'cumulative buckets')
+        self.assertTrue('rtt_seconds_bucket{le="+Inf"} 3' in lines)
+        self.assertTrue('rtt_seconds_count 3' in lines)
+
+
+class TestOperationMetrics(unittest.TestCase):
+
+    def testReadOperation(self):
+        s = mocksocket.MockSocket()
+        clientAddr = ('localhost', 12345)
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for blockNum in (1, 2, 3, 4):
+            ackPacket.blockNum = blockNum
+            rxData.append( (ackPacket.pack(), clientAddr) )
+        # An ACK from the wrong port (TID)
+        rxData.insert(1, (ackPacket.pack(), ('localhost', 999)))
+        s.loadPendingRxData(rxData)
+
+        pkt = tftpmessages.ReadRequest()
+        pkt.fileName = os.path.join('data', 'MyFileMedium.txt') # 1561 bytes
+        pkt.mode = 'octet'
+        stub = StubServer()
+        stub.metrics = metrics.ServerMetrics()
+        uut = readoperation.ReadOperation(s, clientAddr, pkt, server=stub)
+        uut.join()
+
+        m = stub.metrics
+        self.assertEqual(m.blocksSent.value(), 4)
+        self.assertEqual(m.bytesSent.value(), 1561)
+        self.assertEqual(m.tidErrors.value(), 1)
+        self.assertEqual(m.errors.value(tftpmessages.ERR_UNKNOWN_TID), 1)
+        self.assertEqual(m.timeToFirstBlock.count, 1)
+        self.assertEqual(m.ackRtt.count, 4, 'one RTT per block')
+        self.assertEqual(m.transferDuration.count, 1)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def testScrape(self):
+        config = server.ServerConfig('127.0.0.1')
+        config.metricsPort = 0 # chosen by the system
+        uut = startServer(config)
+        port = config.listeningPort
+        try:
+            fetch(port, 'data/MyFile.txt')
+            self.assertRaises(Exception, fetch, port, 'data/NoSuchFile.txt')
+            # The last ACK may still be on its way to the server
+            deadline = time.time() + 5
+            while uut.metrics.activeTransfers.value() > 0 and time.time() < deadline:
+                time.sleep(0.01)
+            metricsPort = uut.metricsEndpoint.address()[1]
+            text = urllib2.urlopen('http://127.0.0.1:%d/metrics' % metricsPort).read()
+        finally:
+            uut.stopServer()
+
+        lines = text.splitlines()
+        self.assertTrue('tftpud_requests_total{type="rrq"} 2' in lines, text)
+        self.assertTrue('tftpud_errors_total{code="1"} 1' in lines, 'file not found')
+        self.assertTrue('tftpud_bytes_sent_total 260' in lines)
+        self.assertTrue('tftpud_transfer_duration_seconds_count 1' in lines)
+
+    def testPortInUse(self):
+        '''A server whose metrics port is taken fails to start, and leaves
+        nothing open or running.'''
+        busy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        busy.bind(('127.0.0.1', 0))
+        busy.listen(1)
+        threads = threading.active_count()
+        try:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+            s.close()
+            config = server.ServerConfig('127.0.0.1', listeningPort = port)
+            config.metricsPort = busy.getsockname()[1]
+            self.assertRaises(socket.error, server.Server, config)
+            self.assertEqual(threads, threading.active_count())
+
+            # The listening port is free again
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            s.bind(('127.0.0.1', port))
+            s.close()
+        finally:
+            busy.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+'''
+Tests for the virtual-clock network simulator: the real read and write
+operations against simulated clients.
+'''
+import unittest
+import shutil
+import tempfile
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud.server import netsim
+from tftpud.server import server
+
+
+def makeConfig(timeout = 1.0):
+    return server.ServerConfig('10.0.0.1', timeout=timeout, listeningPort=69)
+
+
+class TestNetSim(unittest.TestCase):
+
+    def readFile(self, fileName):
+        with open(fileName, 'rb') as f:
+            return f.read()
+
+    def testLockStepTiming(self):
+        sim = netsim.Simulation(makeConfig(), netsim.LinkProfile(latency=0.05))
+        client = sim.addReadClient('data/MyFileMedium.txt', startAt=1.0, keepData=True)
+        sim.run()
+
+        self.assertTrue(client.result.ok)
+        self.assertEqual(''.join(client.data), self.readFile('data/MyFileMedium.txt'))
+        # The RRQ, then 4 blocks each a round trip after the last
+        self.assertAlmostEqual(client.result.firstBlock, 1.1)
+        self.assertAlmostEqual(client.result.duration(), 0.1 * 4)
+        self.assertEqual(sim.server.metrics.activeTransfers.value(), 0)
+
+    def testLossInAcceleratedTime(self):
+        link = netsim.LinkProfile(latency=0.01, jitter=0.005, loss=0.2)
+        sim = netsim.Simulation(makeConfig(timeout=3.0), link, seed=3)
+        client = sim.addReadClient('data/MyFileLarge.txt', options={'blksize' : '1428'},
+                                   timeout=3.0, retries=10, keepData=True)
+        started = time.time()
+        sim.run()
+
+        self.assertTrue(client.result.ok, client.result.error)
+        self.assertEqual(''.join(client.data), self.readFile('data/MyFileLarge.txt'))
+        self.assertTrue(client.result.duration() > 30, 'minutes of timeouts')
+        self.assertTrue(time.time() - started < 10, 'simulated quickly')
+        self.assertTrue(sim.server.metrics.retransmits.value() > 0)
+
+    def testDeterministic(self):
+        def run():
+            link = netsim.LinkProfile(latency=0.01, jitter=0.01, loss=0.05,
+                                      duplicate=0.05, reorder=0.05)
+            sim = netsim.Simulation(makeConfig(), link, seed=7)
+            for i in range(0, 5):
+                sim.addReadClient('data/MyFileLarge.txt', startAt=i * 0.01,
+                                  options={'blksize' : '1428', 'windowsize' : '4'})
+            sim.run()
+            return [(r.ok, r.finished, r.packetsSent, r.timeouts) for r in sim.results()]
+        first = run()
+        self.assertEqual([r[0] for r in first], [True] * 5)
+        self.assertEqual(run(), first)
+
+    def testBandwidth(self):
+        link = netsim.LinkProfile(latency=0.0, bandwidth=100000) # 100 kB/s
+        sim = netsim.Simulation(makeConfig(), link)
+        client = sim.addReadClient('data/MyFileLarge.txt', options={'windowsize' : '16'})
+        sim.run()
+        self.assertTrue(client.result.ok)
+        # 262143 bytes of data (plus headers and ACKs) at 100 kB/s
+        self.assertTrue(2.6 < client.result.duration() < 3.0, client.result.duration())
+
+    def testManyClients(self):
+        link = netsim.LinkProfile(latency=0.002, loss=0.01)
+        sim = netsim.Simulation(makeConfig(), link, seed=1)
+        for i in range(0, 100):
+            sim.addReadClient('data/MyFileMedium.txt', startAt=i * 0.001)
+        sim.addReadClient('data/NoSuchFile.txt')
+        sim.run()
+
+        results = sim.results()
+        self.assertEqual([r.ok for r in results[:100]], [True] * 100)
+        self.assertFalse(results[100].ok)
+        self.assertTrue('No such file' in results[100].error)
+        # Some requests were lost and resent
+        self.assertTrue(sim.server.metrics.requests.value('rrq') > 101)
+        self.assertEqual(len(sim.server.ongoingOperations), 0)
+
+    def testWrite(self):
+        tempDir = tempfile.mkdtemp()
+        try:
+            fileName = os.path.join(tempDir, 'upload.bin')
+            data = os.urandom(5000)
+            sim = netsim.Simulation(makeConfig(), netsim.LinkProfile(loss=0.1), seed=2)
+            client = sim.addWriteClient(fileName, data, options={'blksize' : '1024'})
+            sim.run()
+            self.assertTrue(client.result.ok, client.result.error)
+            self.assertEqual(self.readFile(fileName), data)
+        finally:
+            shutil.rmtree(tempDir)
+
+
+if __name__ == "__main__":
+    unittest.main()
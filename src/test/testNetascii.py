@@ -0,0 +1,186 @@
+'''
+Tests for netascii mode: the conversion, the converted block source and
+cache, and netascii transfers with a real server over loopback.
+'''
+import unittest
+import tempfile
+import shutil
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import netascii
+from tftpud.server import readoperation
+from tftpud.server import netasciicache
+from tftpud.client import client
+from tftpud.client import readoperation as clientread
+from tftpud.client import writeoperation as clientwrite
+from loopbackclient import startServer
+
+
+TEXT = 'line one\nline two\r\nbare cr\r here\n\n' * 100
+
+def writeData(fileName, data):
+    with open(fileName, 'wb') as f:
+        f.write(data)
+
+def readData(fileName):
+    with open(fileName, 'rb') as f:
+        return f.read()
+
+class TestConversion(unittest.TestCase):
+
+    def testEncode(self):
+        self.assertEqual('a\r\nb\r\0c\r\0\r\n', netascii.encode('a\nb\rc\r\n'))
+        self.assertEqual(len(netascii.encode(TEXT)), netascii.encodedSize(TEXT))
+
+    def testDecodeInChunks(self):
+        encoded = netascii.encode(TEXT)
+        for chunkSize in (1, 2, 3, 7, 512):
+            uut = netascii.Decoder()
+            decoded = [uut.decode(encoded[i:i + chunkSize])
+                       for i in range(0, len(encoded), chunkSize)]
+            decoded.append(uut.finish())
+            self.assertEqual(TEXT, ''.join(decoded))
+
+    def testTrailingCr(self):
+        uut = netascii.Decoder()
+        self.assertEqual('a', uut.decode('a\r'))
+        self.assertEqual('\r', uut.finish())
+
+class TestNetasciiCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.tempDir, 'text')
+        writeData(self.fileName, TEXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def readBlocks(self, source):
+        blocks = []
+        while True:
+            more = source.getBlocks(3)
+            if len(more) == 0:
+                return blocks
+            blocks.extend(more)
+
+    def testBlockSource(self):
+        sizes = []
+        uut = netasciicache.NetasciiBlockSource(
+            readoperation.FileBlockSource(self.fileName, 512), 512, sizes.append)
+        blocks = self.readBlocks(uut)
+        self.assertEqual(netascii.encode(TEXT), ''.join(blocks))
+        self.assertEqual([512] * (len(blocks) - 1), [len(b) for b in blocks[:-1]])
+        self.assertEqual([netascii.encodedSize(TEXT)], sizes)
+
+    def testCache(self):
+        uut = netasciicache.NetasciiCache(100000, 10000)
+        stat = os.stat(self.fileName)
+        self.assertEqual((None, None), uut.get(self.fileName, stat))
+
+        # Read once: the converted size is known, and the file is kept
+        # from the second read.
+        uut.recordSize(self.fileName, stat, netascii.encodedSize(TEXT))
+        data, size = uut.get(self.fileName, stat)
+        self.assertEqual(netascii.encode(TEXT), data)
+        self.assertEqual(len(data), size)
+        self.assertEqual(1, len(uut))
+        self.assertEqual(len(data), uut.totalBytes)
+
+        # Changed on disk
+        writeData(self.fileName, 'new\n')
+        os.utime(self.fileName, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual((None, None), uut.get(self.fileName, os.stat(self.fileName)))
+        self.assertEqual(0, uut.totalBytes)
+
+    def testDisabled(self):
+        '''With maxBytes 0 the file is never read into memory, but its
+        converted size is still known.'''
+        uut = netasciicache.NetasciiCache(0, 10000)
+        uut.load = lambda fileName, stat: self.fail('Loaded ' + fileName)
+        stat = os.stat(self.fileName)
+        uut.recordSize(self.fileName, stat, netascii.encodedSize(TEXT))
+        self.assertEqual((None, netascii.encodedSize(TEXT)), uut.get(self.fileName, stat))
+        self.assertEqual(0, len(uut))
+
+    def testConvertedSize(self):
+        self.assertEqual(netascii.encodedSize(TEXT),
+                         netasciicache.convertedSize(self.fileName, chunkSize=7))
+
+    def testEviction(self):
+        size = netascii.encodedSize(TEXT)
+        uut = netasciicache.NetasciiCache(size * 2, size)
+        names = []
+        for i in range(3):
+            name = os.path.join(self.tempDir, 'text%d' % i)
+            writeData(name, TEXT)
+            uut.recordSize(name, os.stat(name), size)
+            uut.get(name, os.stat(name))
+            names.append(name)
+        self.assertEqual(2, len(uut))
+        self.assertEqual(names[1:], uut.files.keys())
+
+class TestNetasciiTransfers(unittest.TestCase):
+
+    def setUp(self):
+        self.server = startServer()
+        self.config = client.ClientConfig(('127.0.0.1', self.server.config.listeningPort))
+        self.config.tsize = True
+        self.tempDir = tempfile.mkdtemp()
+        self.fileName = os.path.join(self.tempDir, 'text')
+        writeData(self.fileName, TEXT)
+
+    def tearDown(self):
+        self.server.stopServer()
+        shutil.rmtree(self.tempDir)
+
+    def read(self):
+        chunks = []
+        uut = client.Client(self.config)
+        s, serverAddr = uut.createSocket()
+        try:
+            op = clientread.ReadOperation(s, self.config, self.fileName,
+                                          lambda data: chunks.append(data.tobytes()),
+                                          serverAddr)
+            op.mode = 'netascii'
+            op.requestOptions = {'tsize' : '0'}
+            op.run()
+        finally:
+            s.close()
+        self.assertEqual(None, op.error)
+        return op, ''.join(chunks)
+
+    def testRead(self):
+        # The first read measures the converted size for the tsize, and the
+        # file is then sent from memory.
+        for i in range(3):
+            op, received = self.read()
+            self.assertEqual(netascii.encode(TEXT), received)
+            self.assertEqual(len(received), op.transferSize)
+        self.assertEqual(1, len(self.server.netasciiCache))
+
+    def testWrite(self):
+        remoteFile = os.path.join(self.tempDir, 'upload')
+        uut = client.Client(self.config)
+        s, serverAddr = uut.createSocket()
+        try:
+            op = clientwrite.WriteOperation(s, self.config, remoteFile,
+                                            clientwrite.IterSource([netascii.encode(TEXT)]),
+                                            serverAddr)
+            op.mode = 'netascii'
+            op.run()
+        finally:
+            s.close()
+        self.assertEqual(None, op.error)
+        deadline = time.time() + 5
+        while self.server.metrics.activeTransfers.value() > 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(TEXT, readData(remoteFile))
+
+if __name__ == '__main__':
+    unittest.main()
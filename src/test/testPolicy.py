@@ -0,0 +1,110 @@
+'''
+Tests for the option negotiation policy.
+'''
+import unittest
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.server import policy
+from tftpud.server import readoperation
+import mocksocket
+from stubserver import StubServer
+
+
+class TestNegotiationPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.bmc = policy.PolicyRule(policy.OptionProfile(maxBlockSize=512, tsize=False),
+                                     subnets=['10.1.2.0/24'], name='bmc')
+        self.lan = policy.PolicyRule(policy.OptionProfile(maxWindowSize=256),
+                                     subnets=['10.0.0.0/8', 'fd00::/8'],
+                                     filePatterns=['*.iso', 'images/*'], name='lan')
+        self.windowed = policy.PolicyRule(policy.OptionProfile(maxWindowSize=8),
+                                          options=['WindowSize'], name='windowed')
+        self.uut = policy.NegotiationPolicy([self.bmc, self.lan, self.windowed])
+
+    def testFirstMatchWins(self):
+        self.assertIs(self.uut.lookup(('10.1.2.3', 1000), 'a.iso', {}), self.bmc,
+                      'more specific subnet listed first')
+        self.assertIs(self.uut.lookup(('10.9.2.3', 1000), 'a.iso', {}), self.lan,
+                      'falls through to the next rule')
+
+    def testFilePatterns(self):
+        self.assertIs(self.uut.lookup(('10.9.2.3', 1000), 'images/boot.img', {}), self.lan)
+        self.assertIs(self.uut.lookup(('10.9.2.3', 1000), 'pxelinux.0', {}), None,
+                      'no pattern matches')
+        self.assertIs(self.uut.lookup(('fd01::5', 1000, 0, 0), 'x.iso', {}), self.lan,
+                      'IPv6 subnet')
+
+    def testRequestedOptions(self):
+        self.assertIs(self.uut.lookup(('192.168.0.1', 1000), 'a', {'windowsize':'16'}),
+                      self.windowed, 'option names are case insensitive')
+        self.assertIs(self.uut.lookup(('192.168.0.1', 1000), 'a', {'blksize':'1024'}),
+                      None, 'option not requested')
+        self.assertIs(self.uut.lookup(('localhost', 1000), 'a', {'windowsize':'16'}),
+                      self.windowed, 'rule without subnets matches any address')
+
+    def testEmptyPolicy(self):
+        self.assertIs(policy.NegotiationPolicy().lookup(('10.0.0.1', 1), 'a', {}), None)
+
+
+class TestPolicyApplied(unittest.TestCase):
+
+    def setUp(self):
+        profile = policy.OptionProfile(maxBlockSize=512, mtu=0, maxTimeout=10,
+                                       tsize=False, maxWindowSize=1)
+        self.policy = policy.NegotiationPolicy([policy.PolicyRule(profile,
+                                                                  subnets=['10.1.2.0/24'])])
+
+    def negotiate(self, clientAddr, options):
+        '''Read a one block file with the options, and return the options of
+        the OACK sent.'''
+        s = mocksocket.MockSocket()
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for blockNum in (0, 1):
+            ackPacket.blockNum = blockNum
+            rxData.append( (ackPacket.pack(), clientAddr) )
+        s.loadPendingRxData(rxData)
+
+        stub = StubServer()
+        stub.policy = self.policy
+        pkt = tftpmessages.ReadRequest()
+        pkt.fileName = os.path.join('data', 'MyFile.txt')
+        pkt.mode = 'octet'
+        pkt.options = options
+        uut = readoperation.ReadOperation(s, clientAddr, pkt, server=stub)
+        uut.join()
+
+        oack = tftpmessages.create_tftp_packet_from_data(s.sentData[0][0])
+        self.assertEqual(oack.opcode, tftpmessages.OPCODE_OACK, 'OACK sent')
+        return oack.options
+
+    def testProfileLimitsOptions(self):
+        '''
+        A matching rule limits blksize, declines tsize and windowsize, and
+        accepts a timeout within its range.
+        '''
+        options = self.negotiate(('10.1.2.3', 12345),
+                                 {'blksize':'1024', 'tsize':'0', 'timeout':'5',
+                                  'windowsize':'4'})
+        self.assertEqual(options, {'blksize':'512', 'timeout':'5'})
+
+    def testTimeoutOutOfRange(self):
+        options = self.negotiate(('10.1.2.3', 12345), {'blksize':'1024', 'timeout':'30'})
+        self.assertEqual(options, {'blksize':'512'}, 'timeout declined')
+
+    def testRuleNotMatched(self):
+        options = self.negotiate(('192.168.1.1', 12345),
+                                 {'blksize':'1024', 'tsize':'0', 'timeout':'30',
+                                  'windowsize':'4'})
+        self.assertEqual(options, {'blksize':'1024', 'tsize':'260', 'timeout':'30',
+                                   'windowsize':'4'})
+
+
+if __name__ == "__main__":
+    unittest.main()
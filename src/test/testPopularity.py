@@ -0,0 +1,128 @@
+'''
+Tests for the popularity manifest and the warm-up of the in-memory file cache.
+'''
+import unittest
+import shutil
+import tempfile
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud.server import popularity
+from tftpud.server import memorycache
+from tftpud.server import server
+from loopbackclient import startServer
+
+
+class TestPopularityManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempDir, 'popularity')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def testSaveAndLoad(self):
+        manifest = popularity.PopularityManifest(self.path)
+        manifest.record('pxelinux.0', 26759)
+        manifest.record('images/vmlinuz', 5000000)
+        manifest.record('images/vmlinuz', 5000000)
+        manifest.record('my file.cfg', 300)
+        manifest.save()
+
+        loaded = popularity.PopularityManifest(self.path)
+        loaded.load()
+        top = loaded.topFiles(2)
+        self.assertEqual([name for name, record in top], ['images/vmlinuz', 'pxelinux.0'])
+        self.assertEqual(top[0][1].count, 2, 'count')
+        self.assertEqual(top[0][1].size, 5000000, 'bytes')
+        self.assertTrue(loaded.records.has_key('my file.cfg'), 'name with a space')
+
+    def testMaxEntries(self):
+        manifest = popularity.PopularityManifest(self.path, maxEntries=1)
+        manifest.record('a', 1)
+        manifest.record('b', 1)
+        manifest.record('b', 1)
+        manifest.save()
+        manifest.load()
+        self.assertEqual(manifest.records.keys(), ['b'], 'least popular dropped')
+
+
+class TestMemoryFileCache(unittest.TestCase):
+
+    def testBudget(self):
+        uut = memorycache.MemoryFileCache(1500)
+        self.assertTrue(uut.load('data/MyFile1024.txt'))
+        self.assertFalse(uut.load('data/MyFileMedium.txt'), 'over budget')
+        self.assertTrue(uut.load('data/MyFile.txt'))
+        self.assertFalse(uut.load('data/NoSuchFile.txt'), 'missing file')
+        self.assertEqual(uut.totalBytes, 1024 + 260)
+
+    def testBlocks(self):
+        uut = memorycache.MemoryFileCache(4096)
+        uut.load('data/MyFile1024.txt')
+        data = uut.get('data/MyFile1024.txt', os.stat('data/MyFile1024.txt'))
+        self.assertEqual(data, open('data/MyFile1024.txt', 'rb').read())
+
+        source = memorycache.MemoryBlockSource(data, 512)
+        self.assertEqual([len(b) for b in source.getBlocks(5)], [512, 512])
+        self.assertEqual(source.getBlocks(5), [], 'end of file')
+
+        source = memorycache.MemoryBlockSource(data, 512, 100, 600)
+        self.assertEqual(source.getBlocks(5), [data[100:612], data[612:700]], 'a range')
+
+    def testChangedFileDropped(self):
+        uut = memorycache.MemoryFileCache(4096)
+        uut.load('data/MyFile.txt')
+        stat = os.stat('data/MyFile.txt')
+        changed = os.stat_result((stat.st_mode, stat.st_ino, stat.st_dev, stat.st_nlink,
+                                  stat.st_uid, stat.st_gid, stat.st_size + 1,
+                                  stat.st_atime, stat.st_mtime, stat.st_ctime))
+        self.assertEqual(uut.get('data/MyFile.txt', changed), None, 'size changed')
+        self.assertEqual(len(uut), 0, 'dropped')
+
+
+class TestWarmUp(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempDir, 'popularity')
+        manifest = popularity.PopularityManifest(self.path)
+        for i in range(0, 3):
+            manifest.record('data/MyFileMedium.txt', 1561)
+        for i in range(0, 2):
+            manifest.record('data/MyFileLarge.txt', 262143)
+        manifest.record('data/MyFile.txt', 260)
+        manifest.save()
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stopServer()
+        shutil.rmtree(self.tempDir)
+
+    def startServer(self, background):
+        config = server.ServerConfig('127.0.0.1')
+        config.popularityManifest = self.path
+        config.warmupMaxBytes = 4096
+        config.warmupInBackground = background
+        self.server = startServer(config)
+
+    def testWarmUpBeforeListening(self):
+        self.startServer(False)
+        self.assertTrue(self.server.ready.is_set(), 'ready when started')
+        self.assertEqual(sorted(self.server.memoryCache.files.keys()),
+                         ['data/MyFile.txt', 'data/MyFileMedium.txt'],
+                         'popular files within the budget')
+
+    def testWarmUpInBackground(self):
+        self.startServer(True)
+        self.assertTrue(self.server.ready.wait(5), 'ready after warm-up')
+        self.assertEqual(len(self.server.memoryCache), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+'''
+Tests for the per-phase transfer profiling.
+'''
+import unittest
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud import clock
+from tftpud.server import profiling
+from tftpud.server import readoperation
+from tftpud.server import writeoperation
+import mocksocket
+from stubserver import StubServer
+
+
+class RecordingHook(profiling.ProfileHook):
+
+    def __init__(self):
+        self.phases = []
+        self.completed = []
+
+    def phase(self, profile, phase, seconds):
+        self.phases.append(phase)
+
+    def complete(self, profile):
+        self.completed.append(profile)
+
+
+class TestTransferProfiler(unittest.TestCase):
+
+    def testMonotonicClock(self):
+        t0 = clock.monotonic()
+        t1 = clock.monotonic()
+        self.assertTrue(t1 >= t0)
+
+    def testKeepsSlowest(self):
+        uut = profiling.TransferProfiler(keepSlowest=3)
+        for i, duration in enumerate((0.5, 0.1, 0.9, 0.3, 0.7)):
+            profile = uut.newProfile('RRQ', 'file%d' % i, ('localhost', 1000))
+            profile.started = clock.monotonic() - duration
+            profile.complete()
+
+        slowest = uut.slowestTransfers()
+        self.assertEqual([p.fileName for p in slowest], ['file2', 'file4', 'file0'])
+        self.assertEqual([p.fileName for p in uut.slowestTransfers(1)], ['file2'])
+        report = uut.report(2).splitlines()
+        self.assertEqual(report[0], 'Slowest 2 of 5 transfers (ms):')
+        self.assertTrue('RRQ file2' in report[2], report[2])
+
+    def testHooks(self):
+        hook = RecordingHook()
+        uut = profiling.TransferProfiler(hooks=[hook])
+        profile = uut.newProfile('WRQ', 'file', ('localhost', 1000))
+        profile.end(profiling.READ, profile.begin())
+        profile.end(profiling.READ, profile.begin())
+        profile.complete()
+
+        self.assertEqual(hook.phases, [profiling.READ, profiling.READ])
+        self.assertEqual(hook.completed, [profile])
+        self.assertEqual(profile.breakdown()['read'][1], 2)
+
+
+class TestOperationProfiling(unittest.TestCase):
+
+    def testReadOperation(self):
+        s = mocksocket.MockSocket()
+        clientAddr = ('localhost', 12345)
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for blockNum in (1, 2, 3, 4):
+            ackPacket.blockNum = blockNum
+            rxData.append( (ackPacket.pack(), clientAddr) )
+        s.loadPendingRxData(rxData)
+
+        pkt = tftpmessages.ReadRequest()
+        pkt.fileName = os.path.join('data', 'MyFileMedium.txt')
+        pkt.mode = 'octet'
+        stub = StubServer()
+        stub.profiler = profiling.TransferProfiler()
+        profiler = stub.profiler
+        uut = readoperation.ReadOperation(s, clientAddr, pkt, server=stub)
+        uut.join()
+
+        profiles = profiler.slowestTransfers()
+        self.assertEqual(len(profiles), 1)
+        breakdown = profiles[0].breakdown()
+        self.assertEqual(breakdown['stat'][1], 1)
+        self.assertEqual(breakdown['negotiate'][1], 1)
+        self.assertTrue(breakdown['read'][1] >= 1)
+        self.assertEqual(breakdown['send'][1], 4, 'one send per block')
+        self.assertEqual(breakdown['waitAck'][1], 4)
+        self.assertTrue(profiles[0].duration >= sum(profiles[0].times))
+
+    def testWriteOperation(self):
+        s = mocksocket.MockSocket()
+        clientAddr = ('localhost', 12345)
+        dataPacket = tftpmessages.DataBlock()
+        dataPacket.blockNum = 1
+        dataPacket.dataBlock = 'x' * 100
+        s.loadPendingRxData([ (dataPacket.pack(), clientAddr) ])
+
+        pkt = tftpmessages.WriteRequest()
+        pkt.fileName = os.path.join('data', 'ProfiledWrite.txt')
+        pkt.mode = 'octet'
+        stub = StubServer()
+        stub.profiler = profiling.TransferProfiler()
+        try:
+            uut = writeoperation.WriteOperation(s, clientAddr, pkt, server=stub)
+            uut.join()
+        finally:
+            if os.path.exists(pkt.fileName):
+                os.remove(pkt.fileName)
+
+        breakdown = stub.profiler.slowestTransfers()[0].breakdown()
+        self.assertEqual(breakdown['waitData'][1], 1)
+        self.assertEqual(breakdown['write'][1], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
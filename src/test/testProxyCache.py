@@ -0,0 +1,140 @@
+'''
+Tests for the proxy mode cache, fetching from a second server over loopback.
+'''
+import unittest
+import shutil
+import tempfile
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.server import server
+from tftpud.server import proxycache
+from loopbackclient import fetch, startServer
+
+
+def readAll(source, blockSize = 512):
+    source.blockSize = blockSize
+    source.waitReady()
+    data = []
+    while True:
+        blocks = source.getBlocks(8)
+        if len(blocks) == 0:
+            return ''.join(data)
+        data.extend(blocks)
+
+
+class TestProxyCache(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = startServer()
+        self.port = self.upstream.config.listeningPort
+        self.cacheDir = tempfile.mkdtemp()
+        self.proxy = None
+
+    def tearDown(self):
+        self.upstream.stopServer()
+        if self.proxy is not None:
+            self.proxy.stopServer()
+        shutil.rmtree(self.cacheDir)
+
+    def makeCache(self, maxBytes = 1024 * 1024):
+        return proxycache.ProxyCache(('127.0.0.1', self.port), self.cacheDir, maxBytes,
+                                     timeout=1.0)
+
+    def testReadThrough(self):
+        cache = self.makeCache()
+        expected = open('data/MyFileLarge.txt', 'rb').read()
+        self.assertEqual(readAll(cache.open('data/MyFileLarge.txt')), expected, 'fetched')
+        self.assertEqual(readAll(cache.open('data/MyFileLarge.txt'), 1024), expected, 'cached')
+        stats = cache.stats()
+        self.assertEqual(stats['misses'], 1, 'one fetch')
+        self.assertEqual(stats['hits'], 1, 'then served from the cache')
+        self.assertEqual(stats['bytes'], len(expected))
+
+    def testConcurrentMissesShareFetch(self):
+        cache = self.makeCache()
+        first = cache.open('data/MyFileLarge.txt')
+        second = cache.open('data/MyFileLarge.txt')
+        self.assertIs(first.fetch, second.fetch, 'one upstream fetch')
+        expected = open('data/MyFileLarge.txt', 'rb').read()
+        self.assertEqual(readAll(first), expected)
+        self.assertEqual(readAll(second, 1468), expected)
+        self.assertEqual(cache.stats()['sharedFetches'], 1)
+
+    def testLeastRecentlyUsedEvicted(self):
+        cache = self.makeCache(maxBytes=2700)
+        readAll(cache.open('data/MyFile1024.txt'))
+        readAll(cache.open('data/MyFileMedium.txt'))
+        readAll(cache.open('data/MyFile1024.txt')) # now the most recently used
+        readAll(cache.open('data/MyFile.txt'))
+        self.assertEqual(cache.entries.keys(), ['data/MyFile1024.txt', 'data/MyFile.txt'],
+                         'medium file evicted')
+        self.assertFalse(os.path.exists(cache.cachePath('data/MyFileMedium.txt')),
+                         'evicted file removed')
+
+        # The index is rebuilt from the cache directory.
+        reloaded = self.makeCache(maxBytes=2700)
+        self.assertEqual(reloaded.totalBytes, 1024 + 260)
+
+    def testUpstreamError(self):
+        cache = self.makeCache()
+        source = cache.open('data/NoSuchFile.txt')
+        try:
+            source.waitReady()
+            self.fail('expected an UpstreamError')
+        except proxycache.UpstreamError, e:
+            self.assertEqual(e.errorCode, tftpmessages.ERR_FILE_NOT_FOUND)
+        self.assertEqual(os.listdir(self.cacheDir), [], 'partial file removed')
+
+    def testDotNames(self):
+        cache = self.makeCache()
+        for name in ('.', '..', '.hidden'):
+            path = cache.cachePath(name)
+            self.assertEqual(self.cacheDir, os.path.dirname(path))
+            self.assertTrue(os.path.basename(path).startswith('%2E'))
+        self.assertRaises(proxycache.UpstreamError, cache.open, '')
+
+    def testCacheFileNotCreated(self):
+        cache = self.makeCache()
+        try:
+            cache.open('x' * 300) # too long a name for the cache directory
+            self.fail('expected an UpstreamError')
+        except proxycache.UpstreamError, e:
+            self.assertEqual(e.errorCode, tftpmessages.ERR_NOT_DEFINED)
+        self.assertEqual(cache.stats()['fetching'], 0)
+
+    def testRenameFails(self):
+        '''The file can't join the cache, but the readers still get it.'''
+        def failRename(src, dst):
+            raise OSError(28, 'No space left on device')
+        rename = os.rename
+        os.rename = failRename
+        try:
+            cache = self.makeCache()
+            expected = open('data/MyFileMedium.txt', 'rb').read()
+            self.assertEqual(readAll(cache.open('data/MyFileMedium.txt')), expected)
+        finally:
+            os.rename = rename
+        self.assertEqual(cache.stats()['files'], 0)
+        self.assertEqual(os.listdir(self.cacheDir), [], 'partial file removed')
+
+    def testProxyServer(self):
+        config = server.ServerConfig('127.0.0.1')
+        config.upstream = ('127.0.0.1', self.port)
+        config.cacheDir = self.cacheDir
+        self.proxy = startServer(config)
+        proxyPort = config.listeningPort
+
+        expected = open('data/MyFileMedium.txt', 'rb').read()
+        self.assertEqual(fetch(proxyPort, 'data/MyFileMedium.txt'), expected, 'miss')
+        self.assertEqual(fetch(proxyPort, 'data/MyFileMedium.txt'), expected, 'hit')
+        self.assertEqual(self.proxy.cache.stats()['hits'], 1)
+        self.assertRaises(Exception, fetch, proxyPort, 'data/NoSuchFile.txt')
+
+
+if __name__ == "__main__":
+    unittest.main()
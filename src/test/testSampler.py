@@ -0,0 +1,92 @@
+'''
+Tests for the tail-latency sampler.
+'''
+import unittest
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.server import sampler
+from tftpud.server import readoperation
+import mocksocket
+from stubserver import StubServer
+
+
+class TestTailSampler(unittest.TestCase):
+
+    def complete(self, uut, duration, retransmits = 0):
+        timeline = uut.newTimeline('RRQ', 'file', ('localhost', 1000))
+        timeline.started -= duration
+        if retransmits:
+            timeline.recordTimeout(1, retransmits)
+        timeline.complete()
+        return timeline
+
+    def testThresholds(self):
+        uut = sampler.TailSampler(minDuration=1.0, minRetransmits=5)
+        self.complete(uut, 0.1)
+        self.complete(uut, 0.1, retransmits=4)
+        slow = self.complete(uut, 2.0)
+        lossy = self.complete(uut, 0.1, retransmits=5)
+
+        self.assertEqual(uut.samples(), [slow, lossy], 'slowest first')
+        self.assertEqual(uut.stats(), {'transfers' : 4, 'qualified' : 2, 'sampled' : 2})
+
+    def testReservoirBounded(self):
+        uut = sampler.TailSampler(minDuration=0, reservoirSize=5)
+        timelines = [self.complete(uut, 0.1) for i in range(0, 100)]
+        samples = uut.samples()
+        self.assertEqual(len(samples), 5)
+        for timeline in samples:
+            self.assertTrue(timeline in timelines)
+        self.assertEqual(uut.stats()['qualified'], 100)
+
+    def testEventsBounded(self):
+        uut = sampler.TailSampler(maxEvents=3)
+        timeline = uut.newTimeline('RRQ', 'file', ('localhost', 1000))
+        for blockNum in range(0, 5):
+            timeline.record(sampler.ACK, blockNum)
+        self.assertEqual(len(timeline.events), 3)
+        self.assertEqual(timeline.droppedEvents, 2)
+
+
+class TestOperationTimeline(unittest.TestCase):
+
+    def testReadOperation(self):
+        s = mocksocket.MockSocket()
+        clientAddr = ('localhost', 12345)
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for blockNum in (1, 2, 3, 4):
+            ackPacket.blockNum = blockNum
+            rxData.append( (ackPacket.pack(), clientAddr) )
+        # Block 2 is lost: the wakeup of a timeout, then a retransmission.
+        rxData.insert(1, ('', clientAddr))
+        s.loadPendingRxData(rxData)
+
+        pkt = tftpmessages.ReadRequest()
+        pkt.fileName = os.path.join('data', 'MyFileMedium.txt') # 4 blocks
+        pkt.mode = 'octet'
+        tailSampler = sampler.TailSampler(minDuration=None, minRetransmits=1)
+        stub = StubServer()
+        stub.sampler = tailSampler
+        uut = readoperation.ReadOperation(s, clientAddr, pkt, server=stub)
+        uut.join()
+
+        timeline = tailSampler.samples()[0]
+        events = [(event, a) for offset, event, a, b in timeline.events]
+        self.assertEqual(events,
+                         [(sampler.SEND, tftpmessages.OPCODE_DATA), (sampler.ACK, 1),
+                          (sampler.SEND, tftpmessages.OPCODE_DATA),
+                          (sampler.TIMEOUT, 1), (sampler.RETRANSMIT, 1), (sampler.ACK, 2),
+                          (sampler.SEND, tftpmessages.OPCODE_DATA), (sampler.ACK, 3),
+                          (sampler.SEND, tftpmessages.OPCODE_DATA), (sampler.ACK, 4)])
+        self.assertEqual(timeline.retransmits, 1)
+        self.assertTrue('retransmit' in timeline.format())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+'''
+Tests for the server transfer scheduler.
+'''
+import unittest
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud.server import scheduler
+from tftpud.server import subnets
+
+
+class TestPriorityClass(unittest.TestCase):
+
+    def testFilePattern(self):
+        cls = scheduler.PriorityClass('config', 1, filePatterns=['*.cfg', 'pxelinux.0'])
+        self.assertTrue(cls.matches('host1.cfg', ('10.0.0.1', 1000)), 'pattern match')
+        self.assertTrue(cls.matches('pxelinux.0', ('10.0.0.1', 1000)), 'exact match')
+        self.assertFalse(cls.matches('vmlinuz', ('10.0.0.1', 1000)), 'no match')
+
+    def testSubnet(self):
+        cls = scheduler.PriorityClass('lab', 1, subnets=['192.168.10.0/24', 'fd00::/8'])
+        self.assertTrue(cls.matches('a', ('192.168.10.77', 1000)), 'in subnet')
+        self.assertFalse(cls.matches('a', ('192.168.11.77', 1000)), 'outside subnet')
+        self.assertTrue(cls.matches('a', ('fd12::1', 1000, 0, 0)), 'in IPv6 subnet')
+        self.assertFalse(cls.matches('a', ('localhost', 1000)), 'name never matches')
+
+    def testCatchAll(self):
+        cls = scheduler.PriorityClass('all')
+        self.assertTrue(cls.matches('anything', ('1.2.3.4', 1)), 'catch all')
+
+    def testInvalidSubnet(self):
+        self.assertRaises(Exception, subnets.parseSubnet, '10.0.0.0/33')
+
+
+class TestTransferScheduler(unittest.TestCase):
+
+    def setUp(self):
+        classes = [scheduler.PriorityClass('small', 1, filePatterns=['*.cfg'])]
+        self.uut = scheduler.TransferScheduler(classes, maxActive=1, quantum=2)
+
+    def testClassify(self):
+        self.assertEqual(self.uut.classify('a.cfg', None).name, 'small')
+        self.assertEqual(self.uut.classify('image.iso', None).name, 'default')
+
+    def testPriorityPreemptsAtEndOfQuantum(self):
+        bulk = self.uut.register('image.iso', None)
+        small = self.uut.register('a.cfg', None)
+
+        self.assertTrue(self.uut.waitTurn(bulk, 0), 'bulk gets the free slot')
+        self.assertFalse(self.uut.waitTurn(small, 0), 'no slot for small yet')
+        self.assertTrue(self.uut.waitTurn(bulk, 0), 'bulk finishes its quantum')
+
+        # Quantum used up with a more urgent transfer waiting: bulk must yield.
+        self.assertFalse(self.uut.waitTurn(bulk, 0), 'bulk yields')
+        self.assertTrue(self.uut.waitTurn(small, 0), 'small now sends')
+
+        self.uut.unregister(small)
+        self.assertTrue(self.uut.waitTurn(bulk, 0), 'bulk resumes')
+
+    def testRoundRobinWithinClass(self):
+        first = self.uut.register('one.iso', None)
+        second = self.uut.register('two.iso', None)
+
+        self.assertTrue(self.uut.waitTurn(first, 0))
+        self.assertFalse(self.uut.waitTurn(second, 0))
+        self.assertTrue(self.uut.waitTurn(first, 0))
+        self.assertFalse(self.uut.waitTurn(first, 0), 'first yields to second')
+        self.assertTrue(self.uut.waitTurn(second, 0))
+        self.assertTrue(self.uut.waitTurn(second, 0))
+        self.assertFalse(self.uut.waitTurn(second, 0), 'second yields to first')
+        self.assertTrue(self.uut.waitTurn(first, 0))
+
+    def testNoYieldWithoutWaiters(self):
+        only = self.uut.register('one.iso', None)
+        for i in range(0, 10):
+            self.assertTrue(self.uut.waitTurn(only, 0), 'turn ' + str(i))
+
+
+if __name__ == "__main__":
+    unittest.main()
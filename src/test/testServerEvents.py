@@ -0,0 +1,56 @@
+'''
+Tests for the events the operations post to the server thread.
+'''
+import unittest
+import threading
+import socket
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from loopbackclient import fetch, startServer
+
+
+class TestServerEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.server = startServer()
+
+    def tearDown(self):
+        self.server.stopServer()
+
+    def testPortReleased(self):
+        '''The operation is removed, and its socket closed, as soon as it
+        completes: the completion event wakes the server thread.'''
+        uut = self.server
+        operations = []
+        released = threading.Event()
+        processListenerData = uut.processListenerData
+        processEvents = uut.processEvents
+        def recordOperation(data, fromAddr):
+            processListenerData(data, fromAddr)
+            operations.extend(uut.ongoingOperations.values())
+        def watchEvents():
+            processEvents()
+            if operations and len(uut.ongoingOperations) == 0:
+                released.set()
+        uut.processListenerData = recordOperation
+        uut.processEvents = watchEvents
+
+        self.assertEqual(260, len(fetch(uut.config.listeningPort, 'data/MyFile.txt')))
+        finished = time.time()
+        self.assertTrue(released.wait(2))
+        self.assertTrue(time.time() - finished < 0.5)
+
+        self.assertEqual(1, len(operations))
+        operation = operations[0]
+        self.assertFalse(operation.is_alive())
+        self.assertFalse(uut.ongoingOperations.has_key(operation.port))
+        self.assertRaises(socket.error, operation.s.fileno) # closed
+        self.assertEqual(0, uut.metrics.activeTransfers.value())
+
+if __name__ == '__main__':
+    unittest.main()
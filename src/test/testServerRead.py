@@ -14,6 +14,7 @@ os.chdir(os.path.abspath(os.path.dirname(__file__)))
 from tftpud.server import readoperation
 from tftpud import tftpmessages
 import mocksocket
+from stubserver import StubServer
 
 
 class TestServerRead(unittest.TestCase):
@@ -23,14 +24,14 @@ class TestServerRead(unittest.TestCase):
         self.clientAddr = ('localhost', 12345)
         self.uut = None
         
-    def setupRrq(self, fileName='MyFile.txt', mode='octet', options = None):
+    def setupRrq(self, fileName='MyFile.txt', mode='octet', options = None, server = None):
         pkt = tftpmessages.ReadRequest()
         pkt.fileName = os.path.join('data', fileName)
         pkt.mode = mode
         if options is not None:
             pkt.options = options
         
-        self.uut = readoperation.ReadOperation(self.s, self.clientAddr, pkt)
+        self.uut = readoperation.ReadOperation(self.s, self.clientAddr, pkt, server=server)
 
     def tearDown(self):
         self.uut.abort(True)
@@ -153,6 +154,80 @@ class TestServerRead(unittest.TestCase):
         self.assertEqual(countData, 4, 'data count')
         self.assertEqual(countError, 1, 'error count')
         
+    def testDuplicateAckIgnored(self):
+        '''A single delayed duplicate ACK must not kill the transfer or cause
+        a retransmission.'''
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for i in [1, 1, 2, 3, 4]:
+            ackPacket.blockNum = i
+            rxData.append( (ackPacket.pack(), self.clientAddr) )
+        
+        self.s.loadPendingRxData( rxData )
+        
+        self.setupRrq(fileName='MyFileMedium.txt')
+        self.uut.join()
+        
+        self.assertEqual(self.s.countSend, 4, '4 data packets sent, no resend')
+        self.assertEqual(self.uut.duplicateAcks, 1, 'duplicate counted')
+        self.assertEqual(self.uut.fastRetransmits, 0, 'no fast retransmit')
+        self.assertEqual(self.s.sentData[-1][0][3], chr(4), 'transfer completed')
+        
+    def testFastRetransmit(self):
+        '''Two duplicate ACKs for block 1 (the client is still waiting for
+        block 2) cause block 2 to be resent without waiting for the timeout.'''
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for i in [1, 1, 1, 2, 3, 4]:
+            ackPacket.blockNum = i
+            rxData.append( (ackPacket.pack(), self.clientAddr) )
+        
+        self.s.loadPendingRxData( rxData )
+        
+        self.setupRrq(fileName='MyFileMedium.txt')
+        self.uut.join()
+        
+        self.assertEqual(self.s.countSend, 5, '4 data packets + 1 resend')
+        blockNums = [ord(d[3]) for d, addr in self.s.sentData]
+        self.assertEqual(blockNums, [1, 2, 2, 3, 4], 'block 2 resent')
+        self.assertEqual(self.uut.fastRetransmits, 1, 'one fast retransmit')
+        
+    def testWindowSize(self):
+        '''Negotiate a window of 4 blocks (RFC 7440). All 4 blocks are sent
+        before the single ACK.'''
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for i in [0, 4]:
+            ackPacket.blockNum = i
+            rxData.append( (ackPacket.pack(), self.clientAddr) )
+        
+        self.s.loadPendingRxData( rxData )
+        
+        self.setupRrq(fileName='MyFileMedium.txt', options={'windowsize':'4'})
+        self.uut.join()
+        
+        self.assertEqual(self.s.sentData[0][0], '\x00\x06windowsize\x004\x00', 'OACK')
+        blockNums = [ord(d[3]) for d, addr in self.s.sentData[1:]]
+        self.assertEqual(blockNums, [1, 2, 3, 4], 'one window of 4 blocks')
+        self.assertEqual(self.s.countRecv, 2, 'Rx count')
+        
+    def testWindowPartialAck(self):
+        '''An ACK for part of the window restarts the window after the
+        acknowledged block (RFC 7440).'''
+        ackPacket = tftpmessages.Acknowledgement()
+        rxData = []
+        for i in [0, 2, 4]:
+            ackPacket.blockNum = i
+            rxData.append( (ackPacket.pack(), self.clientAddr) )
+        
+        self.s.loadPendingRxData( rxData )
+        
+        self.setupRrq(fileName='MyFileMedium.txt', options={'windowsize':'4'})
+        self.uut.join()
+        
+        blockNums = [ord(d[3]) for d, addr in self.s.sentData[1:]]
+        self.assertEqual(blockNums, [1, 2, 3, 4, 3, 4], 'blocks 3 and 4 resent')
+        
     def testBlockCountWrap(self):
         '''This test will use a small block size (4 bytes) in order to encourage
         the block count to wrap around.
@@ -179,8 +254,11 @@ class TestServerRead(unittest.TestCase):
         
         self.s.loadPendingRxData( rxData )
         
+        # Below the RFC 2348 minimum, so the server must allow it
+        stub = StubServer()
+        stub.config.minBlockSize = 1
         optionsParam = {'blksize':'4'}
-        self.setupRrq(fileName='MyFileLarge.txt', options=optionsParam)
+        self.setupRrq(fileName='MyFileLarge.txt', options=optionsParam, server=stub)
         self.uut.join()
         
         # Check that 0x100001 packets were sent; one OACK, then all data blocks.
@@ -220,6 +298,47 @@ class TestServerRead(unittest.TestCase):
         self.assertEqual(pkt[1], chr(tftpmessages.OPCODE_ERR), 'Error packet')
         self.assertEqual(pkt[3], chr(tftpmessages.ERR_OPTION_FAIL), 'option failure')        
         
+    def testBlockSizeLimitedByMtu(self):
+        '''
+        Request a blksize larger than fits in the MTU. Expect the OACK to
+        offer the largest block size that does fit.
+        '''
+        rxData = []
+        ackPacket = tftpmessages.Acknowledgement()
+        for blockNum in (0, 1): # the OACK, then the one data block
+            ackPacket.blockNum = blockNum
+            rxData.append( (ackPacket.pack(), self.clientAddr) )
+        self.s.loadPendingRxData( rxData )
+        
+        stub = StubServer()
+        stub.config.mtu = 1500
+        self.setupRrq(fileName='MyFileMedium.txt', options={'blksize':'9000'}, server=stub)
+        self.uut.join()
+        
+        # 1500 - 20 (IPv4) - 8 (UDP) - 4 (TFTP) = 1468
+        oack = tftpmessages.create_tftp_packet_from_data(self.s.sentData[0][0])
+        self.assertEqual(oack.opcode, tftpmessages.OPCODE_OACK, 'OACK')
+        self.assertEqual(oack.options, {'blksize' : '1468'}, 'clamped to MTU')
+        dataPkt = tftpmessages.create_tftp_packet_from_data(self.s.sentData[1][0])
+        self.assertEqual(len(dataPkt.dataBlock), 1468, 'full block')
+        
+    def testBlockSizeBelowMinimum(self):
+        '''
+        Request a blksize below the RFC 2348 minimum of 8 bytes. Expect the
+        option to be declined: no OACK, and 512 byte blocks.
+        '''
+        ackPacket = tftpmessages.Acknowledgement()
+        ackPacket.blockNum = 1
+        self.s.loadPendingRxData( [(ackPacket.pack(), self.clientAddr)] )
+        
+        self.setupRrq(options={'blksize':'4'})
+        self.uut.join()
+        
+        self.assertEqual(self.s.countSend, 1, '1 packet sent')
+        dataPkt = tftpmessages.create_tftp_packet_from_data(self.s.sentData[0][0])
+        self.assertEqual(dataPkt.opcode, tftpmessages.OPCODE_DATA, 'no OACK')
+        self.assertEqual(len(dataPkt.dataBlock), 260, 'the whole file')
+        
     def testTsizeOptions(self):
         '''
         Send a tsize = 0 option in the RRQ. Expect the OACK response to
@@ -13,6 +13,7 @@ os.chdir(os.path.abspath(os.path.dirname(__file__)))
 from tftpud.server import writeoperation
 from tftpud import tftpmessages
 import mocksocket
+from stubserver import StubServer
 
 class TestServerWrite(unittest.TestCase):
 
@@ -21,7 +22,8 @@ class TestServerWrite(unittest.TestCase):
         self.clientAddr = ('localhost', 12345)
         self.uut = None
         
-    def setupWrq(self, fileName='MyFileToWrite.txt', mode='octet', rmFile=True, options = None):
+    def setupWrq(self, fileName='MyFileToWrite.txt', mode='octet', rmFile=True, options = None,
+                 server = None):
         pkt = tftpmessages.WriteRequest()
         pkt.fileName = os.path.join('data', fileName)
         pkt.mode = mode
@@ -32,7 +34,7 @@ class TestServerWrite(unittest.TestCase):
         if rmFile and os.path.isfile(pkt.fileName):
             os.remove(pkt.fileName)
         
-        self.uut = writeoperation.WriteOperation(self.s, self.clientAddr, pkt)
+        self.uut = writeoperation.WriteOperation(self.s, self.clientAddr, pkt, server=server)
 
     def tearDown(self):
         self.uut.abort(True)
@@ -116,6 +118,32 @@ class TestServerWrite(unittest.TestCase):
         
         self.assertTrue(os.path.isfile(os.path.join('data','FourBlockFile.txt')), 'File not written')
         
+    def testDuplicateBlock(self):
+        '''A block resent after a lost ACK is acknowledged again, not
+        treated as out of sequence.'''
+        blocks = ['a' * 512, 'b' * 10]
+        dataPacket = tftpmessages.DataBlock()
+        rxData = []
+        for blockNum in (1, 1, 2):
+            dataPacket.blockNum = blockNum
+            dataPacket.dataBlock = blocks[blockNum - 1]
+            rxData.append( (dataPacket.pack(), self.clientAddr) )
+        self.s.loadPendingRxData( rxData )
+
+        self.setupWrq(fileName='DuplicateBlock.txt')
+        self.uut.join()
+
+        acks = []
+        for sentData, toAddr in self.s.sentData:
+            pkt = tftpmessages.create_tftp_packet_from_data(sentData)
+            self.assertEqual(tftpmessages.OPCODE_ACK, pkt.opcode)
+            acks.append(pkt.blockNum)
+        self.assertEqual([0, 1, 1, 2], acks)
+        fileName = os.path.join('data', 'DuplicateBlock.txt')
+        with open(fileName, 'rb') as f:
+            self.assertEqual(''.join(blocks), f.read())
+        os.remove(fileName)
+
     def testIncorrectSourcePort(self):
         # Set up the data that will be received.
         dataPacket = tftpmessages.DataBlock()
@@ -173,8 +201,11 @@ class TestServerWrite(unittest.TestCase):
         
         self.s.loadPendingRxData( rxData )
         
+        # Below the RFC 2348 minimum, so the server must allow it
+        stub = StubServer()
+        stub.config.minBlockSize = 1
         optionsParam = {'blksize':'4'}
-        self.setupWrq(fileName='MyLargeFileToWrite.txt', options=optionsParam)
+        self.setupWrq(fileName='MyLargeFileToWrite.txt', options=optionsParam, server=stub)
         self.uut.join()
         
         # Check that 0x10000 packets were sent; all acks.
@@ -209,6 +240,34 @@ class TestServerWrite(unittest.TestCase):
         self.assertGreaterEqual(len(pkt), 4, 'at least 4 bytes')
         self.assertEqual(pkt[1], chr(tftpmessages.OPCODE_ERR), 'Error packet')
         self.assertEqual(pkt[3], chr(tftpmessages.ERR_OPTION_FAIL), 'option failure')
+        
+    def testBlockSizeLimitedByMtu(self):
+        '''
+        Request a blksize larger than fits in the MTU. Expect the OACK to
+        offer the largest block size that does fit, and a block of that size
+        not to end the transfer.
+        '''
+        rxData = []
+        dataPacket = tftpmessages.DataBlock()
+        for blockNum, size in ((1, 1468), (2, 100)):
+            dataPacket.blockNum = blockNum
+            dataPacket.dataBlock = 'x' * size
+            rxData.append( (dataPacket.pack(), self.clientAddr) )
+        self.s.loadPendingRxData( rxData )
+        
+        stub = StubServer()
+        stub.config.mtu = 1500
+        self.setupWrq(fileName='MtuTransfer.txt', options={'blksize':'9000'}, server=stub)
+        self.uut.join()
+        
+        # 1500 - 20 (IPv4) - 8 (UDP) - 4 (TFTP) = 1468
+        oack = tftpmessages.create_tftp_packet_from_data(self.s.sentData[0][0])
+        self.assertEqual(oack.opcode, tftpmessages.OPCODE_OACK, 'OACK')
+        self.assertEqual(oack.options, {'blksize' : '1468'}, 'clamped to MTU')
+        self.assertEqual(self.s.countSend, 3, 'OACK and 2 ACKs')
+        fileName = os.path.join('data', 'MtuTransfer.txt')
+        self.assertEqual(os.path.getsize(fileName), 1568, 'file size')
+        os.remove(fileName)
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
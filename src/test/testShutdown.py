@@ -0,0 +1,98 @@
+'''
+Tests for stopping the server: straight away, or after draining the
+transfers in progress.
+'''
+import unittest
+import socket
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from loopbackclient import startServer
+
+
+class TestShutdown(unittest.TestCase):
+
+    def setUp(self):
+        self.server = startServer()
+        self.port = self.server.config.listeningPort
+        self.sockets = []
+
+    def tearDown(self):
+        self.server.stopServer()
+        for s in self.sockets:
+            s.close()
+
+    def startRead(self, fileName):
+        '''Send a RRQ, and return the socket once the first block arrives.'''
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(2)
+        self.sockets.append(s)
+        rrq = tftpmessages.ReadRequest()
+        rrq.fileName = fileName
+        rrq.mode = 'octet'
+        s.sendto(rrq.pack(), ('127.0.0.1', self.port))
+        data, fromAddr = s.recvfrom(1024)
+        self.assertEqual(tftpmessages.OPCODE_DATA,
+                         tftpmessages.create_tftp_packet_from_data(data).opcode)
+        return s, fromAddr
+
+    def testStop(self):
+        started = time.time()
+        self.server.stopServer()
+        self.assertTrue(time.time() - started < 0.5)
+
+    def testAbort(self):
+        for i in range(5):
+            self.startRead('data/MyFileLarge.txt') # never acknowledged
+        operations = self.server.ongoingOperations.values()
+        started = time.time()
+        self.server.stopServer()
+        self.assertTrue(time.time() - started < 1.0)
+        self.assertEqual(5, len(operations))
+        for operation in operations:
+            self.assertTrue(operation.abortRequested)
+            self.assertFalse(operation.is_alive())
+        self.assertEqual(0, self.server.metrics.activeTransfers.value())
+
+    def testDrainDeadline(self):
+        self.startRead('data/MyFileLarge.txt')
+        operation = self.server.ongoingOperations.values()[0]
+        started = time.time()
+        self.server.stopServer(drainTimeout=0.5)
+        self.assertTrue(0.5 <= time.time() - started < 1.5)
+        self.assertTrue(operation.abortRequested)
+
+    def testDrain(self):
+        s, serverTid = self.startRead('data/MyFile.txt') # one block
+        operation = self.server.ongoingOperations.values()[0]
+        started = time.time()
+        self.server.stopServer(blocking=False, drainTimeout=10)
+
+        # New requests are refused while the transfer finishes: the listener
+        # is closed.
+        time.sleep(0.1)
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(probe)
+        probe.settimeout(2)
+        probe.connect(('127.0.0.1', self.port)) # to see the ICMP port unreachable
+        rrq = tftpmessages.ReadRequest()
+        rrq.fileName = 'data/MyFile.txt'
+        rrq.mode = 'octet'
+        probe.send(rrq.pack())
+        self.assertRaises(socket.error, probe.recv, 1024)
+
+        ack = tftpmessages.Acknowledgement()
+        ack.blockNum = 1
+        s.sendto(ack.pack(), serverTid)
+        self.server.serverThread.join(5)
+        self.assertFalse(self.server.serverThread.is_alive())
+        self.assertTrue(time.time() - started < 2)
+        self.assertFalse(operation.abortRequested)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+'''
+Tests for the range option and striped reads.
+'''
+import unittest
+import tempfile
+import shutil
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud.server import server
+from tftpud.client import client
+from tftpud.client import readoperation
+from loopbackclient import startServer
+
+
+def readData(fileName):
+    with open(os.path.join('data', fileName), 'rb') as f:
+        return f.read()
+
+class TestStripedRead(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.localFile = os.path.join(self.tempDir, 'copy')
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.stopServer()
+        shutil.rmtree(self.tempDir)
+
+    def startServer(self, allowRange):
+        config = server.ServerConfig('127.0.0.1')
+        config.allowRange = allowRange
+        self.server = startServer(config)
+        config = client.ClientConfig(('127.0.0.1', config.listeningPort))
+        config.blkSize = 1024
+        config.minStripeSize = 50000
+        return client.Client(config)
+
+    def readRange(self, uut, fileName, requested):
+        chunks = []
+        s, serverAddr = uut.createSocket()
+        try:
+            op = readoperation.ReadOperation(s, uut.config, fileName,
+                                             lambda data: chunks.append(data.tobytes()),
+                                             serverAddr)
+            op.requestOptions = {'range' : requested}
+            op.run()
+        finally:
+            s.close()
+        self.assertEqual(None, op.error)
+        return op, ''.join(chunks)
+
+    def testRange(self):
+        uut = self.startServer(True)
+        data = readData('MyFileMedium.txt')
+        op, received = self.readRange(uut, 'data/MyFileMedium.txt', '100-1123')
+        self.assertEqual((100, 1123), op.range)
+        self.assertEqual(data[100:1124], received) # two full blocks and an empty one
+        op, received = self.readRange(uut, 'data/MyFileMedium.txt', '1500-')
+        self.assertEqual((1500, 1560), op.range)
+        self.assertEqual(data[1500:], received)
+        op, received = self.readRange(uut, 'data/MyFileMedium.txt', '5000-6000')
+        self.assertEqual(None, op.range) # declined: the whole file
+        self.assertEqual(data, received)
+
+    def testMalformedRange(self):
+        uut = self.startServer(True)
+        for requested in ('abc', '5', '-3', '1-x'):
+            op, received = self.readRange(uut, 'data/MyFileMedium.txt', requested)
+            self.assertEqual(None, op.range)
+            self.assertEqual(readData('MyFileMedium.txt'), received)
+
+    def testRangeNotAllowed(self):
+        uut = self.startServer(False)
+        op, received = self.readRange(uut, 'data/MyFileMedium.txt', '100-199')
+        self.assertEqual(None, op.range)
+        self.assertEqual(readData('MyFileMedium.txt'), received)
+
+    def testStriped(self):
+        uut = self.startServer(True)
+        ops = uut.readStriped('data/MyFileLarge.txt', self.localFile)
+        self.assertEqual(4, len(ops))
+        self.assertEqual([(0, 65535), (65536, 131071), (131072, 196607), (196608, 262142)],
+                         [op.range for op in ops])
+        self.assertEqual(readData('MyFileLarge.txt'), open(self.localFile, 'rb').read())
+
+    def testFallback(self):
+        uut = self.startServer(False)
+        ops = uut.readStriped('data/MyFileLarge.txt', self.localFile)
+        self.assertEqual(1, len(ops))
+        self.assertEqual(readData('MyFileLarge.txt'), open(self.localFile, 'rb').read())
+
+    def testSmallFile(self):
+        uut = self.startServer(True)
+        ops = uut.readStriped('data/MyFileMedium.txt', self.localFile)
+        self.assertEqual(1, len(ops))
+        self.assertEqual(readData('MyFileMedium.txt'), open(self.localFile, 'rb').read())
+
+if __name__ == '__main__':
+    unittest.main()
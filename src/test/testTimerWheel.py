@@ -0,0 +1,112 @@
+'''
+Tests for the hierarchical timer wheel.
+'''
+import unittest
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import timerwheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.uut = timerwheel.TimerWheel(slotsPerLevel=16, levels=3, clock=self.clock)
+        self.fired = []
+
+    def callback(self, name):
+        self.fired.append((name, self.clock.now))
+
+    def advanceTo(self, t):
+        self.clock.now = t
+        self.uut.advance()
+
+    def testFiresInOrder(self):
+        self.uut.schedule(0.005, self.callback, 'b')
+        self.uut.schedule(0.002, self.callback, 'a')
+        self.uut.schedule(0.100, self.callback, 'c') # on the second wheel
+        self.assertEqual(len(self.uut), 3, 'three pending')
+
+        self.advanceTo(1000.001)
+        self.assertEqual(self.fired, [], 'nothing yet')
+        self.advanceTo(1000.005)
+        self.assertEqual([f[0] for f in self.fired], ['a', 'b'], 'a then b')
+        self.advanceTo(1000.099)
+        self.assertEqual(len(self.fired), 2, 'c not early')
+        self.advanceTo(1000.100)
+        self.assertEqual([f[0] for f in self.fired], ['a', 'b', 'c'], 'c fired')
+        self.assertEqual(len(self.uut), 0, 'none pending')
+
+    def testNotEarly(self):
+        '''Scheduled between ticks: the timer fires at the first tick after
+        the delay, not a tick early.'''
+        self.clock.now = 1000.0004
+        self.uut.schedule(0.001, self.callback, 'a')
+        self.advanceTo(1000.0013)
+        self.assertEqual(self.fired, [], 'not early')
+        self.advanceTo(1000.002)
+        self.assertEqual([f[0] for f in self.fired], ['a'], 'fired')
+
+    def testCancel(self):
+        timer = self.uut.schedule(0.010, self.callback, 'x')
+        self.assertTrue(timer.pending(), 'pending')
+        timer.cancel()
+        self.assertFalse(timer.pending(), 'cancelled')
+        self.advanceTo(1001.0)
+        self.assertEqual(self.fired, [], 'cancelled timer did not fire')
+
+    def testOuterWheelsAndOutOfRange(self):
+        # 16 * 16 * 16 ms is the range of the wheel. Go beyond it.
+        delays = [0.017, 0.300, 4.095, 4.096, 10.0]
+        for d in delays:
+            self.uut.schedule(d, self.callback, d)
+        self.advanceTo(1011.0)
+        self.assertEqual([f[0] for f in self.fired], delays, 'all fired in order')
+
+    def testExpiryAccuracy(self):
+        for d in (0.003, 0.031, 0.257, 2.5):
+            self.fired = []
+            start = self.clock.now
+            self.uut.schedule(d, self.callback, d)
+            # Step one millisecond at a time, recording when it fires.
+            while len(self.fired) == 0:
+                self.advanceTo(self.clock.now + 0.001)
+            self.assertAlmostEqual(self.fired[0][1] - start, d, delta=0.0015)
+
+    def testRescheduleFromCallback(self):
+        def again(n):
+            self.fired.append(n)
+            if n < 3:
+                self.uut.schedule(0.001, again, n + 1)
+        self.uut.schedule(0.001, again, 1)
+        for i in range(0, 5):
+            self.advanceTo(self.clock.now + 0.001)
+        self.assertEqual(self.fired, [1, 2, 3], 'chained timers')
+
+    def testThread(self):
+        wheel = timerwheel.TimerWheel()
+        fired = []
+        wheel.start()
+        try:
+            wheel.schedule(0.02, fired.append, 1)
+            time.sleep(0.2)
+        finally:
+            wheel.stop()
+        self.assertEqual(fired, [1], 'fired by the wheel thread')
+
+
+if __name__ == "__main__":
+    unittest.main()
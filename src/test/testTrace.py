@@ -0,0 +1,109 @@
+'''
+Tests for packet trace recording and replay.
+'''
+import unittest
+import tempfile
+import shutil
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpmessages
+from tftpud.server import server
+from tftpud.server import trace
+from tftpud.server import replay
+from loopbackclient import fetch, startServer
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.traceFile = os.path.join(self.tempDir, 'trace.bin')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def startServer(self, traceFile = None):
+        config = server.ServerConfig('127.0.0.1')
+        config.traceFile = traceFile
+        uut = startServer(config)
+        return config.listeningPort, uut
+
+    def waitForTransfers(self, uut):
+        # The last ACK may still be on its way to the server
+        deadline = time.time() + 5
+        while uut.metrics.activeTransfers.value() > 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+    def testRecord(self):
+        port, uut = self.startServer(self.traceFile)
+        try:
+            fetch(port, 'data/MyFileMedium.txt') # 4 blocks
+            self.assertRaises(Exception, fetch, port, 'data/NoSuchFile.txt')
+            self.waitForTransfers(uut)
+        finally:
+            uut.stopServer()
+
+        wallStart, transfers = trace.readTrace(self.traceFile)
+        self.assertEqual(len(transfers), 2)
+        transfer = transfers[0]
+        self.assertEqual(transfer.clientAddr[0], '127.0.0.1')
+        self.assertTrue(transfer.ended is not None)
+        directions = [direction for offset, direction, data in transfer.datagrams]
+        self.assertEqual(directions, [trace.INBOUND] + [trace.OUTBOUND, trace.INBOUND] * 4)
+        rrq = tftpmessages.create_tftp_packet_from_data(transfer.request())
+        self.assertEqual(rrq.fileName, 'data/MyFileMedium.txt')
+        offsets = [offset for offset, direction, data in transfer.datagrams]
+        self.assertEqual(offsets, sorted(offsets))
+
+        error = transfers[1].datagrams[1][2]
+        self.assertEqual(tftpmessages.create_tftp_packet_from_data(error).opcode,
+                         tftpmessages.OPCODE_ERR)
+
+    def testTruncatedTrace(self):
+        writer = trace.TraceWriter(self.traceFile)
+        writer.newTransfer(('127.0.0.1', 1000), 'request')
+        writer.write(trace.OUTBOUND, 1, 'response')
+        writer.close()
+        with open(self.traceFile, 'r+b') as f:
+            f.truncate(os.path.getsize(self.traceFile) - 3)
+
+        wallStart, transfers = trace.readTrace(self.traceFile)
+        self.assertEqual(transfers[0].datagrams[0][1:], (trace.INBOUND, 'request'),
+                         'partial record ignored')
+        self.assertEqual(len(transfers[0].datagrams), 1)
+
+    def testReplay(self):
+        port, uut = self.startServer(self.traceFile)
+        try:
+            for i in range(0, 3):
+                fetch(port, 'data/MyFileMedium.txt')
+            self.waitForTransfers(uut)
+        finally:
+            uut.stopServer()
+
+        wallStart, transfers = trace.readTrace(self.traceFile)
+        port, uut = self.startServer()
+        try:
+            replayer = replay.TraceReplayer(transfers, ('127.0.0.1', port), speed=10,
+                                            timeout=2)
+            results = replayer.run()
+        finally:
+            uut.stopServer()
+
+        self.assertEqual(len(results), 3)
+        for result in results:
+            self.assertTrue(result.duration is not None, result.error)
+            self.assertEqual(result.sent, 5, 'the RRQ and 4 ACKs')
+            self.assertEqual(result.received, 4)
+            self.assertEqual(result.mismatches, 0)
+            self.assertEqual(result.stalls, 0)
+        self.assertTrue('3 transfers replayed' in replay.summarize(results, replayer.duration))
+
+
+if __name__ == "__main__":
+    unittest.main()
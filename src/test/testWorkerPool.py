@@ -0,0 +1,111 @@
+'''
+Tests for the worker pool that runs the server's operations.
+'''
+import unittest
+import threading
+import time
+
+# Import the project root and set this to be the current working directory
+import sys, os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+os.chdir(os.path.abspath(os.path.dirname(__file__)))
+
+from tftpud import tftpoperation
+from tftpud.server import server
+from tftpud.server import workerpool
+from loopbackclient import fetch, startServer
+
+
+class StubOperation(tftpoperation.TftpOperation):
+    '''Records the thread it runs on; optionally waits for a release.'''
+
+    def __init__(self, release = None):
+        tftpoperation.TftpOperation.__init__(self)
+        self.release = release
+        self.running = threading.Event()
+        self.ranOn = None
+
+    def runImpl(self):
+        self.ranOn = threading.current_thread().name
+        self.running.set()
+        if self.release is not None:
+            self.release.wait(5)
+
+class TestWorkerPool(unittest.TestCase):
+
+    def testRunsQueued(self):
+        uut = workerpool.WorkerPool(2, 10)
+        uut.start()
+        try:
+            operations = [StubOperation() for i in range(6)]
+            for op in operations:
+                op.pool = uut
+                op.start()
+            for op in operations:
+                op.join(5)
+                self.assertTrue(op.ranOn.startswith('tftpud-worker-'))
+        finally:
+            uut.stop()
+
+    def testAbortedWhileQueued(self):
+        uut = workerpool.WorkerPool(1, 10)
+        op = StubOperation()
+        op.pool = uut
+        op.start() # queued: no worker is running yet
+        op.abortRequested = True
+        uut.start()
+        try:
+            op.join(5)
+            self.assertFalse(op.is_alive())
+            self.assertEqual(None, op.ranOn)
+        finally:
+            uut.stop()
+
+    def testStop(self):
+        uut = workerpool.WorkerPool(3, 10)
+        uut.start()
+        workers = list(uut.workers)
+        op = StubOperation()
+        op.pool = uut
+        op.start()
+        uut.stop()
+        self.assertEqual([], uut.workers)
+        for worker in workers:
+            self.assertFalse(worker.is_alive())
+        self.assertFalse(op.is_alive()) # queued operations are run first
+
+    def testServerBusy(self):
+        config = server.ServerConfig('127.0.0.1')
+        config.workerThreads = 1
+        config.workerQueueDepth = 1
+        uut = startServer(config)
+        release = threading.Event()
+        try:
+            # Occupy the worker, and fill the queue.
+            blocking = StubOperation(release)
+            uut.pool.submit(blocking)
+            blocking.running.wait(5)
+            queued = StubOperation()
+            uut.pool.submit(queued)
+            self.assertTrue(uut.pool.isFull())
+
+            try:
+                fetch(config.listeningPort, 'data/MyFile.txt')
+                self.fail('Expected the request to be refused')
+            except Exception, e:
+                self.assertEqual('Server busy', str(e).rstrip('\0'))
+            # Counted just after the error is sent
+            deadline = time.time() + 5
+            while uut.metrics.refused.value() == 0 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(1, uut.metrics.refused.value())
+
+            release.set()
+            queued.running.wait(5)
+            self.assertEqual(260, len(fetch(config.listeningPort, 'data/MyFile.txt')))
+        finally:
+            release.set()
+            uut.stopServer()
+
+if __name__ == '__main__':
+    unittest.main()
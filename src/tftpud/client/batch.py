@@ -0,0 +1,377 @@
+'''
+Batch downloads: many files from many servers at once, on one thread.
+
+BatchClient.fetchMany() runs the read requests as non-blocking transfers
+driven by a single poll() loop, rather than a thread per transfer. At most
+maxConcurrent transfers run at once and at most maxPerServer to any one
+server; the waiting requests are started from each server in turn. The
+result of each transfer is yielded as soon as it completes. The transfers
+share the loop, the server address lookups and one receive buffer.
+
+Each transfer has a socket of its own (a new TID, as RFC 1350 requires): a
+reused socket could take a late retransmission from the previous transfer
+for the first block of the next.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import os
+import socket
+import select
+import struct
+import errno
+import collections
+
+from .. import tftpmessages
+from .. import clock
+import rtt
+import clientoperation
+from clientoperation import ServerError
+
+class FetchResult:
+    '''The outcome of one read request.'''
+
+    def __init__(self, serverAddr, fileName, output, options = None):
+        self.serverAddr = serverAddr
+        self.fileName = fileName
+        self.output = output
+        self.options = options or {} # more options for the request (e.g. range)
+        self.ok = False
+        self.error = None # the exception, if the transfer failed
+        self.data = None # the file, when no output was given
+        self.bytes = 0
+        self.blockSize = 512
+        self.transferSize = None # the tsize reported by the server
+        self.range = None # the (first, last) byte range acknowledged by the server
+        self.timeouts = 0
+        self.duration = None # seconds
+
+class BatchTransfer:
+    '''A read request in progress, driven by the BatchClient's loop.'''
+
+    def __init__(self, batch, result, serverAddr):
+        self.batch = batch
+        self.config = batch.config
+        self.result = result
+        self.serverAddr = serverAddr # resolved
+        self.peer = None # the server's TID, once it has answered
+        family = socket.AF_INET6 if ':' in serverAddr[0] else socket.AF_INET
+        self.s = socket.socket(family, socket.SOCK_DGRAM)
+        self.s.setblocking(0)
+        self.fd = self.s.fileno()
+        self.rtt = rtt.RttEstimator(self.config.timeout, self.config.minTimeout,
+                                    self.config.maxTimeout)
+        self.options = {}
+        self.blockSize = 512
+        self.windowSize = 1
+        self.expected = 1 # the next block, not wrapped to 16 bits
+        self.sinceAck = 0
+        self.gapAcked = False
+        self.negotiated = False
+        self.lastSent = None
+        self.retries = 0
+        self.deadline = None
+        self.started = clock.monotonic()
+        self.f = None # a file opened for the output
+        self.chunks = None # the data, when there is no output
+        self.write = None
+
+    def start(self):
+        output = self.result.output
+        if output is None:
+            self.chunks = []
+            self.write = lambda data: self.chunks.append(data.tobytes())
+        elif isinstance(output, basestring):
+            self.f = open(output, 'wb')
+            self.write = self.f.write
+        elif hasattr(output, 'write'):
+            self.write = output.write
+        else:
+            self.write = output
+
+        rrq = tftpmessages.ReadRequest()
+        rrq.fileName = self.result.fileName
+        rrq.mode = self.batch.mode
+        rrq.options = self.requestOptions()
+        self.options = rrq.options
+        self.send(rrq.pack(), True)
+
+    def requestOptions(self):
+        '''The options of the read request: those of the configuration, and
+        the result's own.'''
+        options = clientoperation.requestOptions(self.config)
+        options.update(clientoperation.readOptions(self.config))
+        options.update(self.result.options)
+        return options
+
+    def rto(self):
+        '''The seconds to wait before resending.'''
+        if self.config.adaptiveTimeout:
+            return self.rtt.rto
+        return self.config.timeout
+
+    def send(self, data, reliably):
+        '''Send a packet; if reliably, it is resent until the response arrives.'''
+        try:
+            self.s.sendto(data, self.peer or self.serverAddr)
+        except socket.error:
+            pass # treated as a lost packet
+        if reliably:
+            self.lastSent = data
+            self.rtt.sent()
+            self.retries = 0
+            self.deadline = clock.monotonic() + self.rto()
+
+    def ack(self, blockNum, reliably):
+        ack = tftpmessages.Acknowledgement()
+        ack.blockNum = blockNum & 0xffff
+        self.send(ack.pack(), reliably)
+
+    def sendError(self, errCode, errMsg, addr = None):
+        errPkt = tftpmessages.Error()
+        errPkt.errorCode = errCode
+        errPkt.errorMsg = errMsg
+        try:
+            self.s.sendto(errPkt.pack(), addr or self.peer or self.serverAddr)
+        except socket.error:
+            pass
+
+    def responseArrived(self):
+        '''The first packet answering the last one sent has arrived.'''
+        self.rtt.arrived(self.retries > 0)
+
+    def onTimeout(self):
+        self.retries += 1
+        self.result.timeouts += 1
+        if self.retries > self.config.retries:
+            self.finish(clientoperation.ServerTimeout())
+            return
+        if self.config.adaptiveTimeout:
+            self.rtt.backoff()
+        try:
+            self.s.sendto(self.lastSent, self.peer or self.serverAddr)
+        except socket.error:
+            pass
+        self.deadline = clock.monotonic() + self.rto()
+
+    def onReadable(self, packet):
+        '''Process the datagrams waiting on the socket, using the shared
+        packet buffer.'''
+        while self.deadline is not None:
+            try:
+                n, fromAddr = self.s.recvfrom_into(packet)
+            except socket.error, e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            if self.peer is None:
+                if fromAddr[0] != self.serverAddr[0]:
+                    continue
+                self.peer = fromAddr
+            elif fromAddr != self.peer:
+                self.sendError(tftpmessages.ERR_UNKNOWN_TID, 'Unknown transfer ID', fromAddr)
+                continue
+            if n < 4:
+                self.sendError(tftpmessages.ERR_ILLEGAL_TFTP_OPERATION, 'Invalid packet')
+                self.finish(Exception('Invalid packet from the server'))
+                return
+            self.onPacket(packet, n)
+
+    def onPacket(self, packet, n):
+        opcode, blockNum = struct.unpack_from('>HH', packet)
+        if opcode == tftpmessages.OPCODE_DATA:
+            if blockNum == self.expected & 0xffff:
+                if self.sinceAck == 0:
+                    self.responseArrived()
+                size = n - 4
+                if size > 0:
+                    self.write(memoryview(packet)[4:n])
+                self.result.bytes += size
+                self.expected += 1
+                self.sinceAck += 1
+                self.gapAcked = False
+                if size < self.blockSize:
+                    self.ack(blockNum, False)
+                    self.finish(None)
+                elif self.sinceAck >= self.windowSize:
+                    self.ack(blockNum, True)
+                    self.sinceAck = 0
+                else:
+                    # If the rest of the window is lost, acknowledge the
+                    # blocks received so far (RFC 7440).
+                    ack = tftpmessages.Acknowledgement()
+                    ack.blockNum = blockNum
+                    self.lastSent = ack.pack()
+                    self.retries = 0
+                    self.deadline = clock.monotonic() + self.rto()
+            elif blockNum == (self.expected - 1) & 0xffff:
+                # The server resent the last block: our ACK was lost.
+                self.ack(blockNum, False)
+            elif not self.gapAcked:
+                # A block is missing: acknowledge the blocks before it once.
+                self.ack(self.expected - 1, False)
+                self.rtt.cancel()
+                self.sinceAck = 0
+                self.gapAcked = True
+        elif opcode == tftpmessages.OPCODE_OACK and self.expected == 1:
+            if not self.negotiated:
+                pkt = tftpmessages.create_tftp_packet_from_data(bytes(packet[:n]))
+                try:
+                    self.acceptOptions(pkt.options)
+                except Exception, e:
+                    self.sendError(tftpmessages.ERR_OPTION_FAIL, str(e))
+                    self.finish(e)
+                    return
+                self.negotiated = True
+                self.responseArrived()
+                self.ack(0, True)
+            else:
+                self.ack(0, False)
+        elif opcode == tftpmessages.OPCODE_ERR:
+            pkt = tftpmessages.create_tftp_packet_from_data(bytes(packet[:n]))
+            self.finish(ServerError(pkt.errorCode, pkt.errorMsg.rstrip('\0')))
+
+    def acceptOptions(self, options):
+        '''Check and apply the options acknowledged by the server (see
+        clientoperation.checkOptions).'''
+        accepted = clientoperation.checkOptions(self.options, options)
+        if accepted.has_key('blksize'):
+            self.blockSize = accepted['blksize']
+            self.result.blockSize = self.blockSize
+        self.windowSize = accepted.get('windowsize', self.windowSize)
+        self.result.transferSize = accepted.get('tsize')
+        self.result.range = accepted.get('range')
+
+    def finish(self, error):
+        result = self.result
+        result.duration = clock.monotonic() - self.started
+        result.error = error
+        result.ok = error is None
+        self.deadline = None
+        if self.f is not None:
+            self.f.close()
+            if error is not None:
+                os.remove(result.output)
+        if self.chunks is not None and error is None:
+            result.data = ''.join(self.chunks)
+        self.batch.transferFinished(self)
+        self.s.close()
+
+class BatchClient:
+    '''
+    Downloads batches of files on one thread.
+    '''
+
+    def __init__(self, config, maxConcurrent = 64, maxPerServer = 8):
+        '''
+        config - a client.ClientConfig for the options, timeouts and retries
+                 of every transfer (its hostAddress is not used).
+        maxConcurrent - the most transfers running at once.
+        maxPerServer - the most transfers running at once to one server.
+        '''
+        self.config = config
+        self.maxConcurrent = max(1, maxConcurrent)
+        self.maxPerServer = max(1, maxPerServer)
+        self.mode = 'octet' # of every request; the data is not converted in netascii mode
+        self.packet = bytearray(max(512, config.blkSize) + 4) # shared by the transfers
+        self.addresses = {} # (host, port) -> the resolved address
+        self.transfers = {} # socket fileno -> BatchTransfer
+        self.perServer = collections.defaultdict(int) # resolved address -> transfers running
+        self.waiting = collections.OrderedDict() # resolved address -> deque of FetchResults
+        self.finished = collections.deque()
+        self.poller = None
+        self.peakConcurrent = 0
+
+    def resolve(self, serverAddr):
+        addr = self.addresses.get(serverAddr)
+        if addr is None:
+            host, port = serverAddr
+            addr = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0][4]
+            self.addresses[serverAddr] = addr
+        return addr
+
+    def fetchMany(self, requests):
+        '''Download files. requests is an iterable of (server address, file
+        name, output) tuples, where the server address is (host, port) and
+        the output is a local file name, a file object, a function called
+        with each block of data as a memoryview that is only valid during
+        the call, or None to keep the file in the result's data. A fourth
+        item, if any, is a dict of more options for the request (e.g.
+        {'range' : '0-1023'}). Yields a FetchResult for each request as its
+        transfer completes.'''
+        for request in requests:
+            result = FetchResult(*request)
+            try:
+                addr = self.resolve(result.serverAddr)
+            except socket.error, e:
+                result.error = e
+                self.finished.append(result)
+                continue
+            if addr not in self.waiting:
+                self.waiting[addr] = collections.deque()
+            self.waiting[addr].append(result)
+
+        self.poller = select.poll()
+        try:
+            while self.waiting or self.transfers or self.finished:
+                self.startTransfers()
+                while self.finished:
+                    yield self.finished.popleft()
+                if not self.transfers:
+                    continue
+
+                now = clock.monotonic()
+                wakeAt = min(t.deadline for t in self.transfers.values())
+                for fd, event in self.poller.poll(max(0, (wakeAt - now) * 1000)):
+                    transfer = self.transfers.get(fd)
+                    if transfer is not None:
+                        try:
+                            transfer.onReadable(self.packet)
+                        except Exception, e:
+                            if transfer.deadline is not None:
+                                transfer.finish(e)
+
+                now = clock.monotonic()
+                for transfer in self.transfers.values():
+                    if transfer.deadline is not None and now >= transfer.deadline:
+                        transfer.onTimeout()
+        finally:
+            for transfer in self.transfers.values():
+                transfer.finish(Exception('Batch abandoned'))
+            self.finished.clear()
+            self.poller = None
+
+    def startTransfers(self):
+        '''Start waiting requests, taking one from each server in turn, up
+        to the limits.'''
+        started = True
+        while started and self.waiting and len(self.transfers) < self.maxConcurrent:
+            started = False
+            for addr in self.waiting.keys():
+                if len(self.transfers) >= self.maxConcurrent:
+                    break
+                if self.perServer[addr] >= self.maxPerServer:
+                    continue
+                queue = self.waiting[addr]
+                result = queue.popleft()
+                if not queue:
+                    del self.waiting[addr]
+                self.startTransfer(result, addr)
+                started = True
+
+    def startTransfer(self, result, addr):
+        transfer = BatchTransfer(self, result, addr)
+        self.transfers[transfer.fd] = transfer
+        self.perServer[addr] += 1
+        self.peakConcurrent = max(self.peakConcurrent, len(self.transfers))
+        self.poller.register(transfer.fd, select.POLLIN)
+        try:
+            transfer.start()
+        except Exception, e:
+            transfer.finish(e)
+
+    def transferFinished(self, transfer):
+        del self.transfers[transfer.fd]
+        self.perServer[transfer.serverAddr] -= 1
+        if self.poller is not None:
+            self.poller.unregister(transfer.fd)
+        self.finished.append(transfer.result)
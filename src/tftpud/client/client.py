@@ -2,19 +2,38 @@
 Created on 25 Jan 2013
 
 @author: huw
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
 '''
+import os
 import socket
 
+import readoperation
+import writeoperation
+
 class ClientConfig:
     def __init__(self, hostAddress):
         self.hostAddress = hostAddress # A tuple of address, port
         self.blkSize = 512 # default 512
         self.timeout = 2 # RFC 2349 - seconds timeout before retry
         self.tsize = False # RFC 2349 - set true to enable tsize option
-        
+        self.windowSize = 1 # RFC 7440 - blocks sent before each ACK (1 for lock-step)
+        self.retries = 5 # retransmissions before a transfer fails
+        # Retransmit after the measured round trip time (within these limits,
+        # in seconds) rather than after the fixed timeout.
+        self.adaptiveTimeout = True
+        self.minTimeout = 0.05
+        self.maxTimeout = 30.0
+        self.bufferSize = 262144 # bytes of received data collected before each write
+        # Striped reads (see Client.readStriped): the most concurrent transfers
+        # for one file, and the smallest range worth a transfer of its own.
+        self.stripes = 4
+        self.minStripeSize = 1048576
+
 class Client:
     '''
-    A TFTP client.
+    A TFTP client. Each transfer uses a socket of its own, so its port (the
+    transfer ID) is new.
     '''
 
     def __init__(self, config):
@@ -22,13 +41,131 @@ class Client:
         Constructor
         '''
         self.config = config
-        self.s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def createSocket(self):
+        '''Return a socket for a transfer, and the server's address.'''
+        host, port = self.config.hostAddress
+        family, socktype, proto, name, serverAddr = socket.getaddrinfo(
+            host, port, 0, socket.SOCK_DGRAM)[0]
+        return socket.socket(family, socket.SOCK_DGRAM), serverAddr
+
+    def readRequest(self, fileName, output = None):
+        '''Download a file. The output is a local file name (by default the
+        name of the file on the server), a file object, or a function called
+        with each chunk of data as a memoryview that is only valid during the
+        call. Returns the completed readoperation.ReadOperation; raises an
+        exception if the transfer fails.'''
+        if output is None:
+            output = os.path.basename(fileName)
+        f = None
+        if isinstance(output, basestring):
+            f = open(output, 'wb')
+        s, serverAddr = self.createSocket()
+        try:
+            op = readoperation.ReadOperation(s, self.config, fileName,
+                                             f or output, serverAddr)
+            op.run()
+        finally:
+            s.close()
+            if f is not None:
+                f.close()
+        if op.error is not None:
+            if f is not None:
+                os.remove(output)
+            raise op.error
+        return op
+
+    def readStriped(self, fileName, localFile):
+        '''Download a file to a local file over several concurrent transfers,
+        each reading one stripe: a byte range of the file (the range option,
+        which the server must allow; see ServerConfig.allowRange). The first
+        request only learns the file size, and is cancelled. If the server
+        doesn't acknowledge the range, or the file is too small to be worth
+        striping, the first request reads the whole file instead. Returns
+        the completed ReadOperations; raises an exception if any fails.'''
+        plan = []
+        def planStripes(op):
+            if op.range is None or op.transferSize is None:
+                return True # not supported: read the file in one transfer
+            size = op.transferSize
+            numStripes = min(self.config.stripes, size // max(1, self.config.minStripeSize))
+            if numStripes < 2:
+                return True
+            # Stripes are whole numbers of blocks, so only the last ends
+            # with a short block.
+            blocks = (size + op.blockSize - 1) // op.blockSize
+            stripeSize = (blocks + numStripes - 1) // numStripes * op.blockSize
+            for first in range(0, size, stripeSize):
+                plan.append((first, min(size, first + stripeSize) - 1))
+            return False
+        
+        f = open(localFile, 'wb')
+        s, serverAddr = self.createSocket()
+        try:
+            op = readoperation.ReadOperation(s, self.config, fileName, f, serverAddr)
+            op.requestOptions = {'tsize' : '0', 'range' : '0-'}
+            op.onOptions = planStripes
+            op.run()
+            if op.cancelled:
+                f.truncate(op.transferSize)
+        finally:
+            s.close()
+            f.close()
+        if op.error is not None:
+            os.remove(localFile)
+            raise op.error
+        if not op.cancelled:
+            return [op]
         
-    def readRequest(self, fileName):
-        '''Initiate a read request operation'''
-        pass
+        ops = []
+        try:
+            for first, last in plan:
+                s, serverAddr = self.createSocket()
+                f = open(localFile, 'r+b')
+                f.seek(first)
+                op = readoperation.ReadOperation(s, self.config, fileName, f, serverAddr)
+                op.requestOptions = {'range' : '%d-%d' % (first, last)}
+                ops.append((op, s, f, (first, last)))
+                op.start()
+        finally:
+            error = None
+            for op, s, f, stripe in ops:
+                op.join()
+                s.close()
+                f.close()
+                if error is None:
+                    error = op.error
+                    if error is None and op.range != stripe:
+                        error = Exception('Stripe %d-%d of %s not acknowledged' %
+                                          (stripe[0], stripe[1], fileName))
+        if error is not None:
+            os.remove(localFile)
+            raise error
+        return [op for op, s, f, stripe in ops]
     
-    def writeRequest(self, fileName):
-        '''Initiate a write request operation'''
-        pass
-        
\ No newline at end of file
+    def writeRequest(self, fileName, source = None):
+        '''Upload a file. The source is a local file name (by default the
+        name of the file on the server), a file object, or an iterable of
+        byte strings. Returns the completed writeoperation.WriteOperation;
+        raises an exception if the transfer fails.'''
+        if source is None:
+            source = os.path.basename(fileName)
+        f = None
+        if isinstance(source, basestring):
+            f = open(source, 'rb')
+            source = f
+        if hasattr(source, 'read'):
+            source = writeoperation.FileSource(source)
+        else:
+            source = writeoperation.IterSource(source)
+        s, serverAddr = self.createSocket()
+        try:
+            op = writeoperation.WriteOperation(s, self.config, fileName, source, serverAddr)
+            op.run()
+        finally:
+            s.close()
+            if f is not None:
+                f.close()
+        if op.error is not None:
+            raise op.error
+        return op
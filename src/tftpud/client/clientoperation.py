@@ -0,0 +1,230 @@
+'''
+The parts of the client read and write operations that they share: the
+exchange of packets with the server's transfer ID, and retransmission after
+an adaptive timeout (see rtt). The options requested and the checks of the
+server's OACK are also used by the batch client (see batch).
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import socket
+
+from .. import tftpoperation
+from .. import tftpmessages
+from .. import clock
+import rtt
+
+class ServerError(Exception):
+    '''The server refused or ended the transfer with an error packet.'''
+
+    def __init__(self, errorCode, errorMsg):
+        Exception.__init__(self, 'Error from server: ' + errorMsg)
+        self.errorCode = errorCode
+        self.errorMsg = errorMsg
+
+def requestOptions(config):
+    '''The options of every request with the client.ClientConfig.'''
+    options = {}
+    if not config.timeout is None: # RFC 2349
+        options['timeout'] = str(int(max(1, config.timeout)))
+    if config.blkSize != 512: # the protocol default block size
+        options['blksize'] = str(config.blkSize)
+    return options
+
+def readOptions(config):
+    '''The further options of a read request with the configuration.'''
+    options = {}
+    if config.tsize: # RFC 2349
+        options['tsize'] = '0'
+    if config.windowSize > 1: # RFC 7440
+        options['windowsize'] = str(config.windowSize)
+    return options
+
+def checkOptions(requested, options):
+    '''
+    Check the options acknowledged by the server (RFC 2347) against those
+    requested. Returns them by lower case name: blksize, windowsize and tsize
+    as ints, range as (first, last) and any other as the string. Raises an
+    exception if the server acknowledged an option that wasn't requested, or
+    a value it may not: it may only reduce the blksize and windowsize.
+    '''
+    requested = dict((name.lower(), val) for name, val in requested.items())
+    accepted = {}
+    for name, val in options.items():
+        lowerCaseName = name.lower()
+        if not requested.has_key(lowerCaseName):
+            raise Exception('Unrequested option ' + name)
+        try:
+            if lowerCaseName in ('blksize', 'windowsize'): # RFC 2348, RFC 7440
+                value = int(val)
+                minimum = 8 if lowerCaseName == 'blksize' else 1
+                if value < minimum or value > int(requested[lowerCaseName]):
+                    raise ValueError()
+            elif lowerCaseName == 'tsize': # RFC 2349
+                value = int(val)
+            elif lowerCaseName == 'range': # tftpud extension (see ServerConfig.allowRange)
+                first, last = val.split('-', 1)
+                value = (int(first), int(last))
+            else:
+                value = val
+        except ValueError:
+            raise Exception('Invalid %s %s' % (lowerCaseName, val))
+        accepted[lowerCaseName] = value
+    return accepted
+
+class ServerTimeout(Exception):
+    '''The server didn't answer, after all the retransmissions.'''
+
+    def __init__(self):
+        Exception.__init__(self, 'Timed out waiting for the server')
+
+class ClientOperation(tftpoperation.TftpOperation):
+    '''
+    An abstract base class for the client operations.
+    '''
+
+    def __init__(self, sock, config, fileName, serverAddr, packetSize):
+        '''
+        Constructor
+        config - the client.ClientConfig.
+        serverAddr - the server's (address, port); config.hostAddress if None.
+        packetSize - the size of the buffer packets are received into.
+        '''
+        tftpoperation.TftpOperation.__init__(self)
+        self.s = sock
+        self.config = config
+        self.fileName = fileName
+
+        # The base class sends to the clientAddr: here it is the server, and
+        # then the server's transfer ID once the first response arrives.
+        self.clientAddr = serverAddr or config.hostAddress
+        self.peer = None
+        self.retries = config.retries
+        self.rtt = rtt.RttEstimator(config.timeout, config.minTimeout, config.maxTimeout)
+        self.setTimeout(self.rtt.rto)
+
+        self.mode = 'octet' # the data is not converted in netascii mode
+        self.options = {} # the options requested
+        self.requestOptions = {} # more options for the request (e.g. range)
+        self.blockSize = 512 # until negotiated
+        self.transferSize = None # the tsize acknowledged by the server
+        self.timeouts = 0
+        self.duration = None
+        self.error = None
+
+        self.packet = bytearray(packetSize)
+
+    def abort(self, block=True):
+        self.abortRequested = True
+        self.wakeup()
+        if block:
+            self.join()
+
+    def runImpl(self):
+        started = clock.monotonic()
+        try:
+            self.transfer()
+        except Exception, e:
+            self.error = e
+            raise
+        self.duration = clock.monotonic() - started
+
+    def transfer(self):
+        raise Exception('The transfer method must be overridden')
+
+    def sendRequest(self, request):
+        '''Send the RRQ or WRQ, with the options of the configuration.'''
+        request.fileName = self.fileName
+        request.mode = self.mode
+        request.options.update(requestOptions(self.config))
+        request.options.update(self.requestOptions)
+        self.options = request.options
+        self.sendPacket(request.pack())
+
+    def sendPacket(self, data):
+        '''Send a packet that is retransmitted until the response arrives.'''
+        self.rtt.sent()
+        self.sendReliably(data)
+
+    def sendErrorPkt(self, errCode, errMsg):
+        errPkt = tftpmessages.Error()
+        errPkt.errorCode = errCode
+        errPkt.errorMsg = errMsg
+        self.s.sendto(errPkt.pack(), self.clientAddr)
+
+    def responseArrived(self):
+        '''The first packet answering the last one sent has arrived.'''
+        self.rtt.arrived(self.retransmitCount > 0)
+        self.responseReceived()
+        if self.config.adaptiveTimeout:
+            self.setTimeout(self.rtt.rto)
+
+    def onRetransmit(self):
+        '''A timeout: the last packet has been resent.'''
+        self.timeouts += 1
+        if self.config.adaptiveTimeout:
+            self.rtt.backoff()
+            self.setTimeout(self.rtt.rto)
+
+    def receivePacket(self):
+        '''Wait for a packet from the server, retransmitting after each
+        timeout. Returns the length of the packet in the packet buffer.'''
+        while True:
+            try:
+                n, fromAddr = self.s.recvfrom_into(self.packet)
+            except socket.timeout:
+                if not self.responseTimeout():
+                    raise ServerTimeout()
+                continue
+
+            if n == 0:
+                # Woken up by an abort request.
+                if self.abortRequested:
+                    raise Exception('Operation aborted')
+                continue
+
+            if self.peer is None:
+                if fromAddr[0] != self.clientAddr[0]:
+                    continue
+                # The server answers from the port of the transfer (its TID).
+                self.peer = fromAddr
+                self.clientAddr = fromAddr
+            elif fromAddr != self.peer:
+                errPkt = tftpmessages.Error()
+                errPkt.errorCode = tftpmessages.ERR_UNKNOWN_TID
+                errPkt.errorMsg = 'Unknown transfer ID'
+                self.s.sendto(errPkt.pack(), fromAddr)
+                continue
+
+            if n < 4:
+                self.sendErrorPkt(tftpmessages.ERR_ILLEGAL_TFTP_OPERATION, 'Invalid packet')
+                raise Exception('Invalid packet from the server')
+            return n
+
+    def parsePacket(self, n):
+        '''Return the packet in the packet buffer as a tftpmessages object.'''
+        return tftpmessages.create_tftp_packet_from_data(bytes(self.packet[:n]))
+
+    def raiseServerError(self, n):
+        pkt = self.parsePacket(n)
+        raise ServerError(pkt.errorCode, pkt.errorMsg.rstrip('\0'))
+
+    def acceptOptions(self, options):
+        '''Check and apply the options acknowledged by the server (see
+        checkOptions).'''
+        try:
+            accepted = checkOptions(self.options, options)
+        except Exception, e:
+            self.sendErrorPkt(tftpmessages.ERR_OPTION_FAIL, str(e))
+            raise
+        for name, value in accepted.items():
+            if name == 'blksize':
+                self.blockSize = value
+            elif name == 'tsize':
+                self.transferSize = value
+            else:
+                self.acceptOption(name, value)
+
+    def acceptOption(self, name, value):
+        '''Apply another acknowledged option, checked by checkOptions. May be
+        overridden.'''
+        pass
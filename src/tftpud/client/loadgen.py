@@ -0,0 +1,340 @@
+'''
+A load generator for sizing TFTP servers: many simulated clients, arriving
+at a given rate, each reading a scripted sequence of files (for example the
+probe chain of a PXE boot, then a kernel and an initrd).
+
+A script is a list of steps, one per line:
+
+    pxelinux.0 blksize=1428 tsize=0
+    pxelinux.cfg/01-{mac} | pxelinux.cfg/{hexip} | pxelinux.cfg/default
+    ?optional/file
+    vmlinuz blksize=1428 windowsize=8
+
+Options (name=value) are sent with the request. A step of alternatives
+separated by '|' is a probe chain: the files are tried in turn until one is
+found, and only the failure of the whole chain counts. A step starting with
+'?' may fail without failing the client. {mac}, {hexip} and {client} are
+replaced with a MAC address, an IP address in hex (as pxelinux uses) and the
+number of each client.
+
+All the transfers run on one thread, waiting on their sockets with poll().
+They are batch.BatchTransfers, driven by the load generator's loop rather
+than a batch.BatchClient's so that the clients can arrive over time.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import select
+import random
+
+from .. import clock
+from ..stats import percentile
+import batch
+from client import ClientConfig
+
+PXELINUX_SCRIPT = '''
+pxelinux.0 blksize=1428 tsize=0
+pxelinux.cfg/01-{mac} | pxelinux.cfg/{hexip} | pxelinux.cfg/default
+vmlinuz blksize=1428 tsize=0
+initrd.img blksize=1428 tsize=0
+'''
+
+class Step:
+    '''A step of a script: one file, or a chain of alternatives.'''
+
+    def __init__(self, alternatives, optional = False):
+        self.alternatives = alternatives # [(file name template, {option: value})]
+        self.optional = optional
+
+def parseScript(text, defaultOptions = None):
+    '''Parse a script (see the module description) into a list of Steps.
+    defaultOptions are added to every request that doesn't set them.'''
+    steps = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        optional = line.startswith('?')
+        if optional:
+            line = line[1:]
+        alternatives = []
+        for alternative in line.split('|'):
+            words = alternative.split()
+            if not words:
+                raise Exception('Empty file name in script line: ' + line)
+            options = dict(defaultOptions or {})
+            for word in words[1:]:
+                if '=' not in word:
+                    raise Exception('Expected option=value in script line: ' + line)
+                name, value = word.split('=', 1)
+                options[name] = value
+            alternatives.append((words[0], options))
+        steps.append(Step(alternatives, optional))
+    return steps
+
+class Transfer(batch.BatchTransfer):
+    '''
+    A read request in progress, driven by the LoadGenerator's loop. The data
+    is counted, not kept.
+
+    Unlike a batch.BatchTransfer, the request carries only the options of
+    the script (as a boot ROM's would).
+    '''
+
+    def __init__(self, loadgen, client, template, fileName, options):
+        result = batch.FetchResult(loadgen.serverAddr, fileName, self.received, options)
+        batch.BatchTransfer.__init__(self, loadgen, result, loadgen.serverAddr)
+        self.client = client
+        self.template = template # the file name in the script
+        self.firstBlock = None # seconds from the request to the first data
+
+    def requestOptions(self):
+        return dict(self.result.options)
+
+    def received(self, data):
+        if self.firstBlock is None:
+            self.firstBlock = clock.monotonic() - self.started
+
+    def finish(self, error):
+        if error is None and self.firstBlock is None:
+            self.firstBlock = clock.monotonic() - self.started # an empty file
+        batch.BatchTransfer.finish(self, error)
+
+class TransferStats:
+    '''Counts and durations of transfers, kept for an interval or the run.'''
+
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.bytes = 0
+        self.timeouts = 0
+        self.durations = []
+        self.firstBlocks = []
+
+    def add(self, transfer):
+        result = transfer.result
+        self.timeouts += result.timeouts
+        if result.ok:
+            self.ok += 1
+            self.bytes += result.bytes
+            self.durations.append(result.duration)
+            self.firstBlocks.append(transfer.firstBlock)
+        else:
+            self.failed += 1
+
+def formatMs(value):
+    if value is None:
+        return '-'
+    return '%.1f' % (value * 1000)
+
+class ScriptedClient:
+    '''A client working through the script.'''
+
+    def __init__(self, number, steps):
+        self.number = number
+        self.steps = steps
+        self.stepIndex = 0
+        self.alternative = 0
+        self.started = None
+        self.finished = None
+        self.failed = False
+        mac = [0x52, 0x54, 0x00, (number >> 16) & 0xff, (number >> 8) & 0xff, number & 0xff]
+        self.substitutions = {'mac' : '-'.join('%02x' % b for b in mac),
+                              'hexip' : '0A%02X%02X%02X' % ((number >> 16) & 0xff,
+                                                            (number >> 8) & 0xff,
+                                                            number & 0xff),
+                              'client' : str(number)}
+
+    def nextRequest(self):
+        '''Return the (file name template, file name, options) of the next
+        request, or None when the script is finished.'''
+        if self.stepIndex >= len(self.steps):
+            return None
+        template, options = self.steps[self.stepIndex].alternatives[self.alternative]
+        return template, template.format(**self.substitutions), options
+
+    def requestFinished(self, error):
+        step = self.steps[self.stepIndex]
+        if error is not None and self.alternative + 1 < len(step.alternatives):
+            self.alternative += 1 # try the next file of the chain
+            return
+        if error is not None and not step.optional:
+            self.failed = True
+            self.stepIndex = len(self.steps)
+            return
+        self.stepIndex += 1
+        self.alternative = 0
+
+class LoadGenerator:
+    '''
+    Runs the clients against a server and reports on progress.
+    '''
+
+    def __init__(self, serverAddr, steps, numClients, rate = 0.0, timeout = 2.0,
+                 retries = 5, report = None, interval = 1.0, seed = None):
+        '''
+        serverAddr - the (address, port) of the server.
+        steps - the script, a list of Steps (see parseScript).
+        numClients - the number of clients to run.
+        rate - the clients arrive at random at this average rate per
+        second; with 0 they all start at once.
+        report - called with a line of text every interval seconds.
+        '''
+        self.serverAddr = serverAddr
+        self.steps = steps
+        self.numClients = numClients
+        self.rate = rate
+        # The timeout is fixed, as a boot ROM's is
+        self.config = ClientConfig(serverAddr)
+        self.config.timeout = timeout
+        self.config.retries = retries
+        self.config.adaptiveTimeout = False
+        self.mode = 'octet'
+        self.packet = bytearray(65536) # shared by the transfers
+        self.report = report
+        self.interval = interval
+        self.random = random.Random(seed)
+        self.transfers = {} # socket fileno -> Transfer
+        self.poller = select.poll()
+        self.clients = []
+        self.activeClients = 0
+        self.total = TransferStats()
+        self.current = TransferStats() # since the last report
+        self.byFile = {} # file name template -> TransferStats
+        self.started = None
+        self.bootTimes = []
+
+    def run(self):
+        '''Run every client to the end of its script. Returns the summary
+        (see summary()).'''
+        self.started = clock.monotonic()
+        nextArrival = self.started
+        nextReport = self.started + self.interval
+        lastReport = self.started
+        while len(self.clients) < self.numClients or self.activeClients > 0:
+            now = clock.monotonic()
+            while len(self.clients) < self.numClients and now >= nextArrival:
+                self.startClient(ScriptedClient(len(self.clients) + 1, self.steps))
+                if self.rate > 0:
+                    nextArrival += self.random.expovariate(self.rate)
+
+            wakeAt = nextReport
+            if len(self.clients) < self.numClients:
+                wakeAt = min(wakeAt, nextArrival)
+            for transfer in self.transfers.values():
+                wakeAt = min(wakeAt, transfer.deadline)
+            for fd, event in self.poller.poll(max(0, (wakeAt - clock.monotonic()) * 1000)):
+                transfer = self.transfers.get(fd)
+                if transfer is not None:
+                    try:
+                        transfer.onReadable(self.packet)
+                    except Exception, e:
+                        if transfer.deadline is not None:
+                            transfer.finish(e)
+
+            now = clock.monotonic()
+            for transfer in self.transfers.values():
+                if transfer.deadline is not None and now >= transfer.deadline:
+                    transfer.onTimeout()
+            if now >= nextReport:
+                self.reportProgress(now - lastReport)
+                lastReport = now
+                nextReport = now + self.interval
+        return self.summary()
+
+    def startClient(self, client):
+        client.started = clock.monotonic()
+        self.clients.append(client)
+        self.activeClients += 1
+        self.startNext(client)
+
+    def startNext(self, client):
+        request = client.nextRequest()
+        if request is None:
+            client.finished = clock.monotonic()
+            self.activeClients -= 1
+            if not client.failed:
+                self.bootTimes.append(client.finished - client.started)
+            return
+        template, fileName, options = request
+        transfer = Transfer(self, client, template, fileName, options)
+        self.transfers[transfer.fd] = transfer
+        self.poller.register(transfer.fd, select.POLLIN)
+        try:
+            transfer.start()
+        except Exception, e:
+            transfer.finish(e)
+
+    def transferFinished(self, transfer):
+        del self.transfers[transfer.fd]
+        self.poller.unregister(transfer.fd)
+        self.total.add(transfer)
+        self.current.add(transfer)
+        if transfer.template not in self.byFile:
+            self.byFile[transfer.template] = TransferStats()
+        self.byFile[transfer.template].add(transfer)
+        transfer.client.requestFinished(transfer.result.error)
+        self.startNext(transfer.client)
+
+    def reportProgress(self, elapsed):
+        if self.report is not None:
+            stats = self.current
+            self.report('%6.1fs clients %d/%d active %d  %6.2f MB/s  %5.1f req/s  '
+                        'failed %d  timeouts %d  p50 %s ms  p99 %s ms' %
+                        (clock.monotonic() - self.started,
+                         len(self.clients) - self.activeClients, self.numClients,
+                         self.activeClients, stats.bytes / elapsed / 1e6,
+                         (stats.ok + stats.failed) / elapsed, stats.failed, stats.timeouts,
+                         formatMs(percentile(stats.durations, 0.5)),
+                         formatMs(percentile(stats.durations, 0.99))))
+        self.current = TransferStats()
+
+    def summary(self):
+        '''Return a dict of the results of the run.'''
+        elapsed = clock.monotonic() - self.started
+        failedClients = len([c for c in self.clients if c.failed])
+        files = {}
+        for template, stats in self.byFile.items():
+            files[template] = {'ok' : stats.ok, 'failed' : stats.failed,
+                               'p50' : percentile(stats.durations, 0.5),
+                               'p99' : percentile(stats.durations, 0.99)}
+        return {'seconds' : elapsed,
+                'clients' : len(self.clients),
+                'failedClients' : failedClients,
+                'transfers' : self.total.ok + self.total.failed,
+                'failedTransfers' : self.total.failed,
+                'timeouts' : self.total.timeouts,
+                'bytes' : self.total.bytes,
+                'mbPerSec' : self.total.bytes / elapsed / 1e6,
+                'requestsPerSec' : (self.total.ok + self.total.failed) / elapsed,
+                'transferP50' : percentile(self.total.durations, 0.5),
+                'transferP90' : percentile(self.total.durations, 0.9),
+                'transferP99' : percentile(self.total.durations, 0.99),
+                'firstBlockP50' : percentile(self.total.firstBlocks, 0.5),
+                'firstBlockP99' : percentile(self.total.firstBlocks, 0.99),
+                'bootP50' : percentile(self.bootTimes, 0.5),
+                'bootP99' : percentile(self.bootTimes, 0.99),
+                'bootMax' : max(self.bootTimes) if self.bootTimes else None,
+                'files' : files}
+
+def formatSummary(summary):
+    '''Return the summary of a run as text.'''
+    lines = ['%d clients in %.1f s: %d failed' % (summary['clients'], summary['seconds'],
+                                                 summary['failedClients']),
+             '%d transfers (%d failed, %.1f%%), %d timeouts, %.2f MB/s, %.1f req/s' %
+             (summary['transfers'], summary['failedTransfers'],
+              100.0 * summary['failedTransfers'] / max(1, summary['transfers']),
+              summary['timeouts'], summary['mbPerSec'], summary['requestsPerSec']),
+             'transfer time ms: p50 %s  p90 %s  p99 %s' %
+             (formatMs(summary['transferP50']), formatMs(summary['transferP90']),
+              formatMs(summary['transferP99'])),
+             'time to first block ms: p50 %s  p99 %s' %
+             (formatMs(summary['firstBlockP50']), formatMs(summary['firstBlockP99'])),
+             'boot (whole script) ms: p50 %s  p99 %s  max %s' %
+             (formatMs(summary['bootP50']), formatMs(summary['bootP99']),
+              formatMs(summary['bootMax']))]
+    for template in sorted(summary['files']):
+        stats = summary['files'][template]
+        lines.append('  %-40s ok %6d  failed %6d  p50 %8s ms  p99 %8s ms' %
+                     (template, stats['ok'], stats['failed'],
+                      formatMs(stats['p50']), formatMs(stats['p99'])))
+    return '\n'.join(lines)
@@ -2,36 +2,149 @@
 Created on 25 Jan 2013
 
 @author: huw
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
 '''
+import struct
 
-from .. import tftpoperation
-from tftpud import tftpmessages
+from .. import tftpmessages
+import clientoperation
+from clientoperation import ServerError
 
-class ReadOperation(tftpoperation.TftpOperation):
-    '''
-    classdocs
+class ReadOperation(clientoperation.ClientOperation):
     '''
+    A client TFTP read operation: downloads a file from the server.
 
+    Each data packet is received into a preallocated packet buffer and its
+    data copied to a preallocated output buffer, which is passed to the
+    output as soon as it can't take another block (so with a config.bufferSize
+    of 0, every block as it arrives). The output is a file object (anything with a
+    write method) or a function; either is called with a memoryview that is
+    only valid during the call.
+    '''
 
-    def __init__(self, sock, config, fileName):
+    def __init__(self, sock, config, fileName, output, serverAddr = None):
         '''
         Constructor
+        config - the client.ClientConfig.
+        serverAddr - the server's (address, port); config.hostAddress by default.
         '''
-        self.s = sock
-        self.config = config
-        self.fileName = fileName
-    
-    def runImpl(self):
-        '''the thread func'''
+        clientoperation.ClientOperation.__init__(self, sock, config, fileName, serverAddr,
+                                                 max(512, config.blkSize) + 4)
+        if hasattr(output, 'write'):
+            self.write = output.write
+        else:
+            self.write = output
+
+        self.windowSize = 1
+        self.range = None # the (first, last) byte range acknowledged by the server
         
-        # Send the RRQ
+        # Called with this operation once the OACK has been accepted. If it
+        # returns False the transfer is cancelled (e.g. after learning the
+        # tsize, as RFC 2349 allows).
+        self.onOptions = None
+        self.cancelled = False
+        self.bytesReceived = 0
+        self.blocksReceived = 0
+
+        self.packetView = memoryview(self.packet)
+        self.buffer = bytearray(max(config.bufferSize, len(self.packet)))
+        self.bufferView = memoryview(self.buffer)
+        self.buffered = 0
+
+    def transfer(self):
+        '''Send the RRQ, then receive the file.'''
         rrq = tftpmessages.ReadRequest()
-        rrq.fileName = self.fileName
-        
-        if self.config.tsize: # RFC 2349
-            rrq.options['tsize'] = '0'
-        if not self.config.timeout is None: # RFC 2349
-            rrq.options['timeout'] = str(self.config.timeout)
-        if self.config.blksize != 512: # the protocol default block size
-            rrq.options['blksize'] = str(self.config.blksize)
-        
\ No newline at end of file
+        rrq.options.update(clientoperation.readOptions(self.config))
+        self.sendRequest(rrq)
+        self.receiveBlocks()
+        self.flush()
+        if (self.range is None and self.transferSize is not None and
+            self.transferSize != self.bytesReceived):
+            self.addLogMsg('Received %d bytes of %s, tsize was %d' %
+                           (self.bytesReceived, self.fileName, self.transferSize))
+
+    def ackPacket(self, blockNum):
+        ack = tftpmessages.Acknowledgement()
+        ack.blockNum = blockNum & 0xffff
+        return ack.pack()
+
+    def receiveBlocks(self):
+        '''Receive the OACK (if any) and the data blocks, acknowledging each
+        window (RFC 7440; a window is one block unless negotiated).'''
+        expected = 1 # the next block, not wrapped to 16 bits
+        sinceAck = 0 # blocks received since the last ACK
+        gapAcked = False
+        negotiated = False
+        while True:
+            n = self.receivePacket()
+            opcode, blockNum = struct.unpack_from('>HH', self.packet)
+            if opcode == tftpmessages.OPCODE_DATA:
+                if blockNum == expected & 0xffff:
+                    if sinceAck == 0:
+                        self.responseArrived()
+                    size = n - 4
+                    self.store(size)
+                    expected += 1
+                    sinceAck += 1
+                    gapAcked = False
+                    if size < self.blockSize:
+                        # The final ACK is not retransmitted; the server
+                        # resends the last block if it is lost.
+                        self.responseReceived()
+                        self.s.sendto(self.ackPacket(blockNum), self.clientAddr)
+                        return
+                    if sinceAck >= self.windowSize:
+                        self.sendPacket(self.ackPacket(blockNum))
+                        sinceAck = 0
+                    else:
+                        # If the rest of the window is lost, acknowledge
+                        # the blocks received so far (RFC 7440).
+                        with self.timerLock:
+                            self.retransmitData = [self.ackPacket(blockNum)]
+                            self.retransmitCount = 0
+                elif blockNum == (expected - 1) & 0xffff:
+                    # The server resent the last block: our ACK was lost.
+                    self.s.sendto(self.ackPacket(blockNum), self.clientAddr)
+                elif not gapAcked:
+                    # A block is missing. Acknowledge the blocks before it
+                    # once, so that the server resends from the gap.
+                    self.s.sendto(self.ackPacket(expected - 1), self.clientAddr)
+                    self.rtt.cancel()
+                    sinceAck = 0
+                    gapAcked = True
+            elif opcode == tftpmessages.OPCODE_OACK and expected == 1:
+                if not negotiated:
+                    self.acceptOptions(self.parsePacket(n).options)
+                    negotiated = True
+                    self.responseArrived()
+                    if self.onOptions is not None and not self.onOptions(self):
+                        self.sendErrorPkt(tftpmessages.ERR_OPTION_FAIL, 'Transfer cancelled')
+                        self.cancelled = True
+                        return
+                    self.sendPacket(self.ackPacket(0))
+                else:
+                    # The OACK was resent: our ACK was lost.
+                    self.s.sendto(self.ackPacket(0), self.clientAddr)
+            elif opcode == tftpmessages.OPCODE_ERR:
+                self.raiseServerError(n)
+
+    def acceptOption(self, name, value):
+        if name == 'windowsize':
+            self.windowSize = value
+        elif name == 'range':
+            self.range = value
+
+    def store(self, size):
+        '''Copy the data of the packet in the packet buffer to the output buffer.'''
+        self.buffer[self.buffered:self.buffered + size] = self.packetView[4:4 + size]
+        self.buffered += size
+        self.bytesReceived += size
+        self.blocksReceived += 1
+        if self.buffered + self.blockSize > len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        if self.buffered > 0:
+            self.write(self.bufferView[:self.buffered])
+            self.buffered = 0
@@ -0,0 +1,62 @@
+'''
+An adaptive retransmission timeout for the client, from the measured round
+trip times of the transfer (the smoothed estimate of RFC 6298). Round trips
+that include a retransmission are not measured (Karn's algorithm), and the
+timeout doubles after each retransmission until a new measurement arrives.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+from .. import clock
+
+class RttEstimator:
+    '''
+    The smoothed round trip time and retransmission timeout of one transfer.
+    '''
+
+    def __init__(self, initial, minimum = 0.05, maximum = 30.0):
+        '''
+        initial - the timeout (seconds) until the first round trip is measured.
+        minimum, maximum - the limits of the timeout (seconds).
+        '''
+        self.minimum = minimum
+        self.maximum = maximum
+        self.srtt = None # the smoothed round trip time
+        self.rttvar = None # its mean deviation
+        self.rto = self.limit(initial)
+        self.samples = 0
+        self.backoffs = 0
+        self.sentAt = None # when the packet awaiting a response was sent
+
+    def limit(self, rto):
+        return min(self.maximum, max(self.minimum, rto))
+
+    def sample(self, rtt):
+        '''A round trip of rtt seconds has been measured.'''
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples += 1
+        self.rto = self.limit(self.srtt + 4 * self.rttvar)
+
+    def sent(self):
+        '''A packet that awaits a response has been sent.'''
+        self.sentAt = clock.monotonic()
+
+    def cancel(self):
+        '''The next response won't answer the packet sent: don't measure it.'''
+        self.sentAt = None
+
+    def arrived(self, resent):
+        '''The first packet answering the one sent has arrived. Its round trip
+        is measured unless the packet was resent (Karn's algorithm).'''
+        if self.sentAt is not None and not resent:
+            self.sample(clock.monotonic() - self.sentAt)
+        self.sentAt = None
+
+    def backoff(self):
+        '''A retransmission timeout: double the timeout.'''
+        self.backoffs += 1
+        self.rto = self.limit(self.rto * 2)
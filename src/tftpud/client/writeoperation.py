@@ -0,0 +1,167 @@
+'''
+The client write operation: uploads a file with a write request.
+
+The data blocks are read straight into the packet buffer of the operation
+(after the 4 byte header) and sent from there, so the memory used is the
+same whatever the size of the file.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import os
+import stat
+import struct
+
+from .. import tftpmessages
+import clientoperation
+
+class FileSource:
+    '''The data to upload from a file object, read with readinto if it has it.'''
+
+    def __init__(self, f):
+        self.f = f
+        self.readinto = getattr(f, 'readinto', None)
+
+    def size(self):
+        '''The bytes left to read, if the file is a regular file, or None.'''
+        try:
+            st = os.fstat(self.f.fileno())
+            if stat.S_ISREG(st.st_mode):
+                return max(0, st.st_size - self.f.tell())
+        except (AttributeError, IOError, OSError, ValueError):
+            pass
+        return None
+
+    def fill(self, view):
+        '''Fill the memoryview with the next bytes. Returns the number of
+        bytes, less than the length of the view only at the end of the data.'''
+        filled = 0
+        while filled < len(view):
+            if self.readinto is not None:
+                n = self.readinto(view[filled:])
+            else:
+                data = self.f.read(len(view) - filled)
+                n = len(data)
+                view[filled:filled + n] = data
+            if not n:
+                break
+            filled += n
+        return filled
+
+class IterSource:
+    '''The data to upload from an iterable of byte strings of any length.'''
+
+    def __init__(self, iterable):
+        self.chunks = iter(iterable)
+        self.chunk = None # a memoryview of the rest of the current chunk
+
+    def size(self):
+        return None
+
+    def fill(self, view):
+        filled = 0
+        while filled < len(view):
+            if not self.chunk:
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    break
+                self.chunk = memoryview(chunk)
+            n = min(len(view) - filled, len(self.chunk))
+            view[filled:filled + n] = self.chunk[:n]
+            self.chunk = self.chunk[n:]
+            filled += n
+        return filled
+
+class WriteOperation(clientoperation.ClientOperation):
+    '''
+    A client TFTP write operation: uploads data to a file on the server.
+    The source is a FileSource or an IterSource.
+    '''
+
+    def __init__(self, sock, config, fileName, source, serverAddr = None):
+        '''
+        Constructor
+        config - the client.ClientConfig.
+        serverAddr - the server's (address, port); config.hostAddress by default.
+        '''
+        clientoperation.ClientOperation.__init__(self, sock, config, fileName, serverAddr, 1024)
+        self.source = source
+        self.size = source.size() # for the tsize option (None if unknown)
+        self.block = None # the DATA packet buffer, allocated once the blksize is known
+        self.bytesSent = 0
+        self.blocksSent = 0
+        self.finalAckMissed = False # see waitForAck
+
+    def transfer(self):
+        '''Send the WRQ, then the data blocks.'''
+        wrq = tftpmessages.WriteRequest()
+        if self.config.tsize and self.size is not None: # RFC 2349
+            wrq.options['tsize'] = str(self.size)
+        self.sendRequest(wrq)
+
+        # The server accepts the request with an ACK of block 0, or with an
+        # OACK if it accepts any options.
+        while True:
+            n = self.receivePacket()
+            opcode, blockNum = struct.unpack_from('>HH', self.packet)
+            if opcode == tftpmessages.OPCODE_ACK and blockNum == 0:
+                break
+            elif opcode == tftpmessages.OPCODE_OACK:
+                self.acceptOptions(self.parsePacket(n).options)
+                break
+            elif opcode == tftpmessages.OPCODE_ERR:
+                self.raiseServerError(n)
+        self.responseArrived()
+        self.sendBlocks()
+
+    def sendBlocks(self):
+        '''Send the data in lock-step: each block once the last is acknowledged.
+        The last block is shorter than the block size (empty if need be).'''
+        self.block = bytearray(4 + self.blockSize)
+        view = memoryview(self.block)
+        data = view[4:]
+        blockNum = 1
+        while True:
+            try:
+                size = self.source.fill(data)
+            except Exception:
+                self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, 'Failed to read the data')
+                raise
+            struct.pack_into('>HH', self.block, 0, tftpmessages.OPCODE_DATA, blockNum & 0xffff)
+            self.sendPacket([view[:4 + size]])
+            self.bytesSent += size
+            self.blocksSent += 1
+            self.waitForAck(blockNum & 0xffff, size < self.blockSize)
+            if size < self.blockSize:
+                break
+            blockNum += 1
+
+    def waitForAck(self, blockNum, last = False):
+        '''
+        Wait for the ACK of the block. The server sends the ACK of the last
+        block only once, and then ends the transfer (RFC 1350), so if that
+        ACK is lost the retransmissions of the last block go unanswered. The
+        upload is then taken as complete (with finalAckMissed set) unless
+        the server has acknowledged the block before it again meanwhile,
+        which it does while it is still waiting for the last block.
+        '''
+        previousAcked = False
+        while True:
+            try:
+                n = self.receivePacket()
+            except clientoperation.ServerTimeout:
+                if not last or previousAcked:
+                    raise
+                self.finalAckMissed = True
+                self.addLogMsg('No ACK of the last block of %s; taken as written' %
+                               self.fileName)
+                return
+            opcode, ackNum = struct.unpack_from('>HH', self.packet)
+            if opcode == tftpmessages.OPCODE_ACK:
+                if ackNum == blockNum:
+                    self.responseArrived()
+                    return
+                # A duplicate ACK of an earlier block. Don't resend in
+                # response to it (the Sorcerer's Apprentice bug).
+                previousAcked = True
+            elif opcode == tftpmessages.OPCODE_ERR:
+                self.raiseServerError(n)
@@ -0,0 +1,36 @@
+'''
+A monotonic clock, for measuring intervals unaffected by changes to the
+system time. Python 2 has no time.monotonic(), so clock_gettime() is called
+through ctypes where it is available (falling back to time.time()).
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import time
+
+CLOCK_MONOTONIC = 1 # Linux
+
+def makeMonotonic():
+    try:
+        import ctypes
+        import ctypes.util
+
+        class Timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        libName = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+        clockGettime = ctypes.CDLL(libName, use_errno=True).clock_gettime
+        clockGettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+
+        def monotonic():
+            '''Seconds (float) since an arbitrary fixed point.'''
+            ts = Timespec()
+            if clockGettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+                raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+
+        monotonic()
+        return monotonic
+    except Exception:
+        return time.time
+
+monotonic = makeMonotonic()
@@ -0,0 +1,173 @@
+'''
+A low overhead, structured event log for the TFTP operations.
+
+An event is recorded as a tuple of (timestamp, event type, fields): the
+timestamp is an integer (microseconds since the epoch) and the fields are the
+values the event's message refers to. Nothing is formatted when the event is
+recorded; the message text is only built by formatEvent(), when a sink that
+wants text consumes the event.
+
+Each thread records its events in a ring buffer of its own, so the worker
+threads never contend for a lock to log. A single consumer (the server
+thread) drains the rings. When a ring is full new events are dropped and
+counted rather than blocking the transfer.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import time
+from datetime import datetime
+
+# Event types, with their fields
+MESSAGE = 0 # (text,)
+RRQ = 1 # (client address, file name, options)
+WRQ = 2 # (client address, file name, options)
+READ_COMPLETE = 3 # (blocks,)
+WRITE_COMPLETE = 4 # (blocks,)
+WRITE_FAILED = 5 # ()
+OPERATION_ERROR = 6 # (exception,)
+RRQ_ERROR = 7 # (error message,)
+CACHE_HIT = 8 # (file name,)
+BLKSIZE_REDUCED = 9 # (requested, accepted, reason)
+POLICY_APPLIED = 10 # (rule name,)
+IDLE_ABORT = 11 # (idle seconds,)
+WARMUP_COMPLETE = 12 # (files, bytes, seconds)
+EVENTS_DROPPED = 13 # (count,)
+CONFIG_RELOADED = 14 # (address, port)
+SHUTDOWN = 15 # (transfers aborted,)
+
+FORMATS = {
+    MESSAGE : '%s',
+    RRQ : 'RRQ: %s, %s , options : %s',
+    WRQ : 'WRQ: %s, %s , options : %s',
+    READ_COMPLETE : 'RRQ operation complete in %d blocks',
+    WRITE_COMPLETE : 'WRQ operation complete in %d blocks',
+    WRITE_FAILED : 'WRQ operation failed',
+    OPERATION_ERROR : 'Error: %s',
+    RRQ_ERROR : 'RRQ ERROR: %s',
+    CACHE_HIT : 'Cache hit: %s',
+    BLKSIZE_REDUCED : 'blksize %d reduced to %d (%s)',
+    POLICY_APPLIED : 'Negotiation policy: %s',
+    IDLE_ABORT : 'Transfer idle for %d seconds. Aborting.',
+    WARMUP_COMPLETE : 'Warm-up: %d files (%d bytes) loaded in %.2fs',
+    EVENTS_DROPPED : '%d log events dropped',
+    CONFIG_RELOADED : 'Configuration reloaded: listening on %s:%d',
+    SHUTDOWN : 'Server stopped: %d transfers aborted',
+}
+
+def timestamp():
+    '''The current time in integer microseconds.'''
+    return int(time.time() * 1000000)
+
+def formatEvent(timestamp, eventType, fields):
+    '''Return the log line for an event.'''
+    when = datetime.fromtimestamp(timestamp / 1000000.0)
+    return str(when) + ': ' + (FORMATS[eventType] % fields)
+
+class EventRing:
+    '''
+    A bounded buffer of events with a single producer (the thread that owns
+    it) and a single consumer. The producer only writes head and the consumer
+    only writes tail, so no lock is needed.
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.head = 0 # events written
+        self.tail = 0 # events consumed
+        self.dropped = 0 # events dropped because the ring was full
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def put(self, event):
+        '''Add an event. Returns True if the ring was empty, so the consumer
+        must be woken.'''
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+        self.slots[head % self.capacity] = event
+        self.head = head + 1
+        # Read the tail only now: a take() that emptied the ring without
+        # seeing this event has moved the tail up to it.
+        return self.tail == head
+
+    def take(self):
+        '''Remove and return the events in the ring, including any added
+        while taking them (whose put() found the ring not empty).'''
+        events = []
+        while True:
+            head = self.head
+            if head == self.tail:
+                return events
+            for i in xrange(self.tail, head):
+                index = i % self.capacity
+                events.append(self.slots[index])
+                self.slots[index] = None
+            self.tail = head
+
+class EventLog:
+    '''
+    The event rings of all the threads that log.
+    '''
+
+    def __init__(self, capacity = 4096, notify = None):
+        '''
+        capacity - the number of events each thread's ring can hold.
+        notify - called (from the logging thread) when events are added to an
+                 empty ring, to wake the consumer. Optional.
+        '''
+        self.capacity = capacity
+        self.notify = notify
+        self.local = threading.local()
+        self.rings = [] # (thread, EventRing)
+        self.mutex = threading.Lock() # guards the list of rings
+        self.forgottenDrops = 0 # dropped by the rings of finished threads
+        self.droppedReported = 0
+
+    def ring(self):
+        '''Return the calling thread's ring.'''
+        ring = getattr(self.local, 'ring', None)
+        if ring is None:
+            ring = EventRing(self.capacity)
+            self.local.ring = ring
+            with self.mutex:
+                self.rings.append((threading.current_thread(), ring))
+        return ring
+
+    def log(self, eventType, *fields):
+        '''Record an event.'''
+        if self.ring().put((timestamp(), eventType, fields)) and self.notify is not None:
+            self.notify()
+
+    def drain(self, handler):
+        '''Pass every recorded event to handler(timestamp, eventType, fields),
+        in time order. Only one thread may drain the log.'''
+        with self.mutex:
+            rings = list(self.rings)
+            # Forget the (empty) rings of threads that have finished.
+            self.rings = []
+            for thread, ring in rings:
+                if thread.is_alive() or len(ring) > 0:
+                    self.rings.append((thread, ring))
+                else:
+                    self.forgottenDrops += ring.dropped
+
+        events = []
+        for thread, ring in rings:
+            events.extend(ring.take())
+        events.sort(key=lambda e: e[0])
+        for event in events:
+            handler(*event)
+
+        dropped = self.dropped()
+        if dropped > self.droppedReported:
+            handler(timestamp(), EVENTS_DROPPED, (dropped - self.droppedReported,))
+            self.droppedReported = dropped
+
+    def dropped(self):
+        '''The total number of events dropped.'''
+        with self.mutex:
+            return self.forgottenDrops + sum(r.dropped for t, r in self.rings)
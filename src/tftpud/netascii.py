@@ -0,0 +1,44 @@
+'''
+The netascii transfer mode (RFC 764, RFC 1350): lines end with CR LF, and
+a CR that doesn't end a line is sent as CR NUL. Local files use LF line
+endings.
+
+Encoding is done chunk by chunk with no state; decoding keeps a CR that
+ends one chunk until the next chunk shows what it was.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+
+def encode(data):
+    '''Convert local data to netascii.'''
+    return data.replace('\r', '\r\0').replace('\n', '\r\n')
+
+def encodedSize(data):
+    '''The length of the data once converted to netascii.'''
+    return len(data) + data.count('\r') + data.count('\n')
+
+class Decoder:
+    '''
+    Converts netascii to local data, a chunk (e.g. a data block) at a time.
+    '''
+
+    def __init__(self):
+        self.pendingCr = False # the last chunk ended with a CR
+
+    def decode(self, data):
+        '''Return the local data for the next chunk of netascii.'''
+        if self.pendingCr:
+            data = '\r' + data
+            self.pendingCr = False
+        if data.endswith('\r'):
+            data = data[:-1]
+            self.pendingCr = True
+        return data.replace('\r\n', '\n').replace('\r\0', '\r')
+
+    def finish(self):
+        '''Return what is left at the end of the data: a CR on its own, which
+        is not valid netascii, is kept as it is.'''
+        if self.pendingCr:
+            self.pendingCr = False
+            return '\r'
+        return ''
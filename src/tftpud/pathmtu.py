@@ -0,0 +1,55 @@
+'''
+Block size limits from the path MTU (RFC 2348 blksize negotiation).
+
+A data block that does not fit in a single IP packet is fragmented, and losing
+any one fragment loses the whole block. The block size offered to a client is
+therefore limited to what fits in the MTU of the route to that client.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import socket
+import sys
+
+# RFC 2348 block size range
+MIN_BLKSIZE = 8
+MAX_BLKSIZE = 65464
+
+# Linux socket options, not all exported by the socket module.
+IP_MTU = getattr(socket, 'IP_MTU', 14)
+IPV6_MTU = getattr(socket, 'IPV6_MTU', 24)
+IPPROTO_IPV6 = getattr(socket, 'IPPROTO_IPV6', 41)
+
+UDP_HEADER = 8
+TFTP_DATA_HEADER = 4
+
+def isIpv6(addr):
+    return addr[0].find(':') >= 0
+
+def discoverMtu(clientAddr):
+    '''Return the MTU of the route to the client (as known to the kernel, which
+    includes any path MTU discovered), or None if it can't be found.
+    Only supported on Linux.'''
+    if not sys.platform.startswith('linux'):
+        return None
+
+    s = None
+    try:
+        if isIpv6(clientAddr):
+            s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+            s.connect(clientAddr)
+            return s.getsockopt(IPPROTO_IPV6, IPV6_MTU)
+        else:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # Connecting a UDP socket selects the route; nothing is sent.
+            s.connect(clientAddr)
+            return s.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except:
+        return None
+    finally:
+        if s is not None:
+            s.close()
+
+def maxBlockSize(mtu, ipv6 = False):
+    '''The largest blksize whose DATA packets fit in the given MTU.'''
+    ipHeader = 40 if ipv6 else 20
+    return min(MAX_BLKSIZE, mtu - ipHeader - UDP_HEADER - TFTP_DATA_HEADER)
@@ -0,0 +1,86 @@
+'''
+AIMD congestion control for windowed (RFC 7440) read transfers.
+
+A congestion window is kept for each client address (the path to that
+client), shared by all of its transfers. Every window acknowledged without
+loss grows it by about one block per window (additive increase); a
+retransmission timeout or fast retransmit halves it (multiplicative decrease).
+
+A receiver using the RFC 7440 windowsize option only acknowledges at the end of
+each window, so the window cannot change during a transfer without stalling
+the receiver. Instead the congestion window is applied when a transfer
+negotiates its windowsize: the server offers the smaller of the client's
+request and the path's congestion window.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import collections
+
+class PathState:
+    '''The congestion state of the path to one client.'''
+
+    def __init__(self, cwnd):
+        self.cwnd = float(cwnd)
+        self.windowsAcked = 0
+        self.losses = 0
+
+class CongestionControl:
+    '''
+    The congestion windows of recently seen client paths.
+    '''
+
+    def __init__(self, initialWindow = 4, maxWindow = 64, maxPaths = 4096):
+        '''
+        initialWindow - the window (blocks) used for a client not seen before.
+        maxWindow - the largest window (blocks) offered to any client.
+        maxPaths - the number of client paths remembered (least recently
+                   used paths are forgotten first).
+        '''
+        self.initialWindow = max(1, initialWindow)
+        self.maxWindow = max(1, maxWindow)
+        self.maxPaths = maxPaths
+        self.paths = collections.OrderedDict() # keyed by client address
+        self.mutex = threading.Lock()
+
+    def getPath(self, clientAddr):
+        # Called with the mutex held.
+        key = clientAddr[0]
+        path = self.paths.pop(key, None)
+        if path is None:
+            path = PathState(min(self.initialWindow, self.maxWindow))
+            if len(self.paths) >= self.maxPaths:
+                self.paths.popitem(last=False)
+        self.paths[key] = path # most recently used is last
+        return path
+
+    def window(self, clientAddr, requested):
+        '''Return the window size (blocks) to offer a client that requested
+        the given windowsize.'''
+        with self.mutex:
+            path = self.getPath(clientAddr)
+            return max(1, min(requested, self.maxWindow, int(path.cwnd)))
+
+    def cwnd(self, clientAddr):
+        with self.mutex:
+            return self.getPath(clientAddr).cwnd
+
+    def onWindowAcked(self, clientAddr, numBlocks):
+        '''A window of numBlocks was acknowledged without any retransmission.'''
+        with self.mutex:
+            path = self.getPath(clientAddr)
+            path.windowsAcked += 1
+            path.cwnd = min(float(self.maxWindow), path.cwnd + float(numBlocks) / path.cwnd)
+
+    def onLoss(self, clientAddr):
+        '''A retransmission timeout or fast retransmit occurred.'''
+        with self.mutex:
+            path = self.getPath(clientAddr)
+            path.losses += 1
+            path.cwnd = max(1.0, path.cwnd / 2)
+
+    def pathStats(self):
+        '''Return {address: (cwnd, windows acked, losses)} for the known paths.'''
+        with self.mutex:
+            return dict((addr, (p.cwnd, p.windowsAcked, p.losses))
+                        for addr, p in self.paths.items())
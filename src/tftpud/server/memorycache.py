@@ -0,0 +1,79 @@
+'''
+Files held in memory for the read path, so that they are served without
+touching the disk.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import os
+import threading
+
+class MemoryBlockSource:
+    '''The blocks of a file held in memory (see readoperation.FileBlockSource).'''
+
+    def __init__(self, data, blockSize, offset = 0, length = None):
+        '''offset and length select a range of the file.'''
+        self.data = data
+        self.blockSize = blockSize
+        self.offset = offset
+        self.end = len(data) if length is None else min(len(data), offset + length)
+
+    def getBlocks(self, maxNum):
+        blocks = []
+        while len(blocks) < maxNum and self.offset < self.end:
+            blocks.append(self.data[self.offset:min(self.end, self.offset + self.blockSize)])
+            self.offset += self.blockSize
+        return blocks
+
+class MemoryFileCache:
+    '''
+    The contents of a set of files, up to a total size. A file is only served
+    from memory while its size and modification time match those on disk.
+    '''
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.files = {} # file name -> (data, size, mtime)
+        self.totalBytes = 0
+        self.mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self.files)
+
+    def load(self, fileName):
+        '''Read a file into memory. Returns False if the file could not be
+        read or does not fit in the remaining space.'''
+        try:
+            stat = os.stat(fileName)
+            with self.mutex:
+                if self.files.has_key(fileName):
+                    return True
+                if self.totalBytes + stat.st_size > self.maxBytes:
+                    return False
+            with open(fileName, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return False
+
+        if len(data) != stat.st_size:
+            return False # changed while reading
+        with self.mutex:
+            if self.totalBytes + len(data) > self.maxBytes:
+                return False
+            self.files[fileName] = (data, stat.st_size, stat.st_mtime)
+            self.totalBytes += len(data)
+        return True
+
+    def get(self, fileName, stat):
+        '''Return the contents of the file, or None if it is not in memory.
+        stat is the file's current os.stat() result; a file that has changed
+        since it was loaded is dropped.'''
+        with self.mutex:
+            entry = self.files.get(fileName)
+            if entry is None:
+                return None
+            data, size, mtime = entry
+            if size != stat.st_size or mtime != stat.st_mtime:
+                del self.files[fileName]
+                self.totalBytes -= size
+                return None
+            return data
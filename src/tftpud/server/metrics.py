@@ -0,0 +1,212 @@
+'''
+Metrics for the TFTP server: counters, gauges and histograms updated by the
+operations, and an HTTP endpoint serving them in the Prometheus text format.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import bisect
+import BaseHTTPServer
+
+# Histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                    60.0, 120.0, 300.0)
+
+def formatValue(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+class Counter:
+    '''A count that only goes up, optionally split by the value of a label.'''
+
+    def __init__(self, name, help, labelName = None):
+        self.name = name
+        self.help = help
+        self.labelName = labelName
+        self.values = {} # label value (None without a label) -> count
+        self.mutex = threading.Lock()
+
+    def inc(self, amount = 1, label = None):
+        with self.mutex:
+            self.values[label] = self.values.get(label, 0) + amount
+
+    def value(self, label = None):
+        return self.values.get(label, 0)
+
+    def render(self, lines):
+        lines.append('# HELP %s %s' % (self.name, self.help))
+        lines.append('# TYPE %s counter' % self.name)
+        with self.mutex:
+            values = sorted(self.values.items())
+        if self.labelName is None:
+            lines.append('%s %s' % (self.name, formatValue(self.values.get(None, 0))))
+        else:
+            for label, value in values:
+                lines.append('%s{%s="%s"} %s' % (self.name, self.labelName, label,
+                                                 formatValue(value)))
+
+class Gauge:
+    '''A value that goes up and down.'''
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.current = 0
+        self.mutex = threading.Lock()
+
+    def inc(self, amount = 1):
+        with self.mutex:
+            self.current += amount
+
+    def dec(self, amount = 1):
+        with self.mutex:
+            self.current -= amount
+
+    def set(self, value):
+        self.current = value
+
+    def value(self):
+        return self.current
+
+    def render(self, lines):
+        lines.append('# HELP %s %s' % (self.name, self.help))
+        lines.append('# TYPE %s gauge' % self.name)
+        lines.append('%s %s' % (self.name, formatValue(self.current)))
+
+class Histogram:
+    '''A distribution of observed values, counted in buckets.'''
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1) # the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.mutex = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.mutex:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def render(self, lines):
+        lines.append('# HELP %s %s' % (self.name, self.help))
+        lines.append('# TYPE %s histogram' % self.name)
+        with self.mutex:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.bounds + ['+Inf'], counts):
+            cumulative += n
+            lines.append('%s_bucket{le="%s"} %d' % (self.name, bound, cumulative))
+        lines.append('%s_sum %s' % (self.name, repr(total)))
+        lines.append('%s_count %d' % (self.name, count))
+
+class MetricsRegistry:
+    '''A collection of metrics, rendered in the order they were added.'''
+
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelName = None):
+        return self.add(Counter(name, help, labelName))
+
+    def gauge(self, name, help):
+        return self.add(Gauge(name, help))
+
+    def histogram(self, name, help, buckets = LATENCY_BUCKETS):
+        return self.add(Histogram(name, help, buckets))
+
+    def render(self):
+        '''Return the metrics in the Prometheus text exposition format.'''
+        lines = []
+        for metric in self.metrics:
+            metric.render(lines)
+        return '\n'.join(lines) + '\n'
+
+class ServerMetrics(MetricsRegistry):
+    '''The metrics of a TFTP server.'''
+
+    def __init__(self):
+        MetricsRegistry.__init__(self)
+        self.requests = self.counter('tftpud_requests_total',
+                                     'Requests received, by type.', 'type')
+        self.refused = self.counter('tftpud_requests_refused_total',
+                                    'Requests refused because the server was busy.')
+        self.errors = self.counter('tftpud_errors_total',
+                                   'Error packets sent, by TFTP error code.', 'code')
+        self.bytesSent = self.counter('tftpud_bytes_sent_total',
+                                      'File bytes sent (first transmissions).')
+        self.bytesReceived = self.counter('tftpud_bytes_received_total',
+                                          'File bytes received.')
+        self.blocksSent = self.counter('tftpud_blocks_sent_total',
+                                       'Data blocks sent (first transmissions).')
+        self.blocksReceived = self.counter('tftpud_blocks_received_total',
+                                           'Data blocks received.')
+        self.retransmits = self.counter('tftpud_retransmits_total',
+                                        'Packets retransmitted.')
+        self.tidErrors = self.counter('tftpud_tid_errors_total',
+                                      'Packets received from an unknown transfer ID.')
+        self.activeTransfers = self.gauge('tftpud_active_transfers',
+                                          'Transfers in progress.')
+        self.timeToFirstBlock = self.histogram('tftpud_time_to_first_block_seconds',
+                                               'Time from a read request to its first data block.')
+        self.transferDuration = self.histogram('tftpud_transfer_duration_seconds',
+                                               'Duration of completed transfers.',
+                                               DURATION_BUCKETS)
+        self.ackRtt = self.histogram('tftpud_ack_rtt_seconds',
+                                     'Time from sending a data block (or window) to its ACK, '
+                                     'excluding retransmitted blocks.')
+
+class MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # don't write to stderr for every scrape
+
+class MetricsEndpoint:
+    '''
+    An HTTP server, on its own thread, serving the metrics of a registry at
+    /metrics.
+    '''
+
+    def __init__(self, registry, address = '127.0.0.1', port = 9169):
+        self.httpServer = BaseHTTPServer.HTTPServer((address, port), MetricsRequestHandler)
+        self.httpServer.registry = registry
+        self.thread = None
+
+    def address(self):
+        return self.httpServer.server_address
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpServer.serve_forever,
+                                       name='tftpud-metrics')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.httpServer.shutdown()
+            self.thread.join()
+            self.thread = None
+        self.httpServer.server_close()
@@ -0,0 +1,153 @@
+'''
+The read path for netascii mode: files converted as they are sent, and the
+converted contents of frequently read files held in memory.
+
+The size of a file once converted is remembered after it has been sent (or
+converted) once, so the tsize option can be answered exactly without
+reading the file twice. The first read that asks for the tsize measures it
+first (see convertedSize).
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import collections
+
+from .. import netascii
+
+def convertedSize(fileName, chunkSize = 65536):
+    '''The size of the file once converted to netascii, reading it a chunk
+    at a time.'''
+    size = 0
+    with open(fileName, 'rb') as f:
+        while True:
+            chunk = f.read(chunkSize)
+            if not chunk:
+                return size
+            size += netascii.encodedSize(chunk)
+
+class NetasciiBlockSource:
+    '''
+    The blocks of a file converted to netascii as it is read (see
+    readoperation.FileBlockSource). Conversion makes the data longer, so it
+    is cut into blocks again: every block but the last is full.
+    '''
+
+    def __init__(self, fileSource, blockSize, onEnd = None):
+        '''
+        fileSource - the blocks of the file as it is on disk.
+        onEnd - called with the converted size once the end of the file is read.
+        '''
+        self.fileSource = fileSource
+        self.blockSize = blockSize
+        self.onEnd = onEnd
+        self.data = '' # converted data not yet returned, from self.offset
+        self.offset = 0
+        self.convertedSize = 0
+        self.endOfFile = False
+
+    def getBlocks(self, maxNum):
+        blocks = []
+        while len(blocks) < maxNum:
+            if len(self.data) - self.offset < self.blockSize and not self.endOfFile:
+                chunks = self.fileSource.getBlocks(maxNum - len(blocks))
+                if len(chunks) == 0:
+                    self.endOfFile = True
+                    if self.onEnd is not None:
+                        self.onEnd(self.convertedSize)
+                else:
+                    converted = netascii.encode(''.join(chunks))
+                    self.convertedSize += len(converted)
+                    self.data = self.data[self.offset:] + converted
+                    self.offset = 0
+                continue
+            if self.offset >= len(self.data):
+                break
+            blocks.append(self.data[self.offset:self.offset + self.blockSize])
+            self.offset += self.blockSize
+        return blocks
+
+class NetasciiCache:
+    '''
+    The netascii contents of the files read in netascii mode more than
+    once, up to maxBytes in total (the least recently used are dropped),
+    and the converted sizes of files read before. A file larger than
+    maxFileBytes, or than maxBytes once converted, is always converted as
+    it is sent: with maxBytes 0 only the sizes are kept. Entries are only used
+    while the file's size and modification time match those on disk.
+    '''
+
+    def __init__(self, maxBytes, maxFileBytes, maxSizes = 4096):
+        self.maxBytes = maxBytes
+        self.maxFileBytes = maxFileBytes
+        self.maxSizes = maxSizes
+        self.files = collections.OrderedDict() # file name -> (data, size, mtime)
+        self.sizes = collections.OrderedDict() # file name -> (converted size, size, mtime)
+        self.totalBytes = 0
+        self.mutex = threading.Lock()
+
+    def __len__(self):
+        return len(self.files)
+
+    def get(self, fileName, stat):
+        '''
+        Return (data, convertedSize) for a read of the file: the converted
+        contents if they are in memory (or worth putting there now) and the
+        converted size if known. Either may be None. stat is the file's
+        current os.stat() result.
+        '''
+        with self.mutex:
+            entry = self.files.get(fileName)
+            if entry is not None:
+                data, size, mtime = entry
+                del self.files[fileName]
+                if size == stat.st_size and mtime == stat.st_mtime:
+                    self.files[fileName] = entry # now the most recently used
+                    return data, len(data)
+                self.totalBytes -= len(data)
+
+            convertedSize = None
+            entry = self.sizes.get(fileName)
+            if entry is not None:
+                if entry[1:] == (stat.st_size, stat.st_mtime):
+                    convertedSize = entry[0]
+                else:
+                    del self.sizes[fileName]
+            if (convertedSize is None or stat.st_size > self.maxFileBytes or
+                convertedSize > self.maxBytes):
+                # Not read before (since it changed), or too large to keep:
+                # converted as it is sent.
+                return None, convertedSize
+
+        data = self.load(fileName, stat)
+        if data is None:
+            return None, convertedSize
+        return data, len(data)
+
+    def load(self, fileName, stat):
+        '''Read and convert the file, and keep it if it fits.'''
+        try:
+            with open(fileName, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        if len(data) != stat.st_size:
+            return None # changed while reading
+        data = netascii.encode(data)
+
+        with self.mutex:
+            if len(data) <= self.maxBytes and not self.files.has_key(fileName):
+                while self.totalBytes + len(data) > self.maxBytes:
+                    name, entry = self.files.popitem(last=False)
+                    self.totalBytes -= len(entry[0])
+                self.files[fileName] = (data, stat.st_size, stat.st_mtime)
+                self.totalBytes += len(data)
+        return data
+
+    def recordSize(self, fileName, stat, convertedSize):
+        '''Remember the converted size of a file that has been sent.'''
+        with self.mutex:
+            if self.sizes.has_key(fileName):
+                del self.sizes[fileName]
+            elif len(self.sizes) >= self.maxSizes:
+                self.sizes.popitem(last=False)
+            self.sizes[fileName] = (convertedSize, stat.st_size, stat.st_mtime)
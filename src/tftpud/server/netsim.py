@@ -0,0 +1,515 @@
+'''
+A simulated network with a virtual clock, for running the server's real read
+and write operations against many simulated clients in accelerated time.
+
+The operations run in their own threads as usual, but their sockets are
+SimSockets. Whenever every operation thread is blocked (waiting for a packet
+or a timeout) or finished, the clock jumps to the next event: a packet
+arriving, a timeout, or a client timer. Only one thread runs at a time, so a
+simulation with a given seed always plays out the same way, and a transfer
+that would take minutes of retransmission timeouts takes milliseconds.
+
+Each packet is delayed by the latency of the link (plus a random jitter, and
+the time to send it at the link's bandwidth, if given) and may be lost,
+duplicated or delayed further (reordered). The clients are event driven and
+don't need threads of their own.
+
+The operations use socket timeouts for retransmission (the timer wheel runs
+in real time, so useTimerWheel is turned off), and the scheduler, worker
+pool and proxy mode are not supported.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import collections
+import heapq
+import itertools
+import random
+import socket
+import threading
+
+from .. import tftpmessages
+from .. import tftpoperation
+import server
+
+class LinkProfile:
+    '''The behaviour of the network between the server and a client. The
+    same profile applies in both directions.'''
+
+    def __init__(self, latency = 0.001, jitter = 0.0, loss = 0.0, duplicate = 0.0,
+                 reorder = 0.0, reorderDelay = None, bandwidth = None):
+        '''
+        latency - one-way delay (seconds).
+        jitter - a random extra delay between zero and jitter (seconds).
+        loss - the probability of a packet being lost.
+        duplicate - the probability of a packet arriving twice.
+        reorder - the probability of a packet being held back by reorderDelay
+        (by default twice the latency), so that later packets overtake it.
+        bandwidth - bytes per second; None for no limit.
+        '''
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.reorderDelay = reorderDelay
+        self.bandwidth = bandwidth
+
+class SimSocket:
+    '''A UDP socket on the simulated network, used by an operation thread
+    (or the server's listener).'''
+
+    def __init__(self, sim, address):
+        self.sim = sim
+        self.address = address
+        self.queue = collections.deque() # (data, fromAddr)
+        self.timeout = None
+        self.waiting = False # the owner thread is blocked in recvfrom()
+        self.timedOut = False
+        self.timer = None
+        self.closed = False
+        # Woken by deliveries and timeouts; shares the simulator's lock.
+        self.cond = threading.Condition(sim.lock)
+
+    def sendto(self, data, address):
+        with self.sim.cond:
+            self.sim.transmit(data, self.address, address)
+        return len(data)
+
+    def recvfrom(self, length):
+        sim = self.sim
+        with sim.cond:
+            while True:
+                if self.queue:
+                    data, fromAddr = self.queue.popleft()
+                    return data[:length], fromAddr
+                if self.timedOut:
+                    self.timedOut = False
+                    raise socket.timeout()
+                if not self.waiting:
+                    # Block, letting the clock move on.
+                    self.waiting = True
+                    if self.timeout is not None:
+                        self.timer = sim.schedule(self.timeout, self.onTimeout)
+                    sim.running -= 1
+                    sim.cond.notify()
+                self.cond.wait()
+
+    def deliver(self, data, fromAddr):
+        # Called with the simulator's lock held.
+        self.queue.append((data, fromAddr))
+        self.wake()
+
+    def onTimeout(self):
+        self.timer = None
+        if self.waiting:
+            self.timedOut = True
+            self.wake()
+
+    def wake(self):
+        if self.waiting:
+            self.waiting = False
+            if self.timer is not None:
+                self.sim.cancel(self.timer)
+                self.timer = None
+            self.sim.running += 1
+            self.cond.notify()
+
+    def settimeout(self, secs):
+        self.timeout = secs
+
+    def setsockopt(self, level, opt, val):
+        pass
+
+    def getsockname(self):
+        return self.address
+
+    def close(self):
+        with self.sim.cond:
+            self.closed = True
+            self.sim.endpoints.pop(self.address, None)
+
+class SimulatedServer(server.Server):
+    '''
+    A Server whose listener and transfer sockets are on a simulated network.
+    Requests are handled by the simulator's thread; the operations run in
+    threads of their own, as usual.
+    '''
+
+    def __init__(self, sim, config):
+        config.useTimerWheel = False
+        config.workerThreads = 0
+        if config.maxActiveTransfers > 0 or config.upstream is not None:
+            raise Exception('The scheduler and proxy mode are not supported by the simulator')
+        server.Server.__init__(self, config, runNow=False)
+        self.sim = sim
+        self.clock = sim.time
+        self.address = (config.hostIpAddress, config.listeningPort)
+        self.listenerSocket = sim.listen(self.address, self)
+        self.nextPort = config.ephemeralPorts[0]
+
+    def createTransferSocket(self):
+        # Called with the simulator's lock held, before the operation thread
+        # is started. The thread runs until it first blocks.
+        while True:
+            port = self.nextPort
+            self.nextPort += 1
+            if self.nextPort > self.config.ephemeralPorts[1]:
+                self.nextPort = self.config.ephemeralPorts[0]
+            address = (self.config.hostIpAddress, port)
+            if address not in self.sim.endpoints and not self.ongoingOperations.has_key(port):
+                break
+        s = SimSocket(self.sim, address)
+        self.sim.endpoints[address] = s
+        self.sim.running += 1
+        return s, port
+
+    def postEvent(self, operation, eventType, data):
+        with self.sim.cond:
+            self.events.put((operation, eventType, data))
+            if eventType == tftpoperation.EVENT_COMPLETE:
+                # The operation thread is finishing.
+                self.sim.running -= 1
+                self.sim.cond.notify()
+
+    def deliver(self, data, fromAddr):
+        '''A datagram arrived at the listener.'''
+        self.processListenerData(data, fromAddr)
+
+class ClientResult:
+    '''The outcome of a simulated client's transfer.'''
+
+    def __init__(self):
+        self.ok = None # None until the transfer finishes
+        self.error = None
+        self.started = None # simulated times (seconds)
+        self.firstBlock = None
+        self.finished = None
+        self.bytes = 0
+        self.packetsSent = 0
+        self.packetsReceived = 0
+        self.timeouts = 0
+
+    def duration(self):
+        if self.finished is None:
+            return None
+        return self.finished - self.started
+
+class SimClient:
+    '''The base class of the simulated clients: a retransmit timer and the
+    packet sent last.'''
+
+    def __init__(self, sim, address, serverAddr, fileName, options, timeout, retries):
+        self.sim = sim
+        self.address = address
+        self.serverAddr = serverAddr
+        self.peer = serverAddr # the server's TID once known
+        self.fileName = fileName
+        self.options = dict(options or {})
+        self.timeout = timeout
+        self.retries = retries
+        self.result = ClientResult()
+        self.lastSent = None
+        self.timer = None
+        self.retryCount = 0
+
+    def send(self, data, resetRetries = True):
+        self.lastSent = data
+        self.result.packetsSent += 1
+        self.sim.transmit(data, self.address, self.peer)
+        if resetRetries:
+            self.retryCount = 0
+        self.armTimer()
+
+    def armTimer(self):
+        if self.timer is not None:
+            self.sim.cancel(self.timer)
+        self.timer = self.sim.schedule(self.timeout, self.onTimeout)
+
+    def onTimeout(self):
+        self.timer = None
+        if self.result.ok is not None:
+            return
+        self.result.timeouts += 1
+        self.retryCount += 1
+        if self.retryCount > self.retries:
+            self.finish(False, 'Timed out')
+        else:
+            self.send(self.lastSent, resetRetries=False)
+
+    def finish(self, ok, error = None):
+        if self.result.ok is not None:
+            return
+        self.result.ok = ok
+        self.result.error = error
+        self.result.finished = self.sim.now
+        if self.timer is not None:
+            self.sim.cancel(self.timer)
+            self.timer = None
+
+    def deliver(self, data, fromAddr):
+        self.result.packetsReceived += 1
+        if self.peer == self.serverAddr:
+            self.peer = fromAddr
+        elif fromAddr != self.peer:
+            # e.g. a second transfer started by a resent request
+            errPkt = tftpmessages.Error()
+            errPkt.errorCode = tftpmessages.ERR_UNKNOWN_TID
+            errPkt.errorMsg = 'Unknown transfer ID'
+            self.sim.transmit(errPkt.pack(), self.address, fromAddr)
+            return
+        pkt = tftpmessages.create_tftp_packet_from_data(data)
+        if pkt.opcode == tftpmessages.OPCODE_ERR:
+            self.finish(False, 'Error from server: ' + pkt.errorMsg)
+        else:
+            self.receive(pkt)
+
+class SimReadClient(SimClient):
+    '''Reads a file, in lock-step or (with the windowsize option) in windows.
+    The final ACK is resent if the server resends the last block.'''
+
+    def __init__(self, sim, address, serverAddr, fileName, options = None,
+                 timeout = 1.0, retries = 5, keepData = False):
+        SimClient.__init__(self, sim, address, serverAddr, fileName, options, timeout, retries)
+        self.blockSize = 512
+        self.windowSize = 1
+        self.expected = 1
+        self.sinceAck = 0
+        self.gapAcked = False # a block is missing and has been reported
+        self.keepData = keepData
+        self.data = []
+
+    def start(self):
+        self.result.started = self.sim.now
+        rrq = tftpmessages.ReadRequest()
+        rrq.fileName = self.fileName
+        rrq.mode = 'octet'
+        rrq.options = dict(self.options)
+        self.send(rrq.pack())
+
+    def ack(self, blockNum):
+        ack = tftpmessages.Acknowledgement()
+        ack.blockNum = blockNum
+        self.sinceAck = 0
+        if self.result.ok is None:
+            self.send(ack.pack())
+        else:
+            # The server missed the final ACK.
+            self.result.packetsSent += 1
+            self.sim.transmit(ack.pack(), self.address, self.peer)
+
+    def receive(self, pkt):
+        if pkt.opcode == tftpmessages.OPCODE_OACK:
+            if self.expected == 1:
+                self.blockSize = int(pkt.options.get('blksize', 512))
+                self.windowSize = int(pkt.options.get('windowsize', 1))
+                self.ack(0)
+        elif pkt.opcode == tftpmessages.OPCODE_DATA:
+            if pkt.blockNum != (self.expected & 0xffff):
+                if self.result.ok is not None:
+                    self.ack((self.expected - 1) & 0xffff)
+                elif not self.gapAcked:
+                    # A block is missing: acknowledge what we have, once
+                    # (RFC 7440). More ACKs would only trigger more resends.
+                    self.ack((self.expected - 1) & 0xffff)
+                    self.gapAcked = True
+                return
+            self.gapAcked = False
+            if self.result.firstBlock is None:
+                self.result.firstBlock = self.sim.now
+            self.result.bytes += len(pkt.dataBlock)
+            if self.keepData:
+                self.data.append(pkt.dataBlock)
+            self.expected += 1
+            self.sinceAck += 1
+            last = len(pkt.dataBlock) < self.blockSize
+            if last or self.sinceAck >= self.windowSize:
+                self.ack(pkt.blockNum)
+            if last:
+                self.finish(True)
+
+class SimWriteClient(SimClient):
+    '''Writes the given data to a file on the server, in lock-step.'''
+
+    def __init__(self, sim, address, serverAddr, fileName, data, options = None,
+                 timeout = 1.0, retries = 5):
+        SimClient.__init__(self, sim, address, serverAddr, fileName, options, timeout, retries)
+        self.fileData = data
+        self.blockSize = 512
+        self.blockNum = 0 # the last block sent
+
+    def start(self):
+        self.result.started = self.sim.now
+        wrq = tftpmessages.WriteRequest()
+        wrq.fileName = self.fileName
+        wrq.mode = 'octet'
+        wrq.options = dict(self.options)
+        self.send(wrq.pack())
+
+    def sendBlock(self, blockNum):
+        offset = (blockNum - 1) * self.blockSize
+        pkt = tftpmessages.DataBlock()
+        pkt.blockNum = blockNum & 0xffff
+        pkt.dataBlock = self.fileData[offset:offset + self.blockSize]
+        if self.result.firstBlock is None:
+            self.result.firstBlock = self.sim.now
+        self.blockNum = blockNum
+        self.send(pkt.pack())
+
+    def lastBlockNum(self):
+        return len(self.fileData) // self.blockSize + 1
+
+    def receive(self, pkt):
+        if pkt.opcode == tftpmessages.OPCODE_OACK:
+            if self.blockNum == 0:
+                self.blockSize = int(pkt.options.get('blksize', 512))
+                self.sendBlock(1)
+        elif pkt.opcode == tftpmessages.OPCODE_ACK:
+            if pkt.blockNum != (self.blockNum & 0xffff):
+                return # a duplicate; the timer resends
+            if self.blockNum > 0:
+                self.result.bytes += len(self.lastSent) - 4
+            if self.blockNum == self.lastBlockNum():
+                self.finish(True)
+            else:
+                self.sendBlock(self.blockNum + 1)
+
+class Simulation:
+    '''
+    A simulated network with a virtual clock, a SimulatedServer and clients.
+    '''
+
+    def __init__(self, config = None, link = None, seed = 0):
+        '''
+        config - the server.ServerConfig (the address and port are simulated).
+        link - the default LinkProfile for the clients.
+        seed - the seed for the random loss, jitter etc.
+        '''
+        self.lock = threading.RLock()
+        self.cond = threading.Condition(self.lock) # the simulator thread waits on this
+        self.now = 0.0
+        self.events = [] # a heap of [time, sequence, callback, args]
+        self.sequence = itertools.count()
+        self.running = 0 # operation threads not blocked on the simulator
+        self.endpoints = {} # address -> SimSocket, client or server
+        self.links = {} # client address -> LinkProfile
+        self.busyUntil = {} # sender address -> end of its current transmission
+        self.random = random.Random(seed)
+        self.defaultLink = link or LinkProfile()
+        self.clients = []
+        self.nextClient = 1
+        self.packetsSent = 0
+        self.packetsLost = 0
+        if config is None:
+            config = server.ServerConfig('10.0.0.1', listeningPort=69)
+        self.server = SimulatedServer(self, config)
+
+    def time(self):
+        return self.now
+
+    def schedule(self, delay, callback, *args):
+        '''Call callback(*args) after delay simulated seconds. Returns a
+        handle for cancel().'''
+        entry = [self.now + delay, self.sequence.next(), callback, args]
+        heapq.heappush(self.events, entry)
+        return entry
+
+    def cancel(self, entry):
+        entry[2] = None
+
+    def listen(self, address, handler):
+        s = SimSocket(self, address)
+        self.endpoints[address] = handler
+        return s
+
+    def transmit(self, data, fromAddr, toAddr):
+        '''Send a datagram across the network. Called with the lock held.'''
+        self.packetsSent += 1
+        if toAddr == fromAddr:
+            # e.g. an operation waking itself
+            self.endpoints[toAddr].deliver(data, fromAddr)
+            return
+        link = self.links.get(toAddr) or self.links.get(fromAddr) or self.defaultLink
+        rng = self.random
+        sendTime = self.now
+        if link.bandwidth:
+            sendTime = max(self.now, self.busyUntil.get(fromAddr, 0.0))
+            sendTime += len(data) / float(link.bandwidth)
+            self.busyUntil[fromAddr] = sendTime
+        if rng.random() < link.loss:
+            self.packetsLost += 1
+            return
+        copies = 2 if rng.random() < link.duplicate else 1
+        for i in range(0, copies):
+            delay = sendTime - self.now + link.latency
+            if link.jitter:
+                delay += rng.uniform(0, link.jitter)
+            if rng.random() < link.reorder:
+                if link.reorderDelay is None:
+                    delay += 2 * link.latency
+                else:
+                    delay += link.reorderDelay
+            self.schedule(delay, self.arrive, data, fromAddr, toAddr)
+
+    def arrive(self, data, fromAddr, toAddr):
+        endpoint = self.endpoints.get(toAddr)
+        if endpoint is not None:
+            endpoint.deliver(data, fromAddr)
+
+    def newClientAddress(self, link):
+        address = ('10.1.%d.%d' % (self.nextClient // 250, self.nextClient % 250 + 1), 2000)
+        self.nextClient += 1
+        if link is not None:
+            self.links[address] = link
+        return address
+
+    def addClient(self, client, startAt):
+        self.clients.append(client)
+        self.endpoints[client.address] = client
+        with self.cond:
+            self.schedule(max(0.0, startAt - self.now), client.start)
+        return client
+
+    def addReadClient(self, fileName, startAt = 0.0, options = None, link = None,
+                      timeout = 1.0, retries = 5, keepData = False):
+        '''Add a client reading fileName, starting at the given simulated
+        time. link (a LinkProfile) overrides the default for this client.'''
+        address = self.newClientAddress(link)
+        return self.addClient(SimReadClient(self, address, self.server.address, fileName,
+                                            options, timeout, retries, keepData), startAt)
+
+    def addWriteClient(self, fileName, data, startAt = 0.0, options = None, link = None,
+                       timeout = 1.0, retries = 5):
+        '''Add a client writing data to fileName on the server.'''
+        address = self.newClientAddress(link)
+        return self.addClient(SimWriteClient(self, address, self.server.address, fileName,
+                                             data, options, timeout, retries), startAt)
+
+    def run(self, until = None):
+        '''Run the simulation until nothing more happens, or until the given
+        simulated time. Returns the simulated time reached.'''
+        with self.cond:
+            while True:
+                while self.running > 0:
+                    self.cond.wait()
+                self.server.processEvents()
+                entry = self.nextEvent()
+                if entry is None:
+                    break
+                if until is not None and entry[0] > until:
+                    self.now = until
+                    break
+                heapq.heappop(self.events)
+                self.now = entry[0]
+                entry[2](*entry[3])
+        return self.now
+
+    def nextEvent(self):
+        # Cancelled events are discarded without moving the clock.
+        while self.events and self.events[0][2] is None:
+            heapq.heappop(self.events)
+        if self.events:
+            return self.events[0]
+        return None
+
+    def results(self):
+        return [client.result for client in self.clients]
@@ -0,0 +1,126 @@
+'''
+Per-client option negotiation policy.
+
+A policy is an ordered list of rules. Each rule matches requests by client
+subnet, file name pattern and the options requested, and names the
+OptionProfile that limits what the server accepts for those requests (blksize,
+timeout, tsize and windowsize). The first matching rule wins, in the manner of
+a firewall rule list.
+
+Rules are compiled once, when the server loads its configuration: the subnets
+of all rules go into one SubnetTable and the file patterns of each rule into a
+single regular expression, so a lookup costs one hash lookup per distinct
+prefix length plus a pattern match for each candidate rule.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import fnmatch
+import re
+
+import subnets
+
+class OptionProfile:
+    '''
+    The limits applied to the options of a request. None means use the
+    server's normal setting.
+    '''
+
+    def __init__(self, minBlockSize = None, maxBlockSize = None, mtu = None,
+                 minTimeout = None, maxTimeout = None, tsize = True,
+                 maxWindowSize = None, congestionControl = None):
+        '''
+        minBlockSize, maxBlockSize - the range of blksize values accepted. A
+                                     larger request is reduced to maxBlockSize;
+                                     a smaller one is declined.
+        mtu - the path MTU to assume for these clients (0 for no MTU limit).
+        minTimeout, maxTimeout - the range of timeout values (secs) accepted.
+        tsize - False to decline the tsize option.
+        maxWindowSize - the largest windowsize offered (1 declines the option).
+        congestionControl - False to offer windows without regard to the
+                            client's congestion window.
+        '''
+        self.minBlockSize = minBlockSize
+        self.maxBlockSize = maxBlockSize
+        self.mtu = mtu
+        self.minTimeout = minTimeout
+        self.maxTimeout = maxTimeout
+        self.tsize = tsize
+        self.maxWindowSize = maxWindowSize
+        self.congestionControl = congestionControl
+
+class PolicyRule:
+    '''
+    A rule selecting an OptionProfile. A rule matches a request when the
+    client is in one of its subnets, the file name matches one of its
+    filePatterns and every one of its options was requested. An empty
+    condition matches every request.
+    '''
+
+    def __init__(self, profile, subnets = None, filePatterns = None, options = None,
+                 name = ''):
+        '''
+        profile - the OptionProfile applied to matching requests.
+        subnets - a list of CIDR strings.
+        filePatterns - a list of shell style file name patterns.
+        options - a list of option names (case insensitive).
+        name - a descriptive name, used for log output.
+        '''
+        self.profile = profile
+        self.subnets = list(subnets or [])
+        self.filePatterns = list(filePatterns or [])
+        self.options = [o.lower() for o in (options or [])]
+        self.name = name
+
+class NegotiationPolicy:
+    '''
+    The compiled form of a list of PolicyRule objects.
+    '''
+
+    def __init__(self, rules = None):
+        self.rules = list(rules or [])
+        self.subnetTable = subnets.SubnetTable() # subnet -> rule indices
+        self.anyAddress = [] # indices of rules without subnets
+        self.fileMatchers = [] # per rule, a compiled pattern or None
+
+        for index, rule in enumerate(self.rules):
+            if len(rule.subnets) > 0:
+                for subnet in rule.subnets:
+                    self.subnetTable.add(subnet, index)
+            else:
+                self.anyAddress.append(index)
+
+            if len(rule.filePatterns) > 0:
+                regex = '|'.join('(?:%s)' % fnmatch.translate(p) for p in rule.filePatterns)
+                self.fileMatchers.append(re.compile(regex))
+            else:
+                self.fileMatchers.append(None)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def lookup(self, clientAddr, fileName, options):
+        '''Return the PolicyRule for a request, or None if no rule matches.
+        options is the request's dictionary of options.'''
+        if len(self.rules) == 0:
+            return None
+
+        candidates = self.anyAddress
+        if clientAddr is not None:
+            found = self.subnetTable.lookup(clientAddr[0])
+            if len(found) > 0:
+                candidates = sorted(set(found + candidates))
+
+        requested = None
+        for index in candidates:
+            matcher = self.fileMatchers[index]
+            if matcher is not None and matcher.match(fileName) is None:
+                continue
+
+            rule = self.rules[index]
+            if len(rule.options) > 0:
+                if requested is None:
+                    requested = set(name.lower() for name in options)
+                if not requested.issuperset(rule.options):
+                    continue
+            return rule
+        return None
@@ -0,0 +1,97 @@
+'''
+A record of the files served, kept between runs of the server so that the most
+popular files can be loaded into memory before the first requests arrive.
+
+The manifest is a text file with a line for each file:
+    <count> <bytes> <last access (unix time)> <file name>
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import os
+import time
+import threading
+
+class FileRecord:
+    '''How often, and how recently, a file has been served.'''
+
+    def __init__(self, count = 0, size = 0, lastAccess = 0):
+        self.count = count
+        self.size = size # bytes
+        self.lastAccess = lastAccess # unix time
+
+class PopularityManifest:
+    '''
+    The popularity of the files served, persisted to a manifest file.
+    '''
+
+    def __init__(self, path, maxEntries = 10000):
+        '''
+        path - the manifest file.
+        maxEntries - the number of files remembered (the least popular are
+                     dropped when the manifest is saved).
+        '''
+        self.path = path
+        self.maxEntries = maxEntries
+        self.records = {} # file name -> FileRecord
+        self.dirty = False
+        self.mutex = threading.Lock()
+
+    def load(self):
+        '''Read the manifest file, if there is one. Malformed lines are ignored.'''
+        if not os.path.isfile(self.path):
+            return
+        records = {}
+        with open(self.path, 'r') as f:
+            for line in f:
+                fields = line.rstrip('\n').split(' ', 3)
+                if len(fields) != 4 or line.startswith('#'):
+                    continue
+                try:
+                    records[fields[3]] = FileRecord(int(fields[0]), int(fields[1]), int(fields[2]))
+                except ValueError:
+                    pass
+        with self.mutex:
+            self.records = records
+            self.dirty = False
+
+    def save(self):
+        '''Write the manifest file (if anything has changed). The file is
+        replaced atomically.'''
+        with self.mutex:
+            if not self.dirty:
+                return
+            entries = self.mostPopular(self.maxEntries)
+            self.dirty = False
+
+        tempPath = self.path + '.tmp'
+        with open(tempPath, 'w') as f:
+            f.write('# tftpud popularity manifest: count bytes lastAccess name\n')
+            for fileName, record in entries:
+                f.write('%d %d %d %s\n' % (record.count, record.size, record.lastAccess, fileName))
+        os.rename(tempPath, self.path)
+
+    def record(self, fileName, size):
+        '''A read request for the file (of size bytes) is being served.'''
+        if fileName.find('\n') >= 0:
+            return
+        with self.mutex:
+            record = self.records.get(fileName)
+            if record is None:
+                record = FileRecord()
+                self.records[fileName] = record
+            record.count += 1
+            record.size = size
+            record.lastAccess = int(time.time())
+            self.dirty = True
+
+    def mostPopular(self, n):
+        # Called with the mutex held.
+        entries = sorted(self.records.iteritems(),
+                         key=lambda e: (e[1].count, e[1].lastAccess), reverse=True)
+        return entries[:n]
+
+    def topFiles(self, n):
+        '''Return the n most served files as (file name, FileRecord) tuples,
+        most popular first (the most recent first for equal counts).'''
+        with self.mutex:
+            return self.mostPopular(n)
@@ -0,0 +1,125 @@
+'''
+Per-phase timing of transfers.
+
+When profiling is enabled each operation has a TransferProfile, and the time
+it spends in each phase of the transfer (checking the file, negotiating
+options, reading the disk, sending, waiting for the client) is added up with
+a monotonic clock. When it is disabled the operation's profile is None and
+the only cost is testing for that.
+
+Completed profiles are passed to the hooks, and the slowest transfers are
+kept for a report.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import heapq
+import itertools
+
+from .. import clock
+
+# Phases
+STAT = 0 # checking and opening the file (or waiting for an upstream server)
+NEGOTIATE = 1 # option negotiation, including the OACK exchange
+READ = 2 # reading blocks of the file
+SEND = 3 # sending data packets
+WAIT_ACK = 4 # waiting for ACKs
+WAIT_DATA = 5 # waiting for data packets (write requests)
+WRITE = 6 # writing blocks to the file
+
+PHASE_NAMES = ('stat', 'negotiate', 'read', 'send', 'waitAck', 'waitData', 'write')
+
+class TransferProfile:
+    '''The phase timings of one transfer.'''
+
+    def __init__(self, profiler, kind, fileName, clientAddr):
+        self.profiler = profiler
+        self.kind = kind # 'RRQ' or 'WRQ'
+        self.fileName = fileName
+        self.clientAddr = clientAddr
+        self.times = [0.0] * len(PHASE_NAMES) # seconds per phase
+        self.counts = [0] * len(PHASE_NAMES)
+        self.started = clock.monotonic()
+        self.duration = None
+
+    def begin(self):
+        '''Return the start time of a phase, for end().'''
+        return clock.monotonic()
+
+    def end(self, phase, started):
+        '''Add the time since started to the phase.'''
+        elapsed = clock.monotonic() - started
+        self.times[phase] += elapsed
+        self.counts[phase] += 1
+        for hook in self.profiler.hooks:
+            hook.phase(self, phase, elapsed)
+
+    def complete(self):
+        self.duration = clock.monotonic() - self.started
+        self.profiler.complete(self)
+
+    def breakdown(self):
+        '''Return {phase name: (seconds, count)}.'''
+        return dict((PHASE_NAMES[i], (self.times[i], self.counts[i]))
+                    for i in range(len(PHASE_NAMES)))
+
+class ProfileHook:
+    '''A base class for profiling hooks. Both methods are called on the
+    operation's thread, so they should be quick.'''
+
+    def phase(self, profile, phase, seconds):
+        '''A phase of a transfer took the given time.'''
+        pass
+
+    def complete(self, profile):
+        '''A transfer has finished (profile.duration is set).'''
+        pass
+
+class TransferProfiler:
+    '''
+    Creates the profiles of the transfers and keeps the slowest ones.
+    '''
+
+    def __init__(self, keepSlowest = 20, hooks = None):
+        '''
+        keepSlowest - the number of slowest transfers kept for report().
+        hooks - a list of ProfileHook objects.
+        '''
+        self.keepSlowest = keepSlowest
+        self.hooks = list(hooks or [])
+        self.slowest = [] # a min-heap of (duration, sequence, profile)
+        self.sequence = itertools.count()
+        self.numProfiled = 0
+        self.mutex = threading.Lock()
+
+    def newProfile(self, kind, fileName, clientAddr):
+        return TransferProfile(self, kind, fileName, clientAddr)
+
+    def complete(self, profile):
+        for hook in self.hooks:
+            hook.complete(profile)
+        entry = (profile.duration, self.sequence.next(), profile)
+        with self.mutex:
+            self.numProfiled += 1
+            if len(self.slowest) < self.keepSlowest:
+                heapq.heappush(self.slowest, entry)
+            elif self.keepSlowest > 0 and entry[0] > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def slowestTransfers(self, n = None):
+        '''Return the profiles of the slowest transfers, slowest first.'''
+        with self.mutex:
+            entries = sorted(self.slowest, reverse=True)
+        return [profile for duration, seq, profile in entries[:n]]
+
+    def report(self, n = None):
+        '''Return a text table of the phase times (ms) of the slowest transfers.'''
+        profiles = self.slowestTransfers(n)
+        lines = ['Slowest %d of %d transfers (ms):' % (len(profiles), self.numProfiled)]
+        lines.append('%9s ' % 'total' + ' '.join('%9s' % name for name in PHASE_NAMES) +
+                     '  transfer')
+        for profile in profiles:
+            lines.append('%9.1f ' % (profile.duration * 1000) +
+                         ' '.join('%9.1f' % (t * 1000) for t in profile.times) +
+                         '  %s %s %s' % (profile.kind, profile.fileName, profile.clientAddr))
+        return '\n'.join(lines)
@@ -0,0 +1,334 @@
+'''
+A read-through file cache for running the server as a TFTP proxy.
+
+Files not in the cache are fetched from an upstream TFTP server into the cache
+directory. The reads waiting for a file are served from the partly written
+cache file as the blocks arrive, so a client does not wait for the whole file,
+and concurrent requests for the same file share a single upstream fetch. The
+least recently used files are removed to keep the cache within its size limit.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import os
+import threading
+import collections
+import itertools
+import urllib
+
+from .. import tftpmessages
+from ..client import client
+from ..client import readoperation as clientread
+
+# Suffix of the files being fetched. They are removed at startup.
+PARTIAL_SUFFIX = '.part'
+
+class UpstreamError(Exception):
+    '''A fetch from the upstream server failed. The error code is passed on to
+    the client.'''
+
+    def __init__(self, errorCode, errorMsg):
+        Exception.__init__(self, errorMsg)
+        self.errorCode = errorCode
+        self.errorMsg = errorMsg
+
+class Fetch:
+    '''
+    A download of one file from the upstream server. The readers of the file
+    wait on the condition for the file to grow.
+    '''
+
+    def __init__(self, cache, fileName, tempPath):
+        self.cache = cache
+        self.fileName = fileName
+        self.tempPath = tempPath
+        self.f = open(tempPath, 'wb')
+        self.cond = threading.Condition()
+        self.started = False # the upstream server has responded
+        self.length = 0 # bytes written so far
+        self.size = None # the file size, if known (tsize)
+        self.complete = False
+        self.error = None # an UpstreamError if the fetch failed
+
+    def start(self):
+        thread = threading.Thread(target=self.run, name='tftpud-fetch')
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        try:
+            try:
+                self.download()
+            finally:
+                self.f.close()
+        except UpstreamError, e:
+            self.finish(e)
+        except Exception, e:
+            self.finish(UpstreamError(tftpmessages.ERR_NOT_DEFINED, 'Upstream fetch failed: ' + str(e)))
+        else:
+            self.finish(None)
+
+    def finish(self, error):
+        try:
+            # The file joins the cache before the readers see it complete.
+            self.cache.fetchComplete(self, error)
+        finally:
+            # The readers are woken whatever happened.
+            with self.cond:
+                self.error = error
+                self.complete = error is None
+                if self.complete:
+                    self.size = self.length
+                self.started = True
+                self.cond.notify_all()
+
+    def download(self):
+        '''Fetch the file with the client's read operation, writing each
+        block to the cache file as it arrives.'''
+        config = client.ClientConfig(self.cache.upstream)
+        config.blkSize = self.cache.blockSize
+        config.tsize = True
+        config.timeout = self.cache.timeout
+        config.retries = self.cache.retries
+        config.bufferSize = 0 # every block to the cache file as it arrives
+        upstream = client.Client(config)
+        s, upstreamAddr = upstream.createSocket()
+        try:
+            op = clientread.ReadOperation(s, config, self.fileName, self.append, upstreamAddr)
+            op.onOptions = self.optionsAccepted
+            op.run()
+        finally:
+            s.close()
+        if isinstance(op.error, clientread.ServerError):
+            raise UpstreamError(op.error.errorCode, op.error.errorMsg)
+        elif op.error is not None:
+            raise op.error
+
+    def optionsAccepted(self, op):
+        '''The upstream server has answered with an OACK: the file size is
+        known if it acknowledged the tsize.'''
+        self.setStarted(op.transferSize)
+        return True
+
+    def setStarted(self, size):
+        with self.cond:
+            self.started = True
+            self.size = size
+            self.cond.notify_all()
+
+    def append(self, data):
+        self.f.write(data)
+        self.f.flush()
+        with self.cond:
+            self.started = True
+            self.length += len(data)
+            self.cond.notify_all()
+
+    def waitStarted(self, isAborted = None):
+        '''Wait for the upstream server to respond. Raises UpstreamError if
+        the fetch failed before any data arrived.'''
+        with self.cond:
+            while not self.started:
+                self.cond.wait(0.5)
+                if isAborted is not None and isAborted():
+                    raise Exception('Operation aborted')
+            if self.error is not None and self.length == 0:
+                raise self.error
+
+    def waitForData(self, length, block, isAborted = None):
+        '''Return True once the file has at least length bytes or is complete.
+        Without block, return False rather than wait.'''
+        with self.cond:
+            while self.length < length and not self.complete:
+                if self.error is not None:
+                    raise self.error
+                if not block:
+                    return False
+                self.cond.wait(0.5)
+                if isAborted is not None and isAborted():
+                    raise Exception('Operation aborted')
+            return True
+
+class CachedFileSource:
+    '''
+    The blocks of a cached file, for the ReadOperation. While the file is
+    still being fetched the reads wait for its blocks to arrive.
+    '''
+
+    def __init__(self, path, size, fetch = None):
+        self.fd = os.open(path, os.O_RDONLY)
+        self.fetch = fetch
+        self.fileSize = size
+        self.blockSize = 512
+        self.offset = 0
+        self.isAborted = None # a function returning True to stop waiting
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def waitReady(self):
+        '''Wait for the upstream server to respond to a fetch.'''
+        if self.fetch is not None:
+            self.fetch.waitStarted(self.isAborted)
+
+    def size(self):
+        '''Return the file size, or None if it is not yet known.'''
+        if self.fetch is not None:
+            return self.fetch.size
+        return self.fileSize
+
+    def getBlocks(self, maxNum):
+        '''Return up to maxNum blocks. While fetching, only the blocks already
+        received are returned (waiting only if there are none).'''
+        blocks = []
+        while self.fd is not None and len(blocks) < maxNum:
+            if self.fetch is not None:
+                if not self.fetch.waitForData(self.offset + self.blockSize,
+                                              len(blocks) == 0, self.isAborted):
+                    break
+            d = os.read(self.fd, self.blockSize)
+            if len(d) == 0:
+                self.close()
+                break
+            self.offset += len(d)
+            blocks.append(d)
+        return blocks
+
+class ProxyCache:
+    '''
+    The cache directory and the fetches in progress.
+    '''
+
+    def __init__(self, upstream, cacheDir, maxBytes, blockSize = 1468,
+                 timeout = 3.0, retries = 3):
+        '''
+        upstream - the (host, port) of the upstream TFTP server.
+        cacheDir - the directory for the cached files (created if necessary).
+        maxBytes - the size limit of the cache.
+        blockSize - the blksize requested from the upstream server.
+        timeout, retries - retransmission settings for the upstream fetches.
+        '''
+        self.upstream = upstream
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.blockSize = blockSize
+        self.timeout = timeout
+        self.retries = retries
+        self.entries = collections.OrderedDict() # file name -> size, least recently used first
+        self.totalBytes = 0
+        self.fetches = {} # file name -> Fetch in progress
+        self.fetchIds = itertools.count()
+        self.mutex = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.sharedFetches = 0
+        self.evictions = 0
+
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self.loadEntries()
+
+    def loadEntries(self):
+        '''Index the files left in the cache directory, oldest access first.'''
+        found = []
+        for name in os.listdir(self.cacheDir):
+            path = os.path.join(self.cacheDir, name)
+            if name.endswith(PARTIAL_SUFFIX):
+                os.remove(path)
+            elif os.path.isfile(path):
+                stat = os.stat(path)
+                found.append((stat.st_atime, urllib.unquote(name), stat.st_size))
+        for atime, fileName, size in sorted(found):
+            self.entries[fileName] = size
+            self.totalBytes += size
+        with self.mutex:
+            self.evict()
+
+    def cachePath(self, fileName):
+        # Quoting keeps every cached file directly in the cache directory. A
+        # leading dot is quoted too, so that '.' and '..' are plain names.
+        name = urllib.quote(fileName, safe='')
+        if name.startswith('.'):
+            name = '%2E' + name[1:]
+        return os.path.join(self.cacheDir, name)
+
+    def open(self, fileName):
+        '''Return a CachedFileSource for the file, starting an upstream fetch
+        if the file is not cached. Raises UpstreamError if the file can't be
+        fetched into the cache.'''
+        if not fileName:
+            raise UpstreamError(tftpmessages.ERR_ACCESS_VIOLATION, 'Invalid file name')
+        with self.mutex:
+            size = self.entries.pop(fileName, None)
+            if size is not None:
+                try:
+                    source = CachedFileSource(self.cachePath(fileName), size)
+                except OSError:
+                    # Removed from the directory behind our back.
+                    self.totalBytes -= size
+                else:
+                    self.entries[fileName] = size # now the most recently used
+                    self.hits += 1
+                    return source
+
+            fetch = self.fetches.get(fileName)
+            if fetch is None:
+                self.misses += 1
+                tempPath = '%s.%d%s' % (self.cachePath(fileName), self.fetchIds.next(), PARTIAL_SUFFIX)
+                try:
+                    fetch = Fetch(self, fileName, tempPath)
+                except IOError, e:
+                    raise UpstreamError(tftpmessages.ERR_NOT_DEFINED,
+                                        'Failed to create the cache file: ' + str(e.strerror))
+                self.fetches[fileName] = fetch
+                fetch.start()
+            else:
+                self.sharedFetches += 1
+            return CachedFileSource(fetch.tempPath, None, fetch)
+
+    def fetchComplete(self, fetch, error):
+        '''Called by a fetch when it finishes. A complete file joins the cache.
+        (Readers still holding the file open can finish reading it even if it
+        is removed.)'''
+        with self.mutex:
+            if self.fetches.get(fetch.fileName) is fetch:
+                del self.fetches[fetch.fileName]
+            if error is None and fetch.length <= self.maxBytes:
+                try:
+                    os.rename(fetch.tempPath, self.cachePath(fetch.fileName))
+                except OSError:
+                    pass # not cached; the readers have the partial file open
+                else:
+                    self.entries[fetch.fileName] = fetch.length
+                    self.totalBytes += fetch.length
+                    self.evict()
+                    return
+            try:
+                os.remove(fetch.tempPath)
+            except OSError:
+                pass
+
+    def evict(self):
+        # Called with the mutex held.
+        while self.totalBytes > self.maxBytes and len(self.entries) > 0:
+            fileName, size = self.entries.popitem(last=False)
+            self.totalBytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.cachePath(fileName))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.mutex:
+            return {'files' : len(self.entries),
+                    'bytes' : self.totalBytes,
+                    'hits' : self.hits,
+                    'misses' : self.misses,
+                    'sharedFetches' : self.sharedFetches,
+                    'evictions' : self.evictions,
+                    'fetching' : len(self.fetches)}
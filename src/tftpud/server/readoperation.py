@@ -3,15 +3,26 @@ All tftpud code licensed under the MIT License: http://mit-licence.org
 '''
 import os
 import socket # for timeout exception
+import collections
 
 from .. import tftpoperation
 from .. import tftpmessages
+from .. import eventlog
+import proxycache
+import memorycache
+import netasciicache
+import profiling
+import sampler
 
 class FileBlockSource:
     
-    def __init__(self, fileName, blockSize):
+    def __init__(self, fileName, blockSize, offset = 0, length = None):
+        '''offset and length select a range of the file.'''
         self.f = open(fileName, 'rb')
         self.blockSize = blockSize
+        self.remaining = length # bytes left to read, None for the whole file
+        if offset:
+            self.f.seek(offset)
         
     def __del__(self):
         if self.f:
@@ -20,7 +31,11 @@ class FileBlockSource:
     def getBlocks(self, maxNum):
         blocks = []
         while self.f and len(blocks) < maxNum:
-            d = self.f.read(self.blockSize)
+            size = self.blockSize
+            if self.remaining is not None:
+                size = min(size, self.remaining)
+                self.remaining -= size
+            d = self.f.read(size) if size > 0 else ''
             if len(d) == 0:
                 # end of file
                 self.f.close()
@@ -34,27 +49,78 @@ class ReadOperation(tftpoperation.TftpOperation):
     An Server TFTP Read Operation
     '''
 
-    def __init__(self, sock, clientAddr, pkt, timeout=3.0, retries=3):
+    def __init__(self, sock, clientAddr, pkt, timeout=3.0, retries=3, server=None):
         '''
         Constructor
+        server - the Server object that owns this operation (optional).
         '''
         tftpoperation.TftpOperation.__init__(self)
+        self.server = server
+        if server is not None:
+            self.useServer(server)
         self.s = sock
         self.clientAddr = clientAddr
         self.fileName = pkt.fileName
         self.mode = pkt.mode
         self.blockSize = 512 # default, can be overridden by RRQ extension
-        self.retries = 3
-        self.abortRequested = False
+        self.retries = retries
+        
+        # Fast retransmit after this many duplicate ACKs (0 = never)
+        self.dupAckThreshold = 2
+        if server is not None:
+            self.dupAckThreshold = server.config.dupAckThreshold
+        self.duplicateAcks = 0
+        self.fastRetransmits = 0
+        
+        # Windowed transfers (RFC 7440). The window is 1 block (lock-step)
+        # unless the client asks for more with the windowsize option.
+        self.windowSize = 1
+        self.maxWindowSize = 64
+        self.congestion = None # congestion.CongestionControl, optional
+        if server is not None:
+            self.maxWindowSize = server.config.maxWindowSize
+            self.congestion = server.congestion
+        self.windowsSent = 0
+        self.timeouts = 0
+        self.blocksRetransmitted = 0
         
         # Set the socket timeout to match the given param
-        self.s.settimeout(timeout)
+        self.setTimeout(timeout)
         
         self.blocks = []
+        self.blockIndex = 0
+        self.lastBlockSize = None # None until the first block is read
         
         self.fileSource = None
         
-        self.fileSize = 0 # bytes
+        # In proxy mode files are read through the server's cache
+        self.cache = None # proxycache.ProxyCache, optional
+        if server is not None:
+            self.cache = server.cache
+        
+        # Files preloaded into memory, and the record of files served
+        self.memoryCache = None # memorycache.MemoryFileCache, optional
+        self.popularity = None # popularity.PopularityManifest, optional
+        if server is not None:
+            self.memoryCache = server.memoryCache
+            self.popularity = server.popularity
+        
+        # Files are converted as they are sent in netascii mode, or sent
+        # from the converted files in memory.
+        self.netascii = self.mode.lower() == 'netascii'
+        self.netasciiCache = None # netasciicache.NetasciiCache, optional
+        if server is not None:
+            self.netasciiCache = server.netasciiCache
+        
+        self.fileSize = 0 # bytes (None if unknown)
+        
+        # The byte range requested with the range option (None for the
+        # whole file).
+        self.allowRange = False
+        if server is not None:
+            self.allowRange = server.config.allowRange
+        self.rangeOffset = 0
+        self.rangeLength = None
         
         # Import options
         self.readOpts = pkt.options
@@ -68,43 +134,55 @@ class ReadOperation(tftpoperation.TftpOperation):
         Send an OACK packet back to the client and wait for the ACK in response.
         '''
         if len(self.readOpts) > 0:
+            self.applyPolicy(self.fileName, self.readOpts)
             oack = tftpmessages.OptionAcknowledgement()
             try:
                 for name, val in self.readOpts.items():
                     lowerCaseName = name.lower()
-                    if name.lower() == 'blksize': # RFC 2348
-                        self.blockSize = int(val)
-                        oack.options[name] = val
+                    if lowerCaseName == 'blksize': # RFC 2348
+                        # Echo the accepted (possibly reduced) size in the OACK
+                        accepted = self.negotiateBlockSize(int(val))
+                        if accepted is not None:
+                            self.blockSize = accepted
+                            oack.options[name] = str(accepted)
                     elif lowerCaseName == 'timeout': # RFC 2349
                         secs = int(val)
-                        if secs >= 1 and secs <= 255:
-                            self.s.settimeout(int(val))
+                        if secs >= self.minTimeout and secs <= self.maxTimeout:
+                            self.setTimeout(secs)
                             oack.options[name] = val
                     elif lowerCaseName == 'tsize': # RFC 2349
                         # the value should be zero.
-                        if int(val) == 0:
+                        if int(val) == 0 and self.allowTsize and self.fileSize is not None:
                             # Write the actual file size back to the client in the
                             # OACK,
                             oack.options[name] = str( self.fileSize )
+                    elif lowerCaseName == 'windowsize': # RFC 7440
+                        requested = int(val)
+                        if requested >= 1 and requested <= 65535 and self.maxWindowSize > 1:
+                            if self.congestion is not None:
+                                self.windowSize = self.congestion.window(self.clientAddr, requested)
+                            else:
+                                self.windowSize = min(requested, self.maxWindowSize)
+                            oack.options[name] = str(self.windowSize)
+                    elif lowerCaseName == 'range':
+                        accepted = self.negotiateRange(val)
+                        if accepted is not None:
+                            oack.options[name] = accepted
             except:
                 # Send an error packet and bail out with an exception.
                 self.sendErrorPkt(tftpmessages.ERR_OPTION_FAIL, 'Failed to process RRQ options')
                 raise Exception('Failed to process RRQ options')
             else:
                 if len(oack.options) > 0:
-                    # Send the oack
-                    self.s.sendto(oack.pack(), self.clientAddr)
+                    # Send the oack (retransmitting it as necessary)
+                    self.sendReliably(oack.pack())
                     
                     # Now wait for an ack.
-                    retryCount = 0
                     while not self.abortRequested and not self.waitForAck(0):
-                        if retryCount < self.retries:
-                            retryCount += 1
-                            # resend the oack
-                            self.s.sendto(oack.pack(), self.clientAddr)
-                        else:
+                        if not self.responseTimeout():
                             # Fail
                             raise Exception('Failed to receive expected ACK packet')
+                    self.responseReceived()
                 else:
                     # No options. Continue as normal (as if no options).
                     pass
@@ -116,15 +194,26 @@ class ReadOperation(tftpoperation.TftpOperation):
     def runImpl(self):
         '''
         The main thread function for the Server Read Operation.
-        Split the requested file into blocks, then send each one in lock-step.
+        Split the requested file into blocks, then send them to the client.
         '''
-        self.addLogMsg('RRQ: ' + str(self.clientAddr) + ', ' + self.fileName + ' , options : ' + str(self.readOpts))
+        self.logEvent(eventlog.RRQ, self.clientAddr, self.fileName, self.readOpts)
+        self.beginTransfer('RRQ')
+        profile = self.profile
         
         # Ensure the input packet mode string is acceptable
-        if self.mode.lower() != 'octet':
-            self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, 'Only octet mode supported')
-            raise Exception('Only mode octet supported')
+        if self.mode.lower() not in ('octet', 'netascii'):
+            self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, 'Only octet and netascii modes supported')
+            raise Exception('Only modes octet and netascii supported')
+        
+        if self.cache is not None:
+            if self.netascii:
+                self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, 'Only octet mode supported in proxy mode')
+                raise Exception('Only mode octet supported in proxy mode')
+            self.sendFromCache()
+            return
         
+        if profile is not None:
+            started = profile.begin()
         # Check the file exists
         if not os.path.isfile(self.fileName):
             # Send back an error packet
@@ -133,70 +222,237 @@ class ReadOperation(tftpoperation.TftpOperation):
             # Get the file size for progress reporting
             stat = os.stat(self.fileName)
             self.fileSize = stat.st_size
+            if self.popularity is not None:
+                self.popularity.record(self.fileName, self.fileSize)
+            
+            data = None
+            if self.netascii:
+                data = self.getNetascii(stat)
+            elif self.memoryCache is not None:
+                data = self.memoryCache.get(self.fileName, stat)
+            if profile is not None:
+                profile.end(profiling.STAT, started)
             
             # Check the options (including the OACK/ACK exchange if required)
-            self.processOptions()
+            self.negotiate()
             
             # The file exists, so split it into the required blocks.
-            self.fileSource = FileBlockSource(self.fileName, self.blockSize)
-            self.generateBlocks()
+            if data is not None:
+                self.fileSource = memorycache.MemoryBlockSource(data, self.blockSize,
+                                                                self.rangeOffset,
+                                                                self.rangeLength)
+            elif self.netascii:
+                self.fileSource = netasciicache.NetasciiBlockSource(
+                    FileBlockSource(self.fileName, self.blockSize), self.blockSize,
+                    lambda size: self.recordNetasciiSize(stat, size))
+            else:
+                self.fileSource = FileBlockSource(self.fileName, self.blockSize,
+                                                  self.rangeOffset, self.rangeLength)
+            self.sendBlocks()
             
-            blockNum = 1
-            numBlocks= 0 # used only for log output
-            finished = False
-            finalPass = False
-            prevBlockSize = 0
-            bytesSent = 0
+    def getNetascii(self, stat):
+        '''Return the file converted to netascii if it is in memory, or None
+        to convert it as it is sent. The fileSize becomes the converted size.
+        If that is not known yet and the client asked for the tsize, the file
+        is read once to measure it; otherwise it is None (no tsize).'''
+        data = None
+        self.fileSize = None
+        if self.netasciiCache is not None:
+            data, self.fileSize = self.netasciiCache.get(self.fileName, stat)
+        if (self.fileSize is None and self.allowTsize and
+            'tsize' in [name.lower() for name in self.readOpts]):
+            self.fileSize = netasciicache.convertedSize(self.fileName)
+            self.recordNetasciiSize(stat, self.fileSize)
+        return data
+    
+    def recordNetasciiSize(self, stat, size):
+        if self.netasciiCache is not None:
+            self.netasciiCache.recordSize(self.fileName, stat, size)
             
-            while not finished:
-                for block in self.blocks:
-                    prevBlockSize = len(block)
-                    
-                    if self.abortRequested:
-                        raise Exception('Operation aborted')
-                    
-                    retryCount = 0
-                    
-                    # Send the data block
-                    pkt = tftpmessages.DataBlock()
-                    pkt.blockNum = blockNum
-                    pkt.dataBlock = block
-                    blockPacket = pkt.pack()
-                    self.s.sendto(blockPacket, self.clientAddr)
-                    
-                    while not self.abortRequested and not self.waitForAck(pkt.blockNum):
-                        retryCount += 1
-                        if retryCount <= self.retries:
-                            # Resend the previous block
-                            self.s.sendto(blockPacket, self.clientAddr)
-                        else:
-                            errMsg = 'Failed to get ack for block ' + str(pkt.blockNum)
-                            self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, errMsg)
-                            raise Exception(errMsg)
-                    
-                    blockNum += 1
-                    numBlocks += 1
-                    if blockNum > 0xffff:
-                        blockNum = 0 # wrap around to zero
-                        
-                    bytesSent += len(block)
-                    
-                # This block group has been sent. Get the next.
-                if finalPass:
-                    finished = True
-                    self.addLogMsg('RRQ operation complete in %d blocks' % numBlocks)
-                else:
-                    self.generateBlocks()
-                    if len(self.blocks) == 0:
-                        finalPass = True
-                        if prevBlockSize == self.blockSize:
-                            # Add the one final (empty) block to terminate the operation
-                            self.blocks.append('')
+    def negotiateRange(self, val):
+        '''Return the range to accept for a range option ('first-last' or
+        'first-'), clipped to the file, or None to decline it (the whole file
+        is sent).'''
+        if (not self.allowRange or self.cache is not None or self.netascii or
+            not self.fileSize):
+            return None
+        try:
+            first, last = val.split('-', 1)
+            first = int(first)
+            last = int(last) if last else self.fileSize - 1
+        except ValueError:
+            return None # malformed
+        last = min(last, self.fileSize - 1)
+        if first < 0 or first > last:
+            return None
+        self.rangeOffset = first
+        self.rangeLength = last - first + 1
+        return '%d-%d' % (first, last)
+        
+    def sendFromCache(self):
+        '''Send the file from the proxy cache, fetching it from the upstream
+        server if necessary.'''
+        profile = self.profile
+        if profile is not None:
+            started = profile.begin()
+        try:
+            source = self.cache.open(self.fileName)
+            source.isAborted = lambda: self.abortRequested
+            source.waitReady()
+        except proxycache.UpstreamError, e:
+            self.sendErrorPkt(e.errorCode, e.errorMsg)
+            raise
+        if profile is not None:
+            profile.end(profiling.STAT, started)
+        if source.fetch is None:
+            self.logEvent(eventlog.CACHE_HIT, self.fileName)
+        
+        self.fileSize = source.size()
+        if self.popularity is not None:
+            self.popularity.record(self.fileName, self.fileSize or 0)
+        self.negotiate()
+        
+        source.blockSize = self.blockSize
+        self.fileSource = source
+        try:
+            self.sendBlocks()
+        except proxycache.UpstreamError, e:
+            self.sendErrorPkt(e.errorCode, e.errorMsg)
+            raise
+        finally:
+            source.close()
+            
+    def sendBlocks(self):
+        '''
+        Send the file to the client in windows of self.windowSize blocks (one
+        block at a time, in lock-step, unless a windowsize was negotiated).
+        Following RFC 7440, the window after an ACK starts at the block after
+        the acknowledged one; any unacknowledged blocks are sent again.
+        '''
+        profile = self.profile
+        window = collections.deque() # (blockNum, packet) not yet acknowledged
+        blockNum = 1
+        numBlocks = 0 # used only for log output
+        endOfFile = False
+        
+        while True:
+            # Fill the window with new blocks.
+            newBlocks = 0
+            newBytes = 0
+            while not endOfFile and len(window) < self.windowSize:
+                block = self.nextBlock()
+                if block is None:
+                    endOfFile = True
+                    break
                     
+                if self.abortRequested:
+                    raise Exception('Operation aborted')
+                
+                # Wait for this transfer's turn to send (if scheduled)
+                self.waitForTurn(self.fileName, self.clientAddr)
+                
+                pkt = tftpmessages.DataBlock()
+                pkt.blockNum = blockNum
+                pkt.dataBlock = block
+                window.append((blockNum, pkt.pack()))
+                
+                newBlocks += 1
+                newBytes += len(block)
+                numBlocks += 1
+                blockNum = (blockNum + 1) & 0xffff # wrap around to zero
+                
+            if len(window) == 0:
+                break
+            
+            if self.abortRequested:
+                raise Exception('Operation aborted')
+            
+            if self.metrics is not None:
+                if self.windowsSent == 0:
+                    self.metrics.timeToFirstBlock.observe(self.clock() - self.startTime)
+                if newBlocks > 0:
+                    self.metrics.blocksSent.inc(newBlocks)
+                    self.metrics.bytesSent.inc(newBytes)
+            
+            # Send the window and wait for it to be acknowledged.
+            firstNum = window[0][0]
+            lastNum = window[-1][0]
+            self.windowsSent += 1
+            sentAt = self.clock()
+            if profile is not None:
+                started = profile.begin()
+            self.sendReliably([packet for num, packet in window])
+            if profile is not None:
+                profile.end(profiling.SEND, started)
+                started = profile.begin()
+            
+            ackNum = None
+            while ackNum is None:
+                ackNum = self.waitForWindowAck(firstNum, lastNum)
+                if self.abortRequested:
+                    raise Exception('Operation aborted')
+                if ackNum is None and not self.responseTimeout():
+                    errMsg = 'Failed to get ack for block ' + str(firstNum)
+                    self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, errMsg)
+                    raise Exception(errMsg)
+            if profile is not None:
+                profile.end(profiling.WAIT_ACK, started)
+            clean = self.retransmitCount == 0
+            self.responseReceived()
+            if clean and self.metrics is not None:
+                # Not measured after a retransmission: which copy was ACKed?
+                self.metrics.ackRtt.observe(self.clock() - sentAt)
+            
+            numAcked = ((ackNum - firstNum) & 0xffff) + 1
+            if numAcked < len(window):
+                # The client missed a block. The rest of the window is resent.
+                self.countRetransmits(len(window) - numAcked)
+                if self.congestion is not None:
+                    self.congestion.onLoss(self.clientAddr)
+            elif clean and self.congestion is not None:
+                self.congestion.onWindowAcked(self.clientAddr, numAcked)
+            for i in range(0, numAcked):
+                window.popleft()
+                
+        self.logEvent(eventlog.READ_COMPLETE, numBlocks)
+        if self.metrics is not None:
+            self.metrics.transferDuration.observe(self.clock() - self.startTime)
+            
+    def nextBlock(self):
+        '''Return the next block of the file, or None after the last block.
+        If the file size is a multiple of the block size (or zero) a final
+        empty block terminates the transfer.'''
+        if self.blockIndex >= len(self.blocks):
+            self.generateBlocks()
+            self.blockIndex = 0
+            if len(self.blocks) == 0:
+                if self.lastBlockSize in (None, self.blockSize):
+                    self.lastBlockSize = 0
+                    return ''
+                return None
+            
+        block = self.blocks[self.blockIndex]
+        self.blockIndex += 1
+        self.lastBlockSize = len(block)
+        return block
             
     def generateBlocks(self):
         # Get up to 200 blocks
-        self.blocks = self.fileSource.getBlocks(200)
+        if self.profile is None:
+            self.blocks = self.fileSource.getBlocks(200)
+        else:
+            started = self.profile.begin()
+            self.blocks = self.fileSource.getBlocks(200)
+            self.profile.end(profiling.READ, started)
+            
+    def negotiate(self):
+        '''Process the options (timed, when profiling).'''
+        if self.profile is None:
+            self.processOptions()
+        else:
+            started = self.profile.begin()
+            self.processOptions()
+            self.profile.end(profiling.NEGOTIATE, started)
         
     def waitForAck(self, blockNum):
         '''
@@ -204,24 +460,60 @@ class ReadOperation(tftpoperation.TftpOperation):
         data block number.
         
         Return True if the expected ACK packet is received.
-        Return False if nothing was received in the permitted timeout, or if an
-        incorrect source port originated some data.
+        Return False if nothing was received in the permitted timeout.
+        '''
+        return self.waitForWindowAck(blockNum, blockNum) is not None
+        
+    def waitForWindowAck(self, firstNum, lastNum):
+        '''
+        Wait for the timeout (socket blocking read) for an ACK of any block in
+        the window firstNum to lastNum.
+        
+        Return the acknowledged block number.
+        Return None if nothing was received in the permitted timeout.
+        Duplicate or delayed ACKs for earlier blocks are ignored (RFC 1123
+        section 4.2.3.1), but dupAckThreshold duplicates of the ACK before the
+        window cause the window to be retransmitted straight away.
         Otherwise, throw an exception to terminate this transfer.
         '''
-        correctSourcePort = False
-        while not correctSourcePort:
+        prevBlockNum = (firstNum - 1) & 0xffff
+        windowLen = (lastNum - firstNum) & 0xffff
+        dupCount = 0
+        while True:
             try:
                 data, fromAddr = self.s.recvfrom(64) # ack should only be 4 bytes
             except socket.timeout:
                 # Nothing received within the timeout
                 break
             
+            if len(data) == 0:
+                # Woken up by the timer wheel or an abort request.
+                break
+            
             sourcePort = fromAddr[1]
             correctSourcePort = sourcePort == self.clientAddr[1]
             if correctSourcePort:
                 pkt = tftpmessages.create_tftp_packet_from_data(data)
-                if pkt.opcode == tftpmessages.OPCODE_ACK and pkt.blockNum == blockNum:
-                    return True
+                if pkt.opcode == tftpmessages.OPCODE_ACK and ((pkt.blockNum - firstNum) & 0xffff) <= windowLen:
+                    if self.timeline is not None:
+                        self.timeline.record(sampler.ACK, pkt.blockNum)
+                    return pkt.blockNum
+                elif pkt.opcode == tftpmessages.OPCODE_ACK and self.isStaleAck(pkt.blockNum, firstNum):
+                    # Don't resend in response to this (the Sorcerer's Apprentice
+                    # bug). Keep waiting for the right ACK.
+                    self.duplicateAcks += 1
+                    if self.timeline is not None:
+                        self.timeline.record(sampler.DUP_ACK, pkt.blockNum)
+                    if pkt.blockNum == prevBlockNum:
+                        dupCount += 1
+                        if self.dupAckThreshold > 0 and dupCount >= self.dupAckThreshold:
+                            # The client is still waiting for this window.
+                            self.fastRetransmit()
+                            self.fastRetransmits += 1
+                            self.countRetransmits(windowLen + 1)
+                            if self.congestion is not None:
+                                self.congestion.onLoss(self.clientAddr)
+                            dupCount = 0
                 elif pkt.opcode == tftpmessages.OPCODE_ERR:
                     # Error received.
                     raise Exception('Error packet receive from client: ' + pkt.errorMsg)
@@ -231,18 +523,63 @@ class ReadOperation(tftpoperation.TftpOperation):
             else:
                 # Incorrect source port (Transfer ID). Send an error packet back to this
                 # end point and continue with this transfer.
+                if self.metrics is not None:
+                    self.metrics.tidErrors.inc()
                 self.sendErrorPkt(tftpmessages.ERR_UNKNOWN_TID, 'Invalid TID')
 
-        return False
+        return None
+    
+    def onRetransmit(self):
+        '''A timeout: the OACK or the window has been resent.'''
+        self.timeouts += 1
+        if self.fileSource is not None:
+            self.countRetransmits(len(self.retransmitData))
+        elif self.metrics is not None:
+            self.metrics.retransmits.inc() # the OACK
+        if self.congestion is not None:
+            self.congestion.onLoss(self.clientAddr)
+            
+    def countRetransmits(self, numBlocks):
+        self.blocksRetransmitted += numBlocks
+        if self.metrics is not None:
+            self.metrics.retransmits.inc(numBlocks)
+            
+    def applyProfile(self, profile):
+        tftpoperation.TftpOperation.applyProfile(self, profile)
+        if profile.maxWindowSize is not None:
+            self.maxWindowSize = profile.maxWindowSize
+        if profile.congestionControl is False:
+            self.congestion = None
+        
+    def transferStats(self):
+        '''Return a dict of the window size and loss statistics of this transfer.'''
+        return {'windowSize' : self.windowSize,
+                'cwnd' : self.congestion.cwnd(self.clientAddr) if self.congestion else None,
+                'windowsSent' : self.windowsSent,
+                'timeouts' : self.timeouts,
+                'blocksRetransmitted' : self.blocksRetransmitted,
+                'duplicateAcks' : self.duplicateAcks,
+                'fastRetransmits' : self.fastRetransmits}
+    
+    def isStaleAck(self, ackNum, blockNum):
+        '''Return True if ackNum is for a block before blockNum (modulo the
+        16 bit block number wrap).'''
+        diff = (blockNum - ackNum) & 0xffff
+        return diff > 0 and diff < 0x8000
     
     def sendErrorPkt(self, errCode, errMsg):
         errPkt = tftpmessages.Error()
         errPkt.errorCode = errCode
         errPkt.errorMsg = errMsg
         self.s.sendto(errPkt.pack(), self.clientAddr)
-        self.addLogMsg('RRQ ERROR: ' + errMsg)
+        if self.metrics is not None:
+            self.metrics.errors.inc(label=errCode)
+        if self.timeline is not None:
+            self.timeline.record(sampler.ERROR, errCode)
+        self.logEvent(eventlog.RRQ_ERROR, errMsg)
         
     def abort(self, block = True):
         self.abortRequested = True
+        self.wakeup()
         if block:
             self.join()
\ No newline at end of file
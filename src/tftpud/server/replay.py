@@ -0,0 +1,165 @@
+'''
+Replays packet traces (see the trace module) against a TFTP server over
+loopback, to reproduce recorded traffic such as a boot storm.
+
+Each traced transfer gets its own client socket and thread and starts at its
+recorded time (divided by the speed-up). The client's datagrams are resent
+in order: each is sent no earlier than its recorded time, and not before the
+server has sent the datagram the client was answering. That keeps the
+exchange in step at any speed, while the recorded gaps (a slow client, a
+lost ACK) are kept when the server is quick enough.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import socket
+import threading
+
+from .. import clock
+from ..stats import percentile
+import trace
+
+class ReplayResult:
+    '''The outcome of replaying one transfer.'''
+
+    def __init__(self, transfer):
+        self.transfer = transfer
+        self.duration = None # seconds, None if the replay failed
+        self.sent = 0 # datagrams sent to the server
+        self.received = 0 # datagrams received from the server
+        self.expected = len([d for d in transfer.datagrams if d[1] == trace.OUTBOUND])
+        self.stalls = 0 # times the server did not answer in time
+        self.mismatches = 0 # server datagrams that were not in the recording
+        self.error = None
+
+class TransferReplay:
+    '''Replays one traced transfer.'''
+
+    def __init__(self, transfer, serverAddr, speed, timeout):
+        self.transfer = transfer
+        self.serverAddr = serverAddr
+        self.speed = speed
+        self.timeout = timeout
+        self.result = ReplayResult(transfer)
+        self.serverTid = None
+        # Hashes of the server's datagrams: recorded, and received so far.
+        # Retransmissions are not expected to match the recording, so
+        # datagrams are matched by content rather than by position.
+        self.recorded = set(hash(data) for offset, direction, data in transfer.datagrams
+                            if direction == trace.OUTBOUND)
+        self.seen = set()
+
+    def run(self, started):
+        '''Replay the transfer; started is the replay's clock.monotonic()
+        start time.'''
+        result = self.result
+        transfer = self.transfer
+        family = socket.AF_INET6 if ':' in self.serverAddr[0] else socket.AF_INET
+        s = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            self.wait(s, started + transfer.started / self.speed, None)
+            begun = clock.monotonic()
+            answering = None # the server datagram the client was answering
+            for offset, direction, data in transfer.datagrams:
+                if direction == trace.OUTBOUND:
+                    answering = data
+                    continue
+                self.wait(s, started + offset / self.speed, answering)
+                if self.serverTid is None:
+                    s.sendto(data, self.serverAddr) # the request
+                else:
+                    s.sendto(data, self.serverTid)
+                result.sent += 1
+            # Collect the server's remaining datagrams (e.g. the last data block).
+            self.wait(s, 0, answering)
+            result.duration = clock.monotonic() - begun
+        except Exception, e:
+            result.error = e
+        finally:
+            s.close()
+
+    def wait(self, s, until, expected):
+        '''Receive from the server until the expected datagram (if any) has
+        arrived and the time is at least until. Gives up waiting for the
+        server after the timeout.'''
+        result = self.result
+        deadline = None
+        while True:
+            now = clock.monotonic()
+            if expected is None or hash(expected) in self.seen:
+                if now >= until:
+                    return
+                s.settimeout(until - now)
+            else:
+                if deadline is None:
+                    deadline = max(now, until) + self.timeout
+                if now >= deadline:
+                    result.stalls += 1
+                    return
+                s.settimeout(deadline - now)
+            try:
+                data, fromAddr = s.recvfrom(65536)
+            except socket.timeout:
+                continue
+            if self.serverTid is None:
+                self.serverTid = fromAddr
+            elif fromAddr != self.serverTid:
+                continue
+            key = hash(data)
+            if key not in self.recorded:
+                result.mismatches += 1
+            self.seen.add(key)
+            result.received += 1
+
+class TraceReplayer:
+    '''
+    Replays the transfers of a trace against a server.
+    '''
+
+    def __init__(self, transfers, serverAddr, speed = 1.0, timeout = 5.0):
+        '''
+        transfers - a list of trace.TracedTransfer objects (see trace.readTrace).
+        serverAddr - the (address, port) of the server's listener.
+        speed - the speed-up: 1 for the original timing, 10 for ten times faster.
+        timeout - seconds to wait for an expected datagram from the server.
+        '''
+        self.transfers = transfers
+        self.serverAddr = serverAddr
+        self.speed = float(speed)
+        self.timeout = timeout
+        self.duration = None
+
+    def run(self):
+        '''Replay every transfer, and return their ReplayResults.'''
+        replays = [TransferReplay(transfer, self.serverAddr, self.speed, self.timeout)
+                   for transfer in self.transfers if transfer.request() is not None]
+        started = clock.monotonic()
+        threads = []
+        for replay in replays:
+            thread = threading.Thread(target=replay.run, args=(started,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        self.duration = clock.monotonic() - started
+        return [replay.result for replay in replays]
+
+def summarize(results, duration):
+    '''Return a text summary of the ReplayResults.'''
+    replayed = [r for r in results if r.duration is not None]
+    failed = len(results) - len(replayed)
+    lines = ['%d transfers replayed in %.3f s (%d failed)' % (len(replayed), duration, failed)]
+    if replayed:
+        durations = [r.duration for r in replayed]
+        lines.append('transfer time: p50 %.1f ms, p99 %.1f ms, max %.1f ms' %
+                     (percentile(durations, 0.5) * 1000, percentile(durations, 0.99) * 1000,
+                      max(durations) * 1000))
+        lines.append('datagrams: %d sent, %d received (%d recorded), %d not recorded' %
+                     (sum(r.sent for r in replayed), sum(r.received for r in replayed),
+                      sum(r.expected for r in replayed), sum(r.mismatches for r in replayed)))
+        lines.append('stalls waiting for the server: %d' % sum(r.stalls for r in replayed))
+    for r in results:
+        if r.error is not None:
+            lines.append('transfer %d (%s): %s' % (r.transfer.transferId,
+                                                   r.transfer.clientAddr, r.error))
+    return '\n'.join(lines)
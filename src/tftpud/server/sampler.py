@@ -0,0 +1,169 @@
+'''
+A tail-latency sampler: packet-level timelines of the slowest transfers.
+
+When sampling is enabled every transfer records a timeline of its packets
+(sends, ACKs, data, retransmissions and timeouts). When the transfer finishes
+its timeline is kept only if the transfer took longer than minDuration or
+retransmitted at least minRetransmits packets. The qualifying timelines are
+reservoir sampled, so at most reservoirSize are kept however many there are.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import random
+import struct
+
+from .. import clock
+from .. import tftpmessages
+
+# Timeline events; the meaning of the two values (a, b) is given for each.
+SEND = 0 # a packet sent (opcode, block number)
+RETRANSMIT = 1 # packets resent after a timeout (number of packets, retry)
+FAST_RETRANSMIT = 2 # packets resent after duplicate ACKs (number of packets, 0)
+TIMEOUT = 3 # no response in time (timeouts so far, 0)
+ACK = 4 # an ACK received (block number, 0)
+DUP_ACK = 5 # a stale or duplicate ACK received (block number, 0)
+DATA = 6 # a data packet received (block number, length)
+ERROR = 7 # an error packet sent (error code, 0)
+EXPIRED = 8 # the retries were exhausted (timeouts, 0)
+
+EVENT_NAMES = ('send', 'retransmit', 'fastRetransmit', 'timeout', 'ack', 'dupAck',
+               'data', 'error', 'expired')
+
+OPCODE_NAMES = {tftpmessages.OPCODE_DATA : 'DATA',
+                tftpmessages.OPCODE_ACK : 'ACK',
+                tftpmessages.OPCODE_OACK : 'OACK',
+                tftpmessages.OPCODE_ERR : 'ERROR'}
+
+class TransferTimeline:
+    '''The packet events of one transfer, as (seconds since the start,
+    event, a, b) tuples.'''
+
+    def __init__(self, sampler, kind, fileName, clientAddr):
+        self.sampler = sampler
+        self.kind = kind # 'RRQ' or 'WRQ'
+        self.fileName = fileName
+        self.clientAddr = clientAddr
+        self.events = []
+        self.maxEvents = sampler.maxEvents
+        self.droppedEvents = 0 # events not recorded after maxEvents
+        self.retransmits = 0 # packets resent
+        self.started = clock.monotonic()
+        self.duration = None
+
+    def record(self, event, a = 0, b = 0):
+        if event in (RETRANSMIT, FAST_RETRANSMIT):
+            self.retransmits += a
+        if len(self.events) < self.maxEvents:
+            self.events.append((clock.monotonic() - self.started, event, a, b))
+        else:
+            self.droppedEvents += 1
+
+    def recordSend(self, packet):
+        '''Record a packet sent (as packed data).'''
+        opcode, blockNum = struct.unpack_from('>HH', packet.ljust(4, '\0'))
+        if opcode not in (tftpmessages.OPCODE_DATA, tftpmessages.OPCODE_ACK):
+            blockNum = 0
+        self.record(SEND, opcode, blockNum)
+
+    def recordTimeout(self, retry, numResent):
+        '''No response arrived in time. The numResent pending packets were
+        resent, or none if the retries are exhausted.'''
+        self.record(TIMEOUT, retry)
+        if numResent > 0:
+            self.record(RETRANSMIT, numResent, retry)
+        else:
+            self.record(EXPIRED, retry)
+
+    def recordFastRetransmit(self, numResent):
+        self.record(FAST_RETRANSMIT, numResent)
+
+    def complete(self):
+        self.duration = clock.monotonic() - self.started
+        self.sampler.complete(self)
+
+    def format(self):
+        '''Return the timeline as text, one event per line.'''
+        lines = ['%s %s %s: %.1f ms, %d packets resent' %
+                 (self.kind, self.fileName, self.clientAddr,
+                  (self.duration or 0) * 1000, self.retransmits)]
+        for offset, event, a, b in self.events:
+            if event == SEND:
+                detail = '%s %d' % (OPCODE_NAMES.get(a, str(a)), b)
+            elif event == DATA:
+                detail = '%d (%d bytes)' % (a, b)
+            elif event == RETRANSMIT:
+                detail = '%d packets (retry %d)' % (a, b)
+            elif event == FAST_RETRANSMIT:
+                detail = '%d packets' % a
+            else:
+                detail = str(a)
+            lines.append('%10.3f ms %-14s %s' % (offset * 1000, EVENT_NAMES[event], detail))
+        if self.droppedEvents:
+            lines.append('(%d more events not recorded)' % self.droppedEvents)
+        return '\n'.join(lines)
+
+class TailSampler:
+    '''
+    Keeps a bounded random sample of the timelines of slow transfers.
+    '''
+
+    def __init__(self, minDuration = 5.0, minRetransmits = 10, reservoirSize = 32,
+                 maxEvents = 10000):
+        '''
+        minDuration - transfers taking at least this long (seconds) are sampled.
+        minRetransmits - transfers resending at least this many packets are sampled.
+        reservoirSize - the maximum number of timelines kept.
+        maxEvents - the maximum number of events recorded per transfer.
+        '''
+        self.minDuration = minDuration
+        self.minRetransmits = minRetransmits
+        self.reservoirSize = reservoirSize
+        self.maxEvents = maxEvents
+        self.reservoir = []
+        self.numTransfers = 0 # transfers completed
+        self.numQualified = 0 # transfers over a threshold
+        self.mutex = threading.Lock()
+        self.random = random.Random()
+
+    def newTimeline(self, kind, fileName, clientAddr):
+        return TransferTimeline(self, kind, fileName, clientAddr)
+
+    def qualifies(self, timeline):
+        return ((self.minDuration is not None and timeline.duration >= self.minDuration) or
+                (self.minRetransmits is not None and timeline.retransmits >= self.minRetransmits))
+
+    def complete(self, timeline):
+        qualifies = self.qualifies(timeline)
+        with self.mutex:
+            self.numTransfers += 1
+            if not qualifies:
+                return
+            self.numQualified += 1
+            # Reservoir sampling (algorithm R): each qualifying transfer has
+            # the same chance of being kept.
+            if len(self.reservoir) < self.reservoirSize:
+                self.reservoir.append(timeline)
+            else:
+                index = self.random.randint(0, self.numQualified - 1)
+                if index < self.reservoirSize:
+                    self.reservoir[index] = timeline
+
+    def samples(self):
+        '''Return the sampled timelines, slowest first.'''
+        with self.mutex:
+            timelines = list(self.reservoir)
+        timelines.sort(key=lambda timeline: timeline.duration, reverse=True)
+        return timelines
+
+    def stats(self):
+        with self.mutex:
+            return {'transfers' : self.numTransfers,
+                    'qualified' : self.numQualified,
+                    'sampled' : len(self.reservoir)}
+
+    def clear(self):
+        with self.mutex:
+            self.reservoir = []
+            self.numQualified = 0
+            self.numTransfers = 0
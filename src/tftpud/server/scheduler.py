@@ -0,0 +1,208 @@
+'''
+A transfer scheduler for the TFTP server.
+
+Transfers are classified into priority classes (by file name pattern or by
+client subnet). A limited number of transfers may be sending at any one time;
+the remainder wait in a queue per class. Queued transfers from the most urgent
+class are admitted first, and transfers in the same class take it in turns:
+once a transfer has sent a quantum of blocks it yields its slot to the next
+waiting transfer of the same (or a more urgent) class.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import fnmatch
+import collections
+import time
+
+from subnets import parseSubnet, addressToInt
+
+# The priority used for transfers that do not match any configured class.
+# Lower numbers are more urgent.
+DEFAULT_PRIORITY = 100
+
+class PriorityClass:
+    '''A class of transfers sharing a priority.
+    A transfer belongs to this class if its file name matches one of the
+    filePatterns (shell style, e.g. '*.cfg') or if the client address is in one
+    of the subnets (CIDR strings). A class with neither matches everything.
+    '''
+
+    def __init__(self, name, priority = DEFAULT_PRIORITY, filePatterns = None, subnets = None):
+        '''
+        name - a descriptive name, used for log output.
+        priority - lower numbers are scheduled first.
+        filePatterns - a list of shell style file name patterns.
+        subnets - a list of CIDR strings.
+        '''
+        self.name = name
+        self.priority = priority
+        self.filePatterns = list(filePatterns or [])
+        self.subnets = [parseSubnet(s) for s in (subnets or [])]
+
+    def matches(self, fileName, clientAddr):
+        if len(self.filePatterns) == 0 and len(self.subnets) == 0:
+            return True
+
+        for pattern in self.filePatterns:
+            if fnmatch.fnmatch(fileName, pattern):
+                return True
+
+        if len(self.subnets) > 0 and clientAddr is not None:
+            try:
+                family, value, bits = addressToInt(clientAddr[0])
+            except:
+                # Not a numeric address (e.g. 'localhost'). Can't match a subnet.
+                return False
+            for subnetFamily, network, mask in self.subnets:
+                if family == subnetFamily and (value & mask) == network:
+                    return True
+        return False
+
+class TransferTicket:
+    '''The scheduler's record of a single registered transfer.'''
+
+    def __init__(self, priorityClass):
+        self.priorityClass = priorityClass
+        self.active = False # True while holding a sending slot
+        self.queued = False
+        self.sent = 0 # blocks sent during the current turn
+
+class TransferScheduler:
+    '''
+    Share the sending slots between the registered transfers.
+    Each transfer registers once, calls waitTurn() before sending each new
+    data block, and unregisters when it is complete.
+    '''
+
+    def __init__(self, classes = None, maxActive = 8, quantum = 32,
+                 defaultPriority = DEFAULT_PRIORITY):
+        '''
+        classes - a list of PriorityClass objects.
+        maxActive - the number of transfers permitted to send concurrently.
+        quantum - the number of blocks a transfer may send before yielding its
+                  slot to another waiting transfer.
+        defaultPriority - the priority of transfers that match no class.
+        '''
+        self.maxActive = max(1, maxActive)
+        self.quantum = max(1, quantum)
+        self.defaultClass = PriorityClass('default', defaultPriority)
+        self.classes = []
+        self.queues = {} # waiting tickets, keyed by class name
+        self.numActive = 0
+        self.cond = threading.Condition()
+        self.setClasses(classes or [])
+
+    def setClasses(self, classes):
+        '''Replace the priority classes. Tickets already issued keep their class.'''
+        with self.cond:
+            # A stable sort keeps the configured order for equal priorities.
+            self.classes = sorted(classes, key=lambda c: c.priority)
+            for cls in self.classes + [self.defaultClass]:
+                if not self.queues.has_key(cls.name):
+                    self.queues[cls.name] = collections.deque()
+            self.order = sorted(self.classes + [self.defaultClass],
+                                key=lambda c: c.priority)
+
+    def classify(self, fileName, clientAddr):
+        '''Return the PriorityClass for a transfer.'''
+        for cls in self.classes:
+            if cls.matches(fileName, clientAddr):
+                return cls
+        return self.defaultClass
+
+    def register(self, fileName, clientAddr):
+        '''Register a new transfer. Returns a ticket for use with waitTurn().'''
+        return TransferTicket(self.classify(fileName, clientAddr))
+
+    def unregister(self, ticket):
+        '''The transfer is complete (or aborted). Release its slot.'''
+        with self.cond:
+            if ticket.active:
+                ticket.active = False
+                self.numActive -= 1
+            if ticket.queued:
+                self.dequeue(ticket)
+            self.cond.notify_all()
+
+    def waitTurn(self, ticket, timeout = None):
+        '''
+        Block until the transfer may send its next block.
+        Returns True when the block may be sent, or False if the timeout
+        (seconds) expired first. The ticket keeps its place in the queue after
+        a timeout, so the caller can simply call again.
+        '''
+        with self.cond:
+            if ticket.active:
+                ticket.sent += 1
+                if ticket.sent <= self.quantum:
+                    return True
+
+                if self.hasWaiters(ticket.priorityClass.priority):
+                    # End of this turn. Go to the back of the queue.
+                    ticket.active = False
+                    self.numActive -= 1
+                    self.enqueue(ticket)
+                    self.cond.notify_all()
+                else:
+                    # Nobody else wants the slot. Start a new turn.
+                    ticket.sent = 1
+                    return True
+            elif not ticket.queued:
+                self.enqueue(ticket)
+
+            deadline = None
+            if timeout is not None:
+                deadline = time.time() + timeout
+
+            while not self.grant(ticket):
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self.cond.wait(remaining)
+
+            ticket.sent = 1
+            # Other slots may also be free for the next waiter.
+            self.cond.notify_all()
+            return True
+
+    def hasWaiters(self, priority):
+        '''Return True if a transfer at least as urgent as priority is queued.'''
+        for cls in self.order:
+            if cls.priority > priority:
+                break
+            if len(self.queues[cls.name]) > 0:
+                return True
+        return False
+
+    def grant(self, ticket):
+        '''Admit the ticket if a slot is free and it is next in line.'''
+        if self.numActive >= self.maxActive:
+            return False
+        for cls in self.order:
+            queue = self.queues[cls.name]
+            if len(queue) > 0:
+                if queue[0] is ticket:
+                    queue.popleft()
+                    ticket.queued = False
+                    ticket.active = True
+                    self.numActive += 1
+                    return True
+                return False
+        return False
+
+    def enqueue(self, ticket):
+        name = ticket.priorityClass.name
+        if ticket.priorityClass not in self.order:
+            # The class was removed by setClasses() after this ticket was issued.
+            self.queues.setdefault(name, collections.deque())
+            self.order.append(ticket.priorityClass)
+            self.order.sort(key=lambda c: c.priority)
+        self.queues[name].append(ticket)
+        ticket.queued = True
+
+    def dequeue(self, ticket):
+        self.queues[ticket.priorityClass.name].remove(ticket)
+        ticket.queued = False
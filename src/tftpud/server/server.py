@@ -7,11 +7,30 @@ All tftpud code licensed under the MIT License: http://mit-licence.org
 '''
 import threading
 import socket
+import select
 import random
+import time
+import Queue
 
 from .. import tftpmessages
+from .. import timerwheel
+from .. import tftpoperation
+from .. import eventlog
+from .. import pathmtu
 import readoperation
 import writeoperation
+import scheduler
+import workerpool
+import congestion
+import policy
+import proxycache
+import popularity
+import memorycache
+import netasciicache
+import metrics
+import profiling
+import sampler
+import trace
 
 class ServerConfig:
     '''Configuration data for the TFTP Server.
@@ -34,7 +53,129 @@ class ServerConfig:
         self.retries = retries #
         self.ephemeralPorts = ephemeralPortRange
         self.listeningPort = listeningPort
-        self.logger = None
+        self.logger = None # called with each log line (text)
+        # Called as eventHandler(timestamp, eventType, fields) for each log
+        # event, unformatted (see tftpud.eventlog).
+        self.eventHandler = None
+        self.eventLogCapacity = 4096 # events buffered per thread
+        
+        # Metrics are served over HTTP (Prometheus text format) at
+        # http://metricsAddress:metricsPort/metrics. None disables the endpoint.
+        self.metricsPort = None
+        self.metricsAddress = '127.0.0.1'
+        
+        # Per-phase timing of transfers (see the profiling module). The
+        # profileSlowest slowest transfers are kept for Server.profileReport(),
+        # and each profile is passed to the profileHooks (ProfileHook objects).
+        self.profileTransfers = False
+        self.profileSlowest = 20
+        self.profileHooks = []
+        
+        # Tail-latency sampling (see the sampler module): the packet timelines
+        # of transfers taking at least sampleMinDuration seconds, or resending
+        # at least sampleMinRetransmits packets, are kept for
+        # Server.slowTransferSamples(). At most sampleReservoirSize are kept,
+        # each of up to sampleMaxEvents events.
+        self.sampleSlowTransfers = False
+        self.sampleMinDuration = 5.0
+        self.sampleMinRetransmits = 10
+        self.sampleReservoirSize = 32
+        self.sampleMaxEvents = 10000
+        
+        # The datagrams of every transfer are recorded in this binary trace
+        # file (see the trace and replay modules). None disables tracing.
+        self.traceFile = None
+        
+        # Transfer scheduling. When maxActiveTransfers is zero every transfer
+        # sends as fast as it can. Otherwise at most maxActiveTransfers send
+        # at once, most urgent priorityClasses first, taking turns of
+        # schedulerQuantum blocks (see the scheduler module).
+        self.maxActiveTransfers = 0
+        self.priorityClasses = [] # scheduler.PriorityClass objects
+        self.schedulerQuantum = 32
+        
+        # Retransmission and idle timers are run from a shared timer wheel.
+        # When False, each operation uses its socket timeout instead.
+        self.useTimerWheel = True
+        self.idleTimeout = 60.0 # seconds without progress before a transfer is aborted
+        self.dupAckThreshold = 2 # duplicate ACKs that trigger a fast retransmit (0 = off)
+        
+        # blksize negotiation. Block sizes are limited to fit the MTU of the
+        # route to the client (looked up on Linux when mtu is None), and
+        # requests below minBlockSize (RFC 2348 minimum) are declined.
+        self.mtu = None
+        self.minBlockSize = pathmtu.MIN_BLKSIZE
+        
+        # Windowed reads (RFC 7440 windowsize option). maxWindowSize is the
+        # largest window offered; 1 disables the option. With congestionControl
+        # the window offered to a client is also limited by an AIMD congestion
+        # window kept for that client, starting at initialWindow blocks.
+        self.maxWindowSize = 64
+        self.congestionControl = True
+        self.initialWindow = 4
+        
+        # Transfers are run by a pool of pre-started worker threads. When all
+        # workers are busy, up to workerQueueDepth requests wait for a worker;
+        # beyond that requests are refused. Set workerThreads to zero to start
+        # a new thread for each transfer instead.
+        self.workerThreads = 64
+        self.workerQueueDepth = 256
+        
+        # Option negotiation rules: a list of policy.PolicyRule objects. The
+        # first rule matching a request sets the limits on its options (e.g.
+        # small blocks for fragile clients, large windows on a fast LAN).
+        # Windows beyond maxWindowSize also need congestionControl=False in
+        # the rule's profile.
+        self.negotiationRules = []
+        
+        # Proxy mode. With an upstream (host, port) set, read requests are
+        # served from a cache in cacheDir; files not in the cache are fetched
+        # from the upstream TFTP server while they are sent. The least
+        # recently used files are removed to keep the cache within
+        # cacheMaxBytes.
+        self.upstream = None
+        self.cacheDir = 'tftpcache'
+        self.cacheMaxBytes = 1024 * 1024 * 1024
+        self.upstreamBlockSize = 1468 # blksize requested from the upstream server
+        
+        # Warm start. The files served are counted in the popularityManifest
+        # file (None to disable). At startup the warmupFiles most popular
+        # files, up to warmupMaxBytes in total, are loaded into memory: before
+        # the listener is opened, or with warmupInBackground while requests
+        # are already being served (see Server.ready).
+        self.popularityManifest = None
+        self.warmupFiles = 32
+        self.warmupMaxBytes = 256 * 1024 * 1024
+        self.warmupInBackground = False
+        self.manifestSaveInterval = 300.0 # seconds
+        
+        # Byte ranges. With allowRange, a read request may ask for part of a
+        # file with the range option ('first-last', in bytes, inclusive; the
+        # last may be left out). The range is sent as if it were the whole
+        # file. tftpud clients use this to read a large file in several
+        # concurrent stripes. Not supported in proxy mode, or in netascii mode.
+        self.allowRange = False
+        
+        # Netascii mode. Files are converted (LF to CR LF) as they are sent,
+        # and written files are converted back as they arrive. The converted
+        # contents of files read more than once are kept in memory, up to
+        # netasciiCacheBytes in total (0 to disable) and netasciiMaxFileBytes
+        # per file; the converted size of any file read before is known, for
+        # an exact tsize.
+        self.netasciiCacheBytes = 16 * 1024 * 1024
+        self.netasciiMaxFileBytes = 1024 * 1024
+    
+# The event posted to the server thread by reloadConfig
+EVENT_RELOAD = 'reload'
+
+class ConfigReload:
+    '''A new configuration for the server thread to apply (see
+    Server.reloadConfig).'''
+    
+    def __init__(self, config):
+        self.config = config
+        self.done = threading.Event()
+        self.error = None
     
 class Server(object):
     '''
@@ -50,11 +191,83 @@ class Server(object):
         self.config = config
         
         self.stopThread = False
+        self.drainDeadline = 0 # when transfers still running at shutdown are aborted
         self.ipVer = 4
         
         # A dict of TFTP operations ongoing. Keyed by port number.
         self.ongoingOperations = {}
         
+        self.scheduler = None
+        if config.maxActiveTransfers > 0:
+            self.scheduler = scheduler.TransferScheduler(config.priorityClasses,
+                                                         config.maxActiveTransfers,
+                                                         config.schedulerQuantum)
+        
+        self.congestion = None
+        if config.congestionControl:
+            self.congestion = congestion.CongestionControl(config.initialWindow,
+                                                           config.maxWindowSize)
+            
+        self.timerWheel = None
+        if config.useTimerWheel:
+            self.timerWheel = timerwheel.TimerWheel()
+            
+        # The negotiation rules, compiled for fast lookup.
+        self.policy = policy.NegotiationPolicy(config.negotiationRules)
+        
+        self.cache = None
+        if config.upstream is not None:
+            self.cache = proxycache.ProxyCache(config.upstream, config.cacheDir,
+                                               config.cacheMaxBytes,
+                                               config.upstreamBlockSize,
+                                               config.timeout, config.retries)
+            
+        self.popularity = None
+        self.memoryCache = None
+        if config.popularityManifest is not None:
+            self.popularity = popularity.PopularityManifest(config.popularityManifest)
+            self.popularity.load()
+            self.memoryCache = memorycache.MemoryFileCache(config.warmupMaxBytes)
+        self.nextManifestSave = 0
+        
+        self.netasciiCache = netasciicache.NetasciiCache(config.netasciiCacheBytes,
+                                                         config.netasciiMaxFileBytes)
+        
+        # Set once the warm-up (if any) is complete.
+        self.ready = threading.Event()
+            
+        self.pool = None
+        if config.workerThreads > 0:
+            self.pool = workerpool.WorkerPool(config.workerThreads,
+                                              config.workerQueueDepth)
+            
+        # Events (completion) posted by the operations. Posting an event also
+        # wakes the server thread via the wakeup socket.
+        self.events = Queue.Queue()
+        self.wakeupSocket = None
+        self.wakeupPending = False
+        self.wakeupMutex = threading.Lock()
+        
+        self.metrics = metrics.ServerMetrics()
+        self.metricsEndpoint = None
+        self.clock = time.time # used by the operations for timings and deadlines
+        
+        self.profiler = None
+        if config.profileTransfers:
+            self.profiler = profiling.TransferProfiler(config.profileSlowest,
+                                                       config.profileHooks)
+        self.sampler = None
+        if config.sampleSlowTransfers:
+            self.sampler = sampler.TailSampler(config.sampleMinDuration,
+                                               config.sampleMinRetransmits,
+                                               config.sampleReservoirSize,
+                                               config.sampleMaxEvents)
+        
+        self.trace = None
+        
+        # The log events of the operations, read by the server thread.
+        self.eventLog = eventlog.EventLog(config.eventLogCapacity, self.wakeup)
+        
         self.serverThread = threading.Thread(target=self.runServer)
         
         if runNow:
@@ -64,24 +277,150 @@ class Server(object):
     def startServer(self):
         '''Start the server'''
         
+        if self.popularity is not None and not self.config.warmupInBackground:
+            self.warmUp()
+            
         # Create the socket objects. If there is problem here it will throw
         # an exception in the calling thread rather than inside the server
-        # thread.
-        family= socket.AF_INET
-        if self.config.hostIpAddress.find(':') >= 0:
-            family = socket.AF_INET6
-            self.ipVer = 6
+        # thread, once whatever was started has been stopped again.
+        try:
+            self.listenerSocket, self.ipVer = self.openListener(self.config)
             
-        self.listenerSocket = socket.socket(family, socket.SOCK_DGRAM)
-        self.listenerSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.listenerSocket.bind((self.config.hostIpAddress, self.config.listeningPort))
-        
-        self.listenerSocket.settimeout(2) # 2 second timeout
+            # A loopback socket used to wake the server thread from select()
+            self.wakeupSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.wakeupSocket.bind(('127.0.0.1', 0))
+            self.wakeupSocket.setblocking(0)
+            
+            if self.timerWheel is not None:
+                self.timerWheel.start()
+            if self.pool is not None:
+                self.pool.start()
+            if self.config.traceFile is not None:
+                self.trace = trace.TraceWriter(self.config.traceFile)
+            if self.config.metricsPort is not None:
+                self.metricsEndpoint = metrics.MetricsEndpoint(self.metrics,
+                                                               self.config.metricsAddress,
+                                                               self.config.metricsPort)
+                self.metricsEndpoint.start()
+        except:
+            self.releaseResources()
+            raise
         
         # Now start the thread
         self.serverThread = threading.Thread(target=self.runServer)
         self.serverThread.start()
         
+        if self.popularity is None:
+            self.ready.set()
+        elif self.config.warmupInBackground:
+            warmer = threading.Thread(target=self.warmUp, name='tftpud-warmup')
+            warmer.daemon = True
+            warmer.start()
+            
+    def openListener(self, config):
+        '''Return a listener socket bound to the configured address and port,
+        and the IP version.'''
+        family = socket.AF_INET
+        ipVer = 4
+        if config.hostIpAddress.find(':') >= 0:
+            family = socket.AF_INET6
+            ipVer = 6
+            
+        listener = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((config.hostIpAddress, config.listeningPort))
+        except:
+            listener.close()
+            raise
+        
+        listener.settimeout(2) # 2 second timeout
+        return listener, ipVer
+            
+    def reloadConfig(self, config):
+        '''
+        Use a new ServerConfig for the requests that arrive from now on
+        (timeouts, port ranges, logger, negotiation rules and so on). Transfers
+        in progress carry on with the settings they started with. The listener
+        is only rebound if the address or port has changed.
+        The components created at startup from the configuration (the worker
+        pool, scheduler, caches, proxy, warm start, metrics endpoint, trace,
+        profiler and sampler) are kept: changes to their settings need a
+        restart.
+        May be called from any thread; returns once the server is using the
+        new configuration. If the new listener can't be opened the error is
+        raised and the old configuration is kept.
+        '''
+        reload = ConfigReload(config)
+        if not self.serverThread.is_alive() or threading.current_thread() is self.serverThread:
+            self.applyConfig(reload)
+        else:
+            # Applied by the server thread, between requests.
+            self.postEvent(None, EVENT_RELOAD, reload)
+            while not reload.done.wait(0.1):
+                if not self.serverThread.is_alive():
+                    # Stopped before the event was handled
+                    self.applyConfig(reload)
+                    break
+        if reload.error is not None:
+            raise reload.error
+            
+    def applyConfig(self, reload):
+        '''Switch to the configuration of a ConfigReload.'''
+        if reload.done.is_set():
+            return
+        config = reload.config
+        try:
+            # Compiled first: bad rules leave the old configuration in use.
+            negotiationPolicy = policy.NegotiationPolicy(config.negotiationRules)
+            
+            old = self.config
+            if (self.listenerSocket is not None and
+                (config.hostIpAddress, config.listeningPort) !=
+                (old.hostIpAddress, old.listeningPort)):
+                listener, ipVer = self.openListener(config)
+                self.listenerSocket.close()
+                self.listenerSocket, self.ipVer = listener, ipVer
+            
+            self.policy = negotiationPolicy
+            self.config = config
+            self.eventLog.log(eventlog.CONFIG_RELOADED, config.hostIpAddress,
+                              config.listeningPort)
+        except Exception, e:
+            reload.error = e
+        reload.done.set()
+            
+    def warmUp(self):
+        '''Load the most popular files in the manifest into memory.'''
+        try:
+            started = time.time()
+            for fileName, record in self.popularity.topFiles(self.config.warmupFiles):
+                self.memoryCache.load(fileName)
+            self.eventLog.log(eventlog.WARMUP_COMPLETE, len(self.memoryCache),
+                              self.memoryCache.totalBytes, time.time() - started)
+        finally:
+            self.ready.set()
+            
+    def profileReport(self, n = None):
+        '''Return the phase timings of the n slowest transfers (as text), or
+        None if profiling is disabled.'''
+        if self.profiler is None:
+            return None
+        return self.profiler.report(n)
+            
+    def slowTransferSamples(self):
+        '''Return the sampled timelines (sampler.TransferTimeline objects) of
+        slow transfers, slowest first. Empty if sampling is disabled.'''
+        if self.sampler is None:
+            return []
+        return self.sampler.samples()
+            
+    def saveManifest(self):
+        try:
+            self.popularity.save()
+        except (IOError, OSError), e:
+            self.eventLog.log(eventlog.MESSAGE, 'Failed to save popularity manifest: ' + str(e))
+        
     def join(self):
         while self.serverThread and self.serverThread.is_alive():
             self.serverThread.join(2) #  2 second timeout to allow signals
@@ -89,65 +428,187 @@ class Server(object):
     def runServer(self):
         '''Run the server object, listening for TFTP server requests.'''
         
+        self.processEvents()
         while not self.stopThread:
-            try:
-                data, dataSrc = self.listenerSocket.recvfrom(256)
-                self.processListenerData(data, dataSrc)
-            except socket.timeout:
-                # This timeout is expected. Continue around the loop.
-                pass
-            
-            # Do some tidying up
-            garbage = []
-            for portIndex, operation in self.ongoingOperations.items():
-                # process the log messages from this operation
-                if self.config.logger:
-                    operation.processLogMessages(self.config.logger)
+            # Wait for a request, or for an event from an operation (which
+            # includes a stop request), or until the next scheduled task.
+            readable = select.select([self.listenerSocket, self.wakeupSocket], [], [],
+                                     self.selectTimeout())[0]
+            
+            if self.listenerSocket in readable:
+                try:
+                    data, dataSrc = self.listenerSocket.recvfrom(256)
+                    self.processListenerData(data, dataSrc)
+                except socket.timeout:
+                    pass
+                
+            if self.wakeupSocket in readable:
+                self.clearWakeup()
                 
-                if not operation.is_alive():
-                    garbage.append(portIndex)   
-                    
-            for completeIndex in garbage:
-                self.ongoingOperations.pop(completeIndex)
+            self.processEvents()
             
-        # Signal any ongoing operations to stop (abort).
-        for operation in self.ongoingOperations.itervalues():
-            operation.abort(True)
+            if self.popularity is not None and time.time() >= self.nextManifestSave:
+                if self.nextManifestSave > 0:
+                    self.saveManifest()
+                self.nextManifestSave = time.time() + self.config.manifestSaveInterval
             
-        # Close the listener socket.
+        # Stop accepting requests. The port is free for another server
+        # straight away.
         self.listenerSocket.close()
         self.listenerSocket = None
+        
+        self.drainTransfers()
+        self.abortTransfers()
+        if self.popularity is not None:
+            self.saveManifest()
+        self.releaseResources()
+        
+    def releaseResources(self):
+        '''Stop the threads, and close the sockets and files, started by
+        startServer (those that were).'''
+        if self.pool is not None:
+            self.pool.stop()
+        if self.timerWheel is not None:
+            self.timerWheel.stop()
+        if self.metricsEndpoint is not None:
+            self.metricsEndpoint.stop()
+            self.metricsEndpoint = None
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+        if self.listenerSocket is not None:
+            self.listenerSocket.close()
+            self.listenerSocket = None
+        if self.wakeupSocket is not None:
+            self.wakeupSocket.close()
+            self.wakeupSocket = None
+        
+    def selectTimeout(self):
+        '''Return the seconds until the next scheduled task of the server
+        thread (saving the popularity manifest), or None if there is none.'''
+        if self.popularity is None:
+            return None
+        return max(0, self.nextManifestSave - time.time())
+        
+    def drainTransfers(self):
+        '''Wait for the transfers in progress to finish, until the
+        drainDeadline.'''
+        while len(self.ongoingOperations) > 0:
+            remaining = self.drainDeadline - time.time()
+            if remaining <= 0:
+                break
+            if self.wakeupSocket in select.select([self.wakeupSocket], [], [], remaining)[0]:
+                self.clearWakeup()
+            self.processEvents()
+            
+    def abortTransfers(self):
+        '''Abort the transfers in progress, all at once, and wait for them.'''
+        operations = self.ongoingOperations.values()
+        for operation in operations:
+            operation.abort(False)
+        for operation in operations:
+            operation.join()
+        self.eventLog.log(eventlog.SHUTDOWN, len(operations))
+        self.processEvents()
+        
+    def postEvent(self, operation, eventType, data):
+        '''Called by the operations (in their own threads) to pass an event to
+        the server thread.'''
+        self.events.put((operation, eventType, data))
+        self.wakeup()
+        
+    def wakeup(self):
+        '''Wake the server thread (from any thread).'''
+        with self.wakeupMutex:
+            if self.wakeupPending or self.wakeupSocket is None:
+                return
+            self.wakeupPending = True
+        try:
+            self.wakeupSocket.sendto('!', self.wakeupSocket.getsockname())
+        except:
+            pass
+        
+    def clearWakeup(self):
+        # Empty the socket before clearing the flag: a wakeup in between
+        # would otherwise be lost, its datagram read here while the flag
+        # stops any further ones being sent.
+        try:
+            while True:
+                self.wakeupSocket.recvfrom(16)
+        except socket.error:
+            pass
+        with self.wakeupMutex:
+            self.wakeupPending = False
+            
+    def processEvents(self):
+        '''Handle the events posted by the operations. Completed operations
+        are removed, releasing their ports.'''
+        self.eventLog.drain(self.handleLogEvent)
+        while True:
+            try:
+                operation, eventType, data = self.events.get_nowait()
+            except Queue.Empty:
+                break
+            
+            if eventType == EVENT_RELOAD:
+                self.applyConfig(data)
+            elif eventType == tftpoperation.EVENT_COMPLETE:
+                if self.ongoingOperations.get(operation.port) is operation:
+                    self.ongoingOperations.pop(operation.port)
+                operation.s.close()
+                self.metrics.activeTransfers.dec()
+    
+    def handleLogEvent(self, timestamp, eventType, fields):
+        if self.config.eventHandler:
+            self.config.eventHandler(timestamp, eventType, fields)
+        if self.config.logger:
+            self.config.logger(eventlog.formatEvent(timestamp, eventType, fields))
     
     def processListenerData(self, data, fromAddr):
         pkt = tftpmessages.create_tftp_packet_from_data(data)
         if not pkt is None:
             if pkt.opcode in (tftpmessages.OPCODE_RRQ, tftpmessages.OPCODE_WRQ):
-                
-                s = None
-                if self.ipVer == 4:
-                    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                if pkt.opcode == tftpmessages.OPCODE_RRQ:
+                    self.metrics.requests.inc(label='rrq')
                 else:
-                    s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+                    self.metrics.requests.inc(label='wrq')
                 
-                s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self.pool is not None and self.pool.isFull():
+                    # Every worker is busy and the queue is full. Refuse the
+                    # request; the client may try again later.
+                    errPkt = tftpmessages.Error()
+                    errPkt.errorCode = tftpmessages.ERR_NOT_DEFINED
+                    errPkt.errorMsg = 'Server busy'
+                    self.listenerSocket.sendto(errPkt.pack(), fromAddr)
+                    self.metrics.refused.inc()
+                    return
                 
-                ephemeralPort = self.allocateEphemeralPort(s)
+                s, ephemeralPort = self.createTransferSocket()
+                if self.trace is not None:
+                    transferId = self.trace.newTransfer(fromAddr, data)
+                    s = trace.TracingSocket(s, self.trace, transferId, fromAddr)
                 
                 # Create the read operation.
                 if not self.ongoingOperations.has_key(ephemeralPort):
                     # Create the appropriate type of read/write operation.
+                    operation = None
                     if pkt.opcode == tftpmessages.OPCODE_RRQ:
-                        self.ongoingOperations[ephemeralPort] = \
-                        readoperation.ReadOperation(s, 
-                                                    fromAddr, pkt,
-                                                    self.config.timeout,
-                                                    self.config.retries)
+                        operation = readoperation.ReadOperation(s, 
+                                                                fromAddr, pkt,
+                                                                self.config.timeout,
+                                                                self.config.retries,
+                                                                self)
                     elif pkt.opcode == tftpmessages.OPCODE_WRQ:
-                        self.ongoingOperations[ephemeralPort] = \
-                        writeoperation.WriteOperation(s,
-                                                      fromAddr, pkt,
-                                                      self.config.timeout,
-                                                      self.config.retries)
+                        operation = writeoperation.WriteOperation(s,
+                                                                  fromAddr, pkt,
+                                                                  self.config.timeout,
+                                                                  self.config.retries,
+                                                                  self)
+                    # The completion event is handled by this thread, so it
+                    # can't be processed before the operation is recorded.
+                    operation.port = ephemeralPort
+                    self.ongoingOperations[ephemeralPort] = operation
+                    self.metrics.activeTransfers.inc()
                 else:
                     # This shouldn't happen as the allocateEphemeralPorts
                     # checks this.
@@ -156,9 +617,27 @@ class Server(object):
                     errPkt.errorMsg = 'Unknown error: TID conflict'
                     self.listenerSocket.sendto(errPkt.pack(), fromAddr)
     
-    def stopServer(self, blocking = True):
-        '''Stop the server thread.'''
+    def createTransferSocket(self):
+        '''Return a socket bound to a free ephemeral port, and the port.'''
+        s = None
+        if self.ipVer == 4:
+            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        else:
+            s = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+        
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        
+        return s, self.allocateEphemeralPort(s)
+        
+    def stopServer(self, blocking = True, drainTimeout = 0):
+        '''
+        Stop the server thread. No more requests are accepted. The transfers
+        in progress are given up to drainTimeout seconds to finish; any still
+        running then are aborted.
+        '''
+        self.drainDeadline = time.time() + drainTimeout
         self.stopThread = True
+        self.wakeup()
         if blocking:
             self.serverThread.join()
     
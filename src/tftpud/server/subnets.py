@@ -0,0 +1,72 @@
+'''
+Client address matching by subnet (CIDR).
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import socket
+import binascii
+
+def parseSubnet(subnet):
+    '''Parse a CIDR string such as '10.1.0.0/16' or 'fd00::/8' into a tuple of
+    (address family, network, mask). A plain address is treated as a host route.'''
+    family, network, mask, prefixLen = parseSubnetPrefix(subnet)
+    return (family, network, mask)
+
+def parseSubnetPrefix(subnet):
+    '''As parseSubnet, with the prefix length appended to the tuple.'''
+    if subnet.find('/') >= 0:
+        addr, prefixLen = subnet.split('/', 1)
+        prefixLen = int(prefixLen)
+    else:
+        addr, prefixLen = subnet, None
+
+    family, value, bits = addressToInt(addr)
+    if prefixLen is None:
+        prefixLen = bits
+    if prefixLen < 0 or prefixLen > bits:
+        raise Exception('Invalid subnet prefix length: ' + subnet)
+
+    mask = ((1 << prefixLen) - 1) << (bits - prefixLen)
+    return (family, value & mask, mask, prefixLen)
+
+def addressToInt(addr):
+    '''Convert an IPv4 or IPv6 address string into (family, integer value, bits).'''
+    if addr.find(':') >= 0:
+        packed = socket.inet_pton(socket.AF_INET6, addr)
+        return (socket.AF_INET6, int(binascii.hexlify(packed), 16), 128)
+    else:
+        packed = socket.inet_aton(addr)
+        return (socket.AF_INET, int(binascii.hexlify(packed), 16), 32)
+
+class SubnetTable:
+    '''
+    A lookup table from subnets to values. lookup() returns the values of
+    every subnet containing an address, using one hash lookup per distinct
+    prefix length in the table.
+    '''
+
+    def __init__(self):
+        # {family: {prefixLen: (mask, {network: [values]})}}
+        self.tables = {}
+
+    def add(self, subnet, value):
+        family, network, mask, prefixLen = parseSubnetPrefix(subnet)
+        byPrefix = self.tables.setdefault(family, {})
+        if not byPrefix.has_key(prefixLen):
+            byPrefix[prefixLen] = (mask, {})
+        byPrefix[prefixLen][1].setdefault(network, []).append(value)
+
+    def lookup(self, addr):
+        '''Return a list of the values of all subnets containing addr (an
+        address string). Non-numeric addresses match nothing.'''
+        try:
+            family, value, bits = addressToInt(addr)
+        except:
+            return []
+
+        found = []
+        for mask, networks in self.tables.get(family, {}).itervalues():
+            values = networks.get(value & mask)
+            if values is not None:
+                found.extend(values)
+        return found
@@ -0,0 +1,151 @@
+'''
+Packet traces: a compact binary record of the datagrams of each transfer,
+for replaying real traffic against a server (see the replay module).
+
+A trace file starts with an 8 byte magic string and the wall clock time the
+trace started (a big-endian double). Then come the records, each a 15 byte
+header (record type, transfer ID, microseconds since the trace started, and
+payload length) followed by the payload:
+ - TRANSFER: a new transfer; the payload is the client address, "host port".
+ - INBOUND: a datagram received from the client (starting with the request).
+ - OUTBOUND: a datagram sent to the client.
+ - END: the transfer has finished; no payload.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import struct
+import threading
+import time
+
+from .. import clock
+
+MAGIC = 'TFTPTRC1'
+HEADER = struct.Struct('>8sd')
+RECORD = struct.Struct('>BIQH')
+
+# Record types
+TRANSFER = 0
+INBOUND = 1
+OUTBOUND = 2
+END = 3
+
+class TraceWriter:
+    '''Writes the records of many transfers (from any thread) to a file.'''
+
+    def __init__(self, path):
+        self.f = open(path, 'wb')
+        self.started = clock.monotonic()
+        self.f.write(HEADER.pack(MAGIC, time.time()))
+        self.nextTransferId = 1
+        self.mutex = threading.Lock()
+
+    def write(self, recordType, transferId, payload = ''):
+        micros = int((clock.monotonic() - self.started) * 1000000)
+        with self.mutex:
+            if self.f is not None:
+                self.f.write(RECORD.pack(recordType, transferId, micros, len(payload)))
+                self.f.write(payload)
+
+    def newTransfer(self, clientAddr, request):
+        '''Record a new transfer and its request datagram. Returns the
+        transfer ID.'''
+        with self.mutex:
+            transferId = self.nextTransferId
+            self.nextTransferId += 1
+        self.write(TRANSFER, transferId, '%s %d' % (clientAddr[0], clientAddr[1]))
+        self.write(INBOUND, transferId, request)
+        return transferId
+
+    def flush(self):
+        with self.mutex:
+            if self.f is not None:
+                self.f.flush()
+
+    def close(self):
+        with self.mutex:
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+
+class TracingSocket:
+    '''
+    Wraps the socket of an operation, recording the datagrams exchanged with
+    the client. Datagrams to or from other addresses (wakeups, packets from
+    the wrong TID) are not recorded.
+    '''
+
+    def __init__(self, sock, trace, transferId, clientAddr):
+        self.sock = sock
+        self.trace = trace
+        self.transferId = transferId
+        self.clientAddr = clientAddr
+
+    def sendto(self, data, address):
+        result = self.sock.sendto(data, address)
+        if address == self.clientAddr:
+            self.trace.write(OUTBOUND, self.transferId, data)
+        return result
+
+    def recvfrom(self, length):
+        data, fromAddr = self.sock.recvfrom(length)
+        if fromAddr == self.clientAddr and len(data) > 0:
+            self.trace.write(INBOUND, self.transferId, data)
+        return data, fromAddr
+
+    def close(self):
+        self.sock.close()
+        self.trace.write(END, self.transferId)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+class TracedTransfer:
+    '''A transfer read from a trace file.'''
+
+    def __init__(self, transferId, clientAddr, started):
+        self.transferId = transferId
+        self.clientAddr = clientAddr
+        self.started = started # seconds since the trace started
+        self.datagrams = [] # (seconds since the trace started, INBOUND or OUTBOUND, data)
+        self.ended = None
+
+    def request(self):
+        for offset, direction, data in self.datagrams:
+            if direction == INBOUND:
+                return data
+        return None
+
+def readTrace(path):
+    '''Read a trace file. Returns (wall clock start time, [TracedTransfer])
+    with the transfers in the order they started. A truncated final record
+    (e.g. from a server that was killed) is ignored.'''
+    transfers = {}
+    order = []
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise Exception('Not a trace file: ' + path)
+        magic, wallStart = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise Exception('Not a trace file: ' + path)
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                break
+            recordType, transferId, micros, length = RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                break
+            offset = micros / 1000000.0
+            if recordType == TRANSFER:
+                host, port = payload.rsplit(' ', 1)
+                transfer = TracedTransfer(transferId, (host, int(port)), offset)
+                transfers[transferId] = transfer
+                order.append(transfer)
+            elif transferId in transfers:
+                transfer = transfers[transferId]
+                if recordType == END:
+                    transfer.ended = offset
+                else:
+                    transfer.datagrams.append((offset, recordType, payload))
+    return wallStart, order
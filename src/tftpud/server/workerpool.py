@@ -0,0 +1,53 @@
+'''
+A pool of pre-started worker threads that run TFTP operations.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import Queue
+
+class WorkerPool:
+    '''
+    A fixed number of worker threads taking operations from a bounded queue.
+    Each worker calls operation.run() and then takes the next operation.
+    '''
+
+    def __init__(self, numWorkers, maxQueued):
+        '''
+        numWorkers - the number of worker threads (the maximum number of
+                     operations running at once).
+        maxQueued - the number of operations that may wait for a worker.
+        '''
+        self.numWorkers = numWorkers
+        self.queue = Queue.Queue(maxQueued)
+        self.workers = []
+
+    def start(self):
+        '''Start (pre-warm) the worker threads.'''
+        for i in range(0, self.numWorkers):
+            worker = threading.Thread(target=self.workerLoop, name='tftpud-worker-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        '''Stop the workers once the queued operations have been run.'''
+        for worker in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def isFull(self):
+        return self.queue.full()
+
+    def submit(self, operation):
+        '''Queue an operation to be run. Raises Queue.Full if the queue is full.'''
+        self.queue.put_nowait(operation)
+
+    def workerLoop(self):
+        while True:
+            operation = self.queue.get()
+            if operation is None:
+                break
+            operation.run()
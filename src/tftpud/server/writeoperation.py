@@ -9,27 +9,34 @@ import os
 import socket
 from .. import tftpoperation
 from .. import tftpmessages
+from .. import eventlog
+from .. import netascii
+import profiling
+import sampler
 
 class WriteOperation(tftpoperation.TftpOperation):
     '''
     A TFTP Write operation to process a WRQ
     '''
 
-    def __init__(self, sock, clientAddr, pkt, timeout=3.0, retries=3):
+    def __init__(self, sock, clientAddr, pkt, timeout=3.0, retries=3, server=None):
         '''
         Constructor
+        server - the Server object that owns this operation (optional).
         '''
         tftpoperation.TftpOperation.__init__(self)
+        self.server = server
+        if server is not None:
+            self.useServer(server)
         self.s = sock
         self.clientAddr = clientAddr
         self.fileName = pkt.fileName
         self.mode = pkt.mode
         self.blockSize = 512 # default, can be overridden by WRQ extension
-        self.retries = 3
-        self.abortRequested = False
+        self.retries = retries
         self.blocksToCache = 100
         # Set the socket timeout to match the given param
-        self.s.settimeout(timeout)
+        self.setTimeout(timeout)
         
         self.blocks = []
         self.blockNum = 0
@@ -37,6 +44,11 @@ class WriteOperation(tftpoperation.TftpOperation):
         # The file handle to be written
         self.f = None
         
+        # In netascii mode the blocks are converted as they are written.
+        self.decoder = None
+        if self.mode.lower() == 'netascii':
+            self.decoder = netascii.Decoder()
+        
         self.writeOptions = pkt.options
             
         self.start()
@@ -47,6 +59,7 @@ class WriteOperation(tftpoperation.TftpOperation):
             
     def abort(self, block=True):
         self.abortRequested = True
+        self.wakeup()
         if block:
             self.join()
         
@@ -54,19 +67,28 @@ class WriteOperation(tftpoperation.TftpOperation):
         '''The thread function for the WRQ operation.
         Send back an ACK packet, then wait for the data packets to arrive.
         '''
-        self.addLogMsg('WRQ: ' + str(self.clientAddr) + ', ' + self.fileName + ' , options : ' + str(self.writeOptions))
+        self.logEvent(eventlog.WRQ, self.clientAddr, self.fileName, self.writeOptions)
+        self.beginTransfer('WRQ')
+        profile = self.profile
         
         try:
-            if self.mode.lower() != 'octet':
-                self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, 'Only octet mode supported')
-                raise Exception('Only octet mode supported')
+            if self.mode.lower() not in ('octet', 'netascii'):
+                self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, 'Only octet and netascii modes supported')
+                raise Exception('Only octet and netascii modes supported')
             
+            if profile is not None:
+                started = profile.begin()
             if not self.openFileForWriting():
                 raise Exception('Invalid file name')
             
             # Handle the options given in the request.
             # This processing returns either and OACK or ACK packet to the client.
+            if profile is not None:
+                profile.end(profiling.STAT, started)
+                started = profile.begin()
             self.processOptions()
+            if profile is not None:
+                profile.end(profiling.NEGOTIATE, started)
             
             self.processDataPackets()
             
@@ -74,7 +96,7 @@ class WriteOperation(tftpoperation.TftpOperation):
             self.f.close()
             self.f = None
         except Exception, e:
-            self.addLogMsg(str(e))            
+            self.logEvent(eventlog.MESSAGE, e)
         
     def openFileForWriting(self):
         '''Check that the file name is ok for writing.'''
@@ -98,21 +120,26 @@ class WriteOperation(tftpoperation.TftpOperation):
     
     def processOptions(self):
         if len(self.writeOptions) > 0:
+            self.applyPolicy(self.fileName, self.writeOptions)
             oack = tftpmessages.OptionAcknowledgement()
             try:
                 for name, val in self.writeOptions.items():
                     lowerCaseName = name.lower()
                     if lowerCaseName == 'blksize': # RFC 2348
-                        self.blockSize = int(val)
-                        oack.options[name] = val
+                        # Echo the accepted (possibly reduced) size in the OACK
+                        accepted = self.negotiateBlockSize(int(val))
+                        if accepted is not None:
+                            self.blockSize = accepted
+                            oack.options[name] = str(accepted)
                     elif lowerCaseName == 'timeout': # RFC 2349
                         secs = int(val)
-                        if secs >= 1 and secs <= 255:
-                            self.s.settimeout(int(val))
+                        if secs >= self.minTimeout and secs <= self.maxTimeout:
+                            self.setTimeout(secs)
                             oack.options[name] = val
                     elif lowerCaseName == 'tsize': # RFC 2349
                         # Accept whatever size as long as it translates to an integer
-                        oack.options[name] = str( int(val) )
+                        if self.allowTsize:
+                            oack.options[name] = str( int(val) )
             except:
                 # Send an error packet, then bail out of the operation thread
                 # via an exception
@@ -124,7 +151,8 @@ class WriteOperation(tftpoperation.TftpOperation):
                 # Send either the OACK, or the plain ACK back to the client
                 if len(oack.options) > 0:
                     # We have accepted at least one option. Send back the oack.
-                    self.s.sendto( oack.pack(), self.clientAddr )
+                    # It is retransmitted until the first data packet arrives.
+                    self.sendReliably( oack.pack() )
                 else:
                     # No options accepted. Send the plain ACK packet to accept the
                     # request without options
@@ -138,38 +166,76 @@ class WriteOperation(tftpoperation.TftpOperation):
         errPkt.errorCode = errCode
         errPkt.errorMsg = errMsg
         self.s.sendto(errPkt.pack(), self.clientAddr)
+        if self.metrics is not None:
+            self.metrics.errors.inc(label=errCode)
+        if self.timeline is not None:
+            self.timeline.record(sampler.ERROR, errCode)
         
-    def sendAckPkt(self, blockNum):
+    def sendAckPkt(self, blockNum, final = False):
+        '''Send an ACK. Unless this is the final ACK of the transfer it is
+        retransmitted until the next data packet arrives.'''
         ackPkt = tftpmessages.Acknowledgement()
         ackPkt.blockNum = blockNum
-        self.s.sendto(ackPkt.pack(), self.clientAddr)
+        if final:
+            if self.timeline is not None:
+                self.timeline.recordSend(ackPkt.pack())
+            self.s.sendto(ackPkt.pack(), self.clientAddr)
+        else:
+            self.sendReliably(ackPkt.pack())
+            
+    def onRetransmit(self):
+        '''A timeout: the last ACK (or OACK) has been resent.'''
+        if self.metrics is not None:
+            self.metrics.retransmits.inc()
             
     def processDataPackets(self):
         # Wait for the next data block
         fail = False
         complete = False
         numBlocks = 0
+        profile = self.profile
         while not fail and not complete:
+            if profile is not None:
+                started = profile.begin()
             dataPkt = self.waitForData()
+            if profile is not None:
+                profile.end(profiling.WAIT_DATA, started)
             if dataPkt is not None:
                 # Check that this is the next sequential block number
                 blockNum = dataPkt.blockNum
                 if ( blockNum == (self.blockNum + 1) or
                      (self.blockNum == 0xffff and blockNum in (0, 1)) ):
+                    self.responseReceived()
                     self.blockNum = dataPkt.blockNum
                     self.blocks.append(dataPkt.dataBlock)
-                    self.sendAckPkt(self.blockNum)
                     numBlocks += 1
+                    if self.metrics is not None:
+                        self.metrics.blocksReceived.inc()
+                        self.metrics.bytesReceived.inc(len(dataPkt.dataBlock))
                     
                     if len(dataPkt.dataBlock) < self.blockSize:
                         complete = True
+                    
+                    # Pace the client by waiting for this transfer's turn
+                    # before acknowledging (if scheduled).
+                    self.waitForTurn(self.fileName, self.clientAddr)
+                    self.sendAckPkt(self.blockNum, complete)
                         
                     # Write the blocks to the file
                     if complete or len(self.blocks) > self.blocksToCache:
-                        self.f.writelines(self.blocks)
-                        self.blocks = []
+                        if profile is not None:
+                            started = profile.begin()
+                        self.writeBlocks(complete)
+                        if profile is not None:
+                            profile.end(profiling.WRITE, started)
+                elif numBlocks > 0 and blockNum == self.blockNum:
+                    # The client resent the last block: our ACK was lost.
+                    # Resend it, and keep waiting for the next block.
+                    ackPkt = tftpmessages.Acknowledgement()
+                    ackPkt.blockNum = blockNum
+                    self.s.sendto(ackPkt.pack(), self.clientAddr)
                 else:
-                    # invalid block number. Abort
+                    # Out of sequence. Abort
                     errMsg = 'Incorrect block number ' + str(blockNum)
                     self.sendErrorPkt(tftpmessages.ERR_NOT_DEFINED, errMsg)
                     raise Exception(errMsg)
@@ -178,9 +244,21 @@ class WriteOperation(tftpoperation.TftpOperation):
                 fail = True
                 
         if complete:
-            self.addLogMsg('WRQ operation complete in %d blocks' % numBlocks)
+            self.logEvent(eventlog.WRITE_COMPLETE, numBlocks)
+            if self.metrics is not None:
+                self.metrics.transferDuration.observe(self.clock() - self.startTime)
+        else:
+            self.logEvent(eventlog.WRITE_FAILED)
+            
+    def writeBlocks(self, complete):
+        '''Write the blocks received to the file.'''
+        if self.decoder is None:
+            self.f.writelines(self.blocks)
         else:
-            self.addLogMsg('WRQ operation failed')
+            self.f.write(self.decoder.decode(''.join(self.blocks)))
+            if complete:
+                self.f.write(self.decoder.finish())
+        self.blocks = []
             
     def waitForData(self):
         '''Wait for a data packet to be received, and return it.
@@ -189,27 +267,31 @@ class WriteOperation(tftpoperation.TftpOperation):
         and continue to wait...
         '''
         pkt = None
-        count = 0
         while not pkt:
             data = None
             fromAddr = None
             try:
                 data, fromAddr = self.s.recvfrom(self.blockSize + 256)
             except socket.timeout:
-                # Timeout. try again.
-                count += 1
-                if count >= self.retries:
+                # Timeout. Resend the last ack packet if there are retries left.
+                if not self.responseTimeout():
                     # Give up
                     break
-                else:
-                    # Resend the last ack packet
-                    self.sendAckPkt(self.blockNum)
+                continue
+            
+            if len(data) == 0:
+                # Woken up by the timer wheel or an abort request.
+                if not self.responseTimeout():
+                    break
+                continue
                     
             incorrectSourcePort = ( fromAddr is not None and
                                   fromAddr[1] != self.clientAddr[1])
             if incorrectSourcePort:
                 # Incorrect source port (Transfer ID). Send an error packet back to this
                 # end point and continue with this transfer.
+                if self.metrics is not None:
+                    self.metrics.tidErrors.inc()
                 self.sendErrorPkt(tftpmessages.ERR_UNKNOWN_TID,'Invalid TID')
             elif data is not None:
 #                # Parse into a packet
@@ -223,6 +305,8 @@ class WriteOperation(tftpoperation.TftpOperation):
         
         if pkt is not None:
             if pkt.opcode == tftpmessages.OPCODE_DATA:
+                if self.timeline is not None:
+                    self.timeline.record(sampler.DATA, pkt.blockNum, len(pkt.dataBlock))
                 # Return this packet to the calling method
                 return pkt
             elif pkt.opcode == tftpmessages.OPCODE_ERR:
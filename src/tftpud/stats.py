@@ -0,0 +1,13 @@
+'''
+Summary statistics for the load generator, the benchmarks and trace replay.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+
+def percentile(values, fraction):
+    '''The value at the given fraction (0 to 1) of the values, in order, or
+    None if there are none. The values need not be sorted.'''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
@@ -7,52 +7,387 @@ All tftpud code licensed under the MIT License: http://mit-licence.org
 '''
 
 import threading
-from datetime import datetime
+import time
 
-class TftpOperation(threading.Thread):
+import pathmtu
+import eventlog
+
+# Event types posted to the server (see TftpOperation.postEvent)
+EVENT_COMPLETE = 2 # the operation has finished; data is None
+
+class TftpOperation(object):
     '''
     An abstract base class to represent a TFTP operation within the server.
+    The operation runs either in a thread of its own or, when the server has
+    one, on a worker thread from the server's pool.
     '''
 
     def __init__(self):
         '''
         Constructor
         '''
-        threading.Thread.__init__(self)
-        self.log = []
-        self.logMutex = threading.Lock()
-        
-    def addLogMsg(self, msg, timestamp = True, newLine = True, overwrite = False):
-        if timestamp:
-            msg = str(datetime.now()) + ': ' + msg
-            
-        with self.logMutex:
-            if overwrite:
-                # prepend a \r character
-                self.log.append('\r' + msg)
-            elif newLine or len(self.log) == 0:
-                self.log.append(msg)
-            else:
-                self.log[-1] += msg
+        self.thread = None
+        self.pool = None # a workerpool.WorkerPool, optional
+        self.started = False
+        self.done = threading.Event()
+        self.abortRequested = False
+        
+        # Log events (see tftpud.eventlog). The server's log replaces this
+        # one; without a server, processLogMessages() reads the events.
+        self.eventLog = eventlog.EventLog()
+        
+        # The server's event function, called as eventSink(op, eventType, data).
+        self.eventSink = None
+        self.port = None # the ephemeral port (the server's key for this operation)
+        
+        # Server metrics (see tftpud.server.metrics). Optional.
+        self.metrics = None
+        self.clock = time.time # the server's clock (simulated time in tftpud.server.netsim)
+        self.startTime = time.time() # when the request was received
+        
+        # Phase timings (see tftpud.server.profiling). Optional; the profile
+        # is None unless the transfer is being profiled.
+        self.profiler = None
+        self.profile = None
+        
+        # Packet timelines for the tail-latency sampler (see
+        # tftpud.server.sampler). Optional, like the profile.
+        self.sampler = None
+        self.timeline = None
+        
+        # Transfer scheduling (see tftpud.server.scheduler). Optional.
+        self.scheduler = None
+        self.schedTicket = None
+        
+        # Retransmission. Without a timer wheel the socket timeout is the
+        # retransmit timeout and the operation resends the packet itself.
+        # With a timer wheel the wheel resends the packet and wakes the
+        # operation when the retries are exhausted.
+        self.s = None
+        self.clientAddr = None
+        self.timeout = 3.0
+        self.retries = 3
+        self.timerWheel = None
+        self.timerLock = threading.Lock()
+        self.retransmitData = None
+        self.retransmitTimer = None
+        self.retransmitGeneration = 0
+        self.retransmitCount = 0
+        self.retransmitExpired = False
+        self.responseDeadline = 0
+        self.idleTimeout = None # seconds without progress before aborting
+        self.idleTimer = None
+        
+        # blksize negotiation (RFC 2348). With mtu None, the MTU of the route
+        # to the client is looked up.
+        self.mtu = None
+        self.minBlockSize = pathmtu.MIN_BLKSIZE
+        self.maxBlockSize = pathmtu.MAX_BLKSIZE
+        
+        # The range of timeout option values accepted (RFC 2349), and whether
+        # the tsize option is accepted.
+        self.minTimeout = 1
+        self.maxTimeout = 255
+        self.allowTsize = True
+        
+        # Option negotiation policy (see tftpud.server.policy). Optional.
+        self.policy = None
+        self.policyRule = None # the rule applied to this request
+        
+    def useServer(self, server):
+        '''Use the facilities of the given server (scheduler, timers, events).'''
+        self.scheduler = server.scheduler
+        self.timerWheel = server.timerWheel
+        self.idleTimeout = server.config.idleTimeout
+        self.eventSink = server.postEvent
+        self.eventLog = server.eventLog
+        self.metrics = server.metrics
+        self.clock = server.clock
+        self.startTime = server.clock()
+        self.profiler = server.profiler
+        self.sampler = server.sampler
+        self.pool = server.pool
+        self.mtu = server.config.mtu
+        self.minBlockSize = server.config.minBlockSize
+        self.policy = server.policy
+        
+    def postEvent(self, eventType, data = None):
+        if self.eventSink is not None:
+            self.eventSink(self, eventType, data)
+        
+    def logEvent(self, eventType, *fields):
+        '''Record a log event (one of the tftpud.eventlog types). The fields
+        are formatted later, and only if the log is read as text.'''
+        self.eventLog.log(eventType, *fields)
+        
+    def addLogMsg(self, msg):
+        '''Record a free text log message.'''
+        self.eventLog.log(eventlog.MESSAGE, msg)
         
     def processLogMessages(self, logFunc):
-        tmpLog = None
-        with self.logMutex:
-            tmpLog = self.log
-            self.log = []
+        '''Pass the text of the logged events to logFunc.'''
+        self.eventLog.drain(lambda ts, eventType, fields:
+                            logFunc(eventlog.formatEvent(ts, eventType, fields)))
+        
+    def start(self):
+        '''Run the operation: queue it on the worker pool, or start a thread.'''
+        self.started = True
+        if self.pool is not None:
+            self.pool.submit(self)
+        else:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.start()
+            
+    def join(self, timeout = None):
+        '''Wait for the operation to complete.'''
+        if self.started:
+            self.done.wait(timeout)
             
-        for msg in tmpLog:
-            logFunc(msg)
+    def is_alive(self):
+        return self.started and not self.done.is_set()
         
     def run(self):
         try:
+            if self.abortRequested:
+                # Aborted while waiting for a worker thread.
+                raise Exception('Operation aborted')
+            self.resetIdleTimer()
             self.runImpl()
         except Exception as e:
-            self.addLogMsg('Error: ' + str(e) )
+            self.logEvent(eventlog.OPERATION_ERROR, e)
+        finally:
+            if self.profile is not None:
+                self.profile.complete()
+            if self.timeline is not None:
+                self.timeline.complete()
+            if self.schedTicket is not None:
+                self.scheduler.unregister(self.schedTicket)
+                self.schedTicket = None
+            with self.timerLock:
+                self.cancelRetransmit()
+            if self.idleTimer is not None:
+                self.idleTimer.cancel()
+                self.idleTimer = None
+            self.postEvent(EVENT_COMPLETE)
+            self.done.set()
+            
+    def beginTransfer(self, kind):
+        '''Start the profile and the timeline of the transfer, if enabled.
+        kind - 'RRQ' or 'WRQ'.'''
+        if self.profiler is not None:
+            self.profile = self.profiler.newProfile(kind, self.fileName, self.clientAddr)
+        if self.sampler is not None:
+            self.timeline = self.sampler.newTimeline(kind, self.fileName, self.clientAddr)
+            
+    def waitForTurn(self, fileName, clientAddr):
+        '''Wait until the scheduler (if any) permits the next block to be sent.
+        Raises an exception if the operation is aborted while waiting.'''
+        if self.scheduler is None:
+            return
+        
+        if self.schedTicket is None:
+            self.schedTicket = self.scheduler.register(fileName, clientAddr)
+            
+        # Wait in short steps so that an abort request is noticed.
+        while not self.scheduler.waitTurn(self.schedTicket, 0.5):
+            if self.abortRequested:
+                raise Exception('Operation aborted')
             
     def runImpl(self):
         raise Exception('The runImpl method must be overridden')
         
+    def negotiateBlockSize(self, requested):
+        '''Return the block size to accept for a requested blksize option, or
+        None to decline the option. The block size is limited so that a DATA
+        packet fits in the MTU of the route to the client.'''
+        if requested < self.minBlockSize:
+            return None
+        
+        limit = self.maxBlockSize
+        reason = 'limit'
+        mtu = self.mtu
+        if mtu is None:
+            mtu = pathmtu.discoverMtu(self.clientAddr)
+        if mtu:
+            mtuLimit = max(self.minBlockSize,
+                           pathmtu.maxBlockSize(mtu, pathmtu.isIpv6(self.clientAddr)))
+            if mtuLimit < limit:
+                limit = mtuLimit
+                reason = 'MTU %d' % mtu
+            
+        if requested > limit:
+            self.logEvent(eventlog.BLKSIZE_REDUCED, requested, limit, reason)
+            return limit
+        return requested
+    
+    def applyPolicy(self, fileName, options):
+        '''Apply the option profile of the first policy rule matching this
+        request. Called before the options are processed.'''
+        if self.policy is None:
+            return
+        rule = self.policy.lookup(self.clientAddr, fileName, options)
+        if rule is None:
+            return
+        self.policyRule = rule
+        if rule.name:
+            self.logEvent(eventlog.POLICY_APPLIED, rule.name)
+        self.applyProfile(rule.profile)
+        
+    def applyProfile(self, profile):
+        '''Set the negotiation limits from a policy.OptionProfile.'''
+        if profile.minBlockSize is not None:
+            self.minBlockSize = profile.minBlockSize
+        if profile.maxBlockSize is not None:
+            self.maxBlockSize = profile.maxBlockSize
+        if profile.mtu is not None:
+            self.mtu = profile.mtu
+        if profile.minTimeout is not None:
+            self.minTimeout = profile.minTimeout
+        if profile.maxTimeout is not None:
+            self.maxTimeout = profile.maxTimeout
+        self.allowTsize = profile.tsize
+        
+    def setTimeout(self, secs):
+        '''Set the time to wait for a response before retransmitting.'''
+        self.timeout = secs
+        if self.timerWheel is None:
+            self.s.settimeout(secs)
+        else:
+            # The wheel wakes the operation when the retries run out. The
+            # socket timeout is only a backstop.
+            self.s.settimeout(secs * (self.retries + 2))
+            
+    def sendReliably(self, data):
+        '''Send a packet (or a list of packets, e.g. a window of data blocks)
+        to the client that expects a response. It is retransmitted until
+        responseReceived() is called.'''
+        if isinstance(data, str):
+            data = [data]
+        with self.timerLock:
+            self.cancelRetransmit()
+            self.retransmitData = data
+            self.retransmitCount = 0
+            self.retransmitExpired = False
+            self.responseDeadline = self.clock() + self.timeout * (self.retries + 1)
+            if self.timeline is not None:
+                for packet in data:
+                    self.timeline.recordSend(packet)
+            self.resend()
+            if self.timerWheel is not None:
+                self.retransmitTimer = self.timerWheel.schedule(self.timeout,
+                                                                self.onRetransmitTimer,
+                                                                self.retransmitGeneration)
+                
+    def responseReceived(self):
+        '''The response to the packet last sent with sendReliably() has arrived.'''
+        with self.timerLock:
+            self.cancelRetransmit()
+            self.retransmitData = None
+        self.resetIdleTimer()
+        
+    def responseTimeout(self):
+        '''No response arrived while waiting on the socket.
+        Return True to continue waiting (the packet may have been resent), or
+        False if the retries are exhausted.'''
+        if self.abortRequested:
+            return False
+        
+        if self.timerWheel is None:
+            self.retransmitCount += 1
+            if self.retransmitCount <= self.retries and self.retransmitData is not None:
+                if self.timeline is not None:
+                    self.timeline.recordTimeout(self.retransmitCount, len(self.retransmitData))
+                self.resend()
+                self.onRetransmit()
+                return True
+            if self.timeline is not None:
+                self.timeline.recordTimeout(self.retransmitCount, 0)
+            return False
+        
+        with self.timerLock:
+            if self.retransmitExpired:
+                return False
+        # Woken early (e.g. a spurious wakeup); keep waiting unless the
+        # timer wheel has failed to fire.
+        return self.clock() < self.responseDeadline
+        
+    def fastRetransmit(self):
+        '''Resend the pending packet now, without waiting for the timeout and
+        without using up a retry. The retransmit timer restarts.'''
+        with self.timerLock:
+            if self.retransmitData is None:
+                return
+            if self.timeline is not None:
+                self.timeline.recordFastRetransmit(len(self.retransmitData))
+            self.resend()
+            if self.retransmitTimer is not None:
+                self.retransmitTimer.cancel()
+                self.retransmitTimer = self.timerWheel.schedule(self.timeout,
+                                                                self.onRetransmitTimer,
+                                                                self.retransmitGeneration)
+        
+    def resend(self):
+        # Called with timerLock held.
+        for data in self.retransmitData:
+            self.s.sendto(data, self.clientAddr)
+            
+    def onRetransmit(self):
+        '''Called each time the pending packets are resent after a timeout.
+        May be overridden, e.g. to keep statistics.'''
+        pass
+        
+    def cancelRetransmit(self):
+        # Called with timerLock held.
+        self.retransmitGeneration += 1
+        if self.retransmitTimer is not None:
+            self.retransmitTimer.cancel()
+            self.retransmitTimer = None
+            
+    def onRetransmitTimer(self, generation):
+        '''Timer wheel callback: resend the pending packet.'''
+        with self.timerLock:
+            if generation != self.retransmitGeneration or self.retransmitData is None:
+                # A response arrived while the timer fired.
+                return
+            self.retransmitCount += 1
+            resent = self.retransmitCount <= self.retries
+            if self.timeline is not None:
+                self.timeline.recordTimeout(self.retransmitCount,
+                                            len(self.retransmitData) if resent else 0)
+            if resent:
+                self.resend()
+                self.retransmitTimer = self.timerWheel.schedule(self.timeout,
+                                                                self.onRetransmitTimer,
+                                                                generation)
+            else:
+                self.retransmitTimer = None
+                self.retransmitExpired = True
+        if resent:
+            self.onRetransmit()
+        else:
+            self.wakeup()
+        
+    def resetIdleTimer(self):
+        '''Restart the idle timer. Called whenever the transfer makes progress.'''
+        if self.timerWheel is None or not self.idleTimeout:
+            return
+        if self.idleTimer is not None:
+            self.idleTimer.cancel()
+        self.idleTimer = self.timerWheel.schedule(self.idleTimeout, self.onIdleTimer)
+        
+    def onIdleTimer(self):
+        self.logEvent(eventlog.IDLE_ABORT, self.idleTimeout)
+        self.abortRequested = True
+        self.wakeup()
+        
+    def wakeup(self):
+        '''Wake the operation thread if it is blocked on the socket, by sending
+        an empty datagram to the operation's own socket.'''
+        try:
+            self.s.sendto('', self.s.getsockname())
+        except:
+            pass
+        
     def abort(self, block=True):
         '''A virtual method used to abort this current operation. Must be overridden
         by the concrete class.'''
@@ -0,0 +1,218 @@
+'''
+A hierarchical hashed timer wheel.
+
+Timers are held in slots of a set of wheels. The first wheel has one slot per
+tick (one millisecond by default), each further wheel has slots spanning a whole
+revolution of the wheel below it. Scheduling and cancelling a timer are O(1);
+timers on the outer wheels are cascaded inwards as their time approaches.
+
+The wheel can be driven by its own thread (start/stop) or by calling advance()
+directly, e.g. from a simulation with a virtual clock.
+
+All tftpud code licensed under the MIT License: http://mit-licence.org
+'''
+import threading
+import time
+import math
+
+class Timer:
+    '''A single scheduled callback. Use cancel() to stop it firing.'''
+
+    def __init__(self, wheel, expiryTick, callback, args):
+        self.wheel = wheel
+        self.expiryTick = expiryTick
+        self.callback = callback
+        self.args = args
+        self.slot = None # the set currently holding this timer
+        self.level = 0
+        self.cancelled = False
+
+    def cancel(self):
+        self.wheel.cancel(self)
+
+    def pending(self):
+        return self.slot is not None
+
+class TimerWheel:
+    '''
+    A timer service shared by many TFTP operations.
+    '''
+
+    def __init__(self, tickMs = 1, slotsPerLevel = 256, levels = 4, clock = time.time):
+        '''
+        tickMs - the timer resolution in milliseconds.
+        slotsPerLevel - the number of slots in each wheel. Must be a power of 2.
+        levels - the number of wheels. Timers further in the future than the
+                 outer wheel covers are parked in its last slot until they come
+                 into range.
+        clock - a function returning the current time in seconds.
+        '''
+        if slotsPerLevel & (slotsPerLevel - 1):
+            raise Exception('slotsPerLevel must be a power of 2')
+        self.tickMs = tickMs
+        self.clock = clock
+        self.bits = slotsPerLevel.bit_length() - 1
+        self.mask = slotsPerLevel - 1
+        self.levels = levels
+        self.wheels = [[set() for i in range(0, slotsPerLevel)] for l in range(0, levels)]
+        self.counts = [0] * levels # number of timers on each wheel
+        self.currentTick = self.timeToTick(clock())
+
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopThread = False
+        self.sleeping = False # True while the wheel thread is waiting
+        self.sleepUntilTick = None # None means wait until a timer is scheduled
+
+    def __len__(self):
+        with self.cond:
+            return sum(self.counts)
+
+    def timeToTick(self, t):
+        return int(t * 1000) // self.tickMs
+
+    def schedule(self, delay, callback, *args):
+        '''Call callback(*args) after delay seconds. Returns the Timer.'''
+        with self.cond:
+            # Round the expiry time up to a tick so that a timer never fires
+            # early. (The rounding to a nanosecond absorbs the error of the
+            # floating point sum.)
+            expiryMs = round((self.clock() + delay) * 1000, 6)
+            timer = Timer(self, int(math.ceil(expiryMs / self.tickMs)), callback, args)
+            if timer.expiryTick <= self.currentTick:
+                timer.expiryTick = self.currentTick + 1
+            self.insert(timer)
+            if self.sleeping and (self.sleepUntilTick is None or
+                                  timer.expiryTick < self.sleepUntilTick):
+                # Wake the wheel thread to shorten its sleep.
+                self.cond.notify()
+        return timer
+
+    def cancel(self, timer):
+        '''Cancel a timer. Does nothing if it has already fired.'''
+        with self.cond:
+            timer.cancelled = True
+            self.remove(timer)
+
+    def insert(self, timer):
+        delta = timer.expiryTick - self.currentTick
+        level = 0
+        while level < self.levels - 1 and delta >= (1 << (self.bits * (level + 1))):
+            level += 1
+        if delta >= (1 << (self.bits * self.levels)):
+            # Beyond the range of the outer wheel. Park in the slot that is
+            # cascaded last; it will be reinserted from there.
+            index = ((self.currentTick >> (self.bits * level)) - 1) & self.mask
+        else:
+            index = (timer.expiryTick >> (self.bits * level)) & self.mask
+        timer.slot = self.wheels[level][index]
+        timer.level = level
+        timer.slot.add(timer)
+        self.counts[level] += 1
+
+    def remove(self, timer):
+        if timer.slot is not None:
+            timer.slot.discard(timer)
+            self.counts[timer.level] -= 1
+            timer.slot = None
+
+    def cascade(self, level):
+        '''Move the timers in the current slot of the given wheel inwards.'''
+        index = (self.currentTick >> (self.bits * level)) & self.mask
+        slot = self.wheels[level][index]
+        if len(slot) > 0:
+            self.wheels[level][index] = set()
+            self.counts[level] -= len(slot)
+            for timer in slot:
+                self.insert(timer)
+
+    def advance(self, now = None):
+        '''Process all ticks up to the given time (seconds, default: now),
+        calling the callbacks of expired timers. Returns the number fired.'''
+        if now is None:
+            now = self.clock()
+        targetTick = self.timeToTick(now)
+        fired = 0
+        while True:
+            expired = []
+            with self.cond:
+                if self.currentTick >= targetTick:
+                    break
+                if sum(self.counts) == 0:
+                    # Nothing to do. Jump straight to the target.
+                    self.currentTick = targetTick
+                    break
+                if self.counts[0] == 0 and (self.currentTick & self.mask) != self.mask:
+                    # Nothing on the inner wheel: skip to the next cascade.
+                    nextCascade = (self.currentTick | self.mask)
+                    self.currentTick = min(nextCascade, targetTick)
+                    continue
+
+                self.currentTick += 1
+                if (self.currentTick & self.mask) == 0:
+                    level = 1
+                    while level < self.levels:
+                        self.cascade(level)
+                        if (self.currentTick >> (self.bits * level)) & self.mask:
+                            break
+                        level += 1
+
+                index = self.currentTick & self.mask
+                slot = self.wheels[0][index]
+                if len(slot) > 0:
+                    self.wheels[0][index] = set()
+                    self.counts[0] -= len(slot)
+                    for timer in slot:
+                        timer.slot = None
+                        expired.append(timer)
+
+            # Fire the callbacks outside the lock, as they may schedule more.
+            for timer in expired:
+                if not timer.cancelled:
+                    fired += 1
+                    timer.callback(*timer.args)
+        return fired
+
+    def nextExpiryTick(self):
+        '''Return the tick at which the wheel next has work to do, or None.'''
+        if sum(self.counts) == 0:
+            return None
+        if self.counts[0] > 0:
+            for i in range(1, self.mask + 2):
+                if len(self.wheels[0][(self.currentTick + i) & self.mask]) > 0:
+                    return self.currentTick + i
+        # The next cascade from the outer wheels.
+        return (self.currentTick | self.mask) + 1
+
+    def start(self):
+        '''Run the wheel in its own (daemon) thread.'''
+        self.stopThread = False
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.stopThread = True
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        while True:
+            with self.cond:
+                if self.stopThread:
+                    break
+                self.sleepUntilTick = self.nextExpiryTick()
+                self.sleeping = True
+                if self.sleepUntilTick is None:
+                    self.cond.wait()
+                else:
+                    delay = (self.sleepUntilTick * self.tickMs) / 1000.0 - self.clock()
+                    if delay > 0:
+                        self.cond.wait(delay)
+                self.sleeping = False
+                if self.stopThread:
+                    break
+            self.advance()